@@ -1,5 +1,9 @@
-from djitellopy import Tello
 import time
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from tellolib.tello import Tello
 
 # --- パラメータ設定 ---
 # 1つのカーブで進む前後の距離 (cm)
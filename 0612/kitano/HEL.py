@@ -1,88 +1,78 @@
-import socket
-import time
+import asyncio
+import os
+import sys
 
-TELLO_IP = '192.168.10.1'
-TELLO_PORT = 8889
-tello_address = (TELLO_IP, TELLO_PORT)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from tellolib.command import CommandChannel
+from tellolib.planner import optimize_commands, print_report
 
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.settimeout(5)
+# True なら経路コンパイラで回転を go に置き換えてから飛ぶ
+OPTIMIZE = True
 
-def send_command(command, wait=5):
-    try:
-        sock.sendto(command.encode('utf-8'), tello_address)
-        print(f"[SEND] {command}")
-        response, _ = sock.recvfrom(1024)
-        decoded = response.decode('utf-8')
-        print(f"[RECV] {decoded}")
-        if decoded == "error":
-            print(f"[WARN] コマンド '{command}' に対して error が返されました")
-        time.sleep(wait)
-    except socket.timeout:
-        print(f"[TIMEOUT] {command} の応答なし")
-    except Exception as e:
-        print(f"[ERROR] {command} の送信エラー: {e}")
-
-def draw_h():
-    print("[DRAW] H")
-    send_command("back 60")
-    send_command("forward 30")
-    send_command("cw 90")
-    send_command("forward 40")  # 横棒
-    send_command("back 20")     # 真ん中に戻す
-    send_command("ccw 90")
-    send_command("forward 30")
+DRAW_H = [
+    "back 60",
+    "forward 30",
+    "cw 90",
+    "forward 40",  # 横棒
+    "back 20",     # 真ん中に戻す
+    "ccw 90",
+    "forward 30",
     # 向きを初期（北）に戻す必要なし（そのまま）
+]
 
-def draw_e():
-    print("[DRAW] E")
-    send_command("back 60")
-    send_command("cw 90")
-    send_command("forward 40")  # 上横棒
-    send_command("back 40")
-    send_command("ccw 90")
-    send_command("forward 30")
-    send_command("cw 90")
-    send_command("forward 40")  # 中横棒
-    send_command("back 40")
-    send_command("ccw 90")
-    send_command("forward 30")
-    send_command("cw 90")
-    send_command("forward 40")  # 下横棒
-    send_command("back 40")
-    send_command("ccw 90")      # 向きを戻す（初期状態）
+DRAW_E = [
+    "back 60",
+    "cw 90",
+    "forward 40",  # 上横棒
+    "back 40",
+    "ccw 90",
+    "forward 30",
+    "cw 90",
+    "forward 40",  # 中横棒
+    "back 40",
+    "ccw 90",
+    "forward 30",
+    "cw 90",
+    "forward 40",  # 下横棒
+    "back 40",
+    "ccw 90",      # 向きを戻す（初期状態）
+]
 
-def draw_l():
-    print("[DRAW] L")
-    send_command("back 60")
-    send_command("forward 60")  # 下縦棒（向きそのまま）
-    send_command("cw 90")
-    send_command("forward 40")  # 横棒
-    send_command("back 40")
-    send_command("ccw 90")      # 向きを戻す（初期状態）
+DRAW_L = [
+    "back 60",
+    "forward 60",  # 下縦棒（向きそのまま）
+    "cw 90",
+    "forward 40",  # 横棒
+    "back 40",
+    "ccw 90",      # 向きを戻す（初期状態）
+]
 
-def move_to_next_letter():
-    # 横に移動して向きを戻す
-    send_command("cw 90")       # 右向き
-    send_command("forward 80")
-    send_command("ccw 90")      # 前向き（北）へ戻す
+# 横に移動して向きを戻す
+MOVE_TO_NEXT_LETTER = [
+    "cw 90",       # 右向き
+    "forward 80",
+    "ccw 90",      # 前向き（北）へ戻す
+]
 
-def main():
+async def main():
     print("Tello: HEL飛行開始")
 
-    send_command("command", wait=2)
-    send_command("takeoff", wait=7)
-    send_command("up 100", wait=3)
+    commands = (["up 100"] + DRAW_H + MOVE_TO_NEXT_LETTER + DRAW_E + MOVE_TO_NEXT_LETTER + DRAW_L)
+    if OPTIMIZE:
+        optimized = optimize_commands(commands)
+        print_report(commands, optimized)
+        commands = optimized
+
+    async with CommandChannel() as tello:
+        await tello.send("command")
+        await tello.send("takeoff")
 
-    draw_h()
-    move_to_next_letter()
-    draw_e()
-    move_to_next_letter()
-    draw_l()
+        for command in commands:
+            await tello.send(command)
 
-    send_command("land", wait=5)
-    sock.close()
+        await tello.send("land")
+        tello.print_summary()
     print("Tello: HEL飛行完了")
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -1,6 +1,10 @@
-from djitellopy import Tello
 import cv2
 import time
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from tellolib.tello import Tello
 
 tello = Tello()
 tello.connect()
@@ -1,7 +1,10 @@
 import time
 import cv2
 import os
-from djitellopy import Tello
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from tellolib.tello import Tello
 
 # --- 設定項目 ---
 # 写真を保存するフォルダ名
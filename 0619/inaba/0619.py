@@ -1,49 +1,81 @@
-from djitellopy import Tello
 import cv2
 import time
 import os
-
-def take_picture(numbers):
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from tellolib.altitude import AltitudeController
+from tellolib.panorama.batch import PanoramaBatch
+from tellolib.panorama.capture import FrameRing, FrameWriter
+from tellolib.panorama.sweep import YawSweep
+from tellolib.quality import FrameSelector
+from tellolib.settle import SettleTrigger
+from tellolib.tello import Tello
+
+def take_picture(numbers, batch=None, writer=None, sweep=False):
     num_images = 12
     output_filename_prefix = "panorama"
     image_dir = "C:/Users/takashi/Documents/tello/0619/images"
-    time.sleep(5)
 
     print(f"番号 {numbers}m のパノラマ画像を撮影開始")
 
     degree = 360 / num_images
-    captured_images = []
-
-    for i in range(num_images):
-        #画像をキャプチャ
-        frame = frame_read.frame
+    # 画像はメモリ上に置いたまま合成に使い、ファイルへの保存は writer のスレッドが裏で行う
+    # （writer は呼び出し側で1つ作って閉じる。省略した場合はファイルに保存しない）
+    ring = FrameRing(num_images, writer=writer)
+    yaws = []  # 各フレームを撮ったときの向き（撮れなかった向きは飛ばすので、番号 × degree とは限らない）
+
+    if sweep:
+        # 30度ごとに止まって撮る代わりに、rc で回し続けながら映像から等間隔の向きのフレームを選ぶ
+        sweeper = YawSweep(frame_read, tello.get_current_state, tello.send_rc_control, shots=num_images)
+        for i, shot in enumerate(sweeper.capture()):
+            img_path = os.path.join(image_dir, f"{output_filename_prefix}_H{numbers}_{i:02d}.jpg")
+            ring.push(shot.frame, path=img_path)
+            yaws.append(shot.yaw)
+        print(f"番号 {numbers}m のパノラマ画像撮影完了")
+        sweeper.print_stats()
+    else:
+        # 決め打ちで5秒待たずに、映像と姿勢が落ち着いたらすぐ撮影する（最大5秒）
+        # 直近の5枚からブレが少なく、前の画像と重なりのある1枚を選ぶ
+        trigger = SettleTrigger(frame_read, attitude=tello.get_current_state, timeout=5, selector=FrameSelector(n=5))
+        yaw = 0.0
+        for i in range(num_images):
+            #画像をキャプチャ（機体が落ち着くまで待つ）
+            frame = trigger.wait(since=tello.last_command_time)
+
+            if frame is None:
+                print("フレームが取得できませんでした。")
+                continue
+
+            img_path = os.path.join(image_dir, f"{output_filename_prefix}_H{numbers}_{i:02d}.jpg")
+            ring.push(frame, path=img_path)
+            yaws.append(yaw)
+            print(f"画像を保存します: {img_path}")
+
+            if i < num_images - 1:
+                print(f"{degree}度回転します")
+                tello.rotate_clockwise(degree)
+                yaw += degree
+
+        print(f"番号 {numbers}m のパノラマ画像撮影完了")
+        trigger.print_stats()
+        trigger.selector.print_stats()
 
-        if frame is None:
-            print("フレームが取得できませんでした。")
-            continue
+    output_path = f"{output_filename_prefix}_H{numbers}_panorama.jpg"
 
-        img_path = os.path.join(image_dir, f"{output_filename_prefix}_H{numbers}_{i:02d}.jpg")
-        cv2.imwrite(img_path, frame)
-        captured_images.append(img_path)
-        print(f"画像を保存しました: {img_path}")
+    # 合成を別プロセスに任せて、すぐ次の高さへ向かう
+    if batch is not None:
+        options = {"yaws_deg": yaws} if batch.mode in ("yaw", "stream") else {}
+        batch.submit(f"{numbers}m", ring.frames(copy=True), output_path, **options)
+        return
 
-        if i < num_images - 1:
-            print(f"{degree}度回転します")
-            tello.rotate_clockwise(degree)
-            time.sleep(5)
+    stitch_panorama(numbers, ring.frames(), output_path)
 
-    print(f"番号 {numbers}m のパノラマ画像撮影完了")
 
+def stitch_panorama(numbers, images_to_stitch, output_path):
+    # 撮影した画像をその場で合成して保存する（ベンチマークからも呼ぶ）
     stitcher = cv2.Stitcher_create()
 
-    images_to_stitch = []
-    for img_path in captured_images:
-        img = cv2.imread(img_path)
-        if img is not None:
-            images_to_stitch.append(img)
-        else:
-            print(f"画像の読み込みに失敗しました: {img_path}")
-
     if not images_to_stitch:
         print("スティッチングできる画像がありません。")
         return
@@ -51,7 +83,6 @@ def take_picture(numbers):
     # スティッチング処理の実行
     status, panorama = stitcher.stitch(images_to_stitch)
 
-    output_path = f"{output_filename_prefix}_H{numbers}_panorama.jpg"
     if status == cv2.Stitcher.OK:
         cv2.imwrite(output_path, panorama)
         print(f"パノラマ画像を保存しました: {output_path}")
@@ -68,37 +99,50 @@ def take_picture(numbers):
             print("  カメラパラメータの調整に失敗しました。")
 
 
-tello= Tello()
-tello.connect()
+if __name__ == "__main__":
+    # 各高さのパノラマ合成は飛行中に別プロセスで進める
+    # （ワーカーがこのファイルを読み込み直しても飛行しないよう、ここから下は __main__ の中に置く）
+    batch = PanoramaBatch(mode="opencv")
+    # 全ての高さの画像の保存をこの1つのスレッドにまとめ、最後に閉じる（残りの保存が終わるまで待つ）
+    writer = FrameWriter()
 
-tello.takeoff()
+    tello= Tello()
+    tello.connect()
 
-tello.streamon()
-time.sleep(5)
-frame_read = tello.get_frame_read()
+    tello.takeoff()
 
-#2m上昇
-tello.move_up(200)
-#2m地点
-take_picture(2)
+    tello.streamon()
+    time.sleep(5)
+    frame_read = tello.get_frame_read()
 
-tello.move_up(100)
+    # 相対の move_up を重ねると誤差が積み重なるので、状態パケットの高さを見ながら rc で各地点の高さに合わせる
+    altitude = AltitudeController(tello.send_rc_control, tello.get_current_state)
 
-#3m地点
-take_picture(3)
+    #2m地点
+    altitude.hold(200)
+    take_picture(2, batch, writer)
 
-tello.move_up(100)
+    #3m地点
+    altitude.hold(300)
+    take_picture(3, batch, writer)
 
-#4m地点
-take_picture(4)
+    #4m地点
+    altitude.hold(400)
+    take_picture(4, batch, writer)
 
-tello.move_up(100)
+    #5m地点
+    altitude.hold(500)
+    take_picture(5, batch, writer)
 
-#5m地点
-take_picture(5)
+    # 決め打ちの move_down(500)（SDK の上限いっぱい）の代わりに、着陸の手前の高さまで rc で下降する
+    altitude.hold(100)
 
-tello.move_down(500)
+    tello.streamoff()
 
-tello.streamonoff()
+    tello.land()
+    altitude.print_stats()
 
-tello.land()
+    # 飛行中に投入した合成の結果をまとめて受け取る
+    batch.print_results()
+    batch.close()
+    writer.close()
@@ -1,7 +1,20 @@
-from djitellopy import Tello
 import cv2
 import time
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from tellolib.altitude import AltitudeController
+from tellolib.panorama.batch import PanoramaBatch
+from tellolib.panorama.stream import StreamingStitcher
+from tellolib.panorama.sweep import YawSweep
+from tellolib.panorama.tiled import stack_panoramas
+from tellolib.panorama.capture import FrameRing, FrameWriter
+from tellolib.quality import FrameSelector
+from tellolib.scheduler import CaptureScheduler, CaptureSet, EnergyModel
+from tellolib.settle import SettleTrigger
+from tellolib.telemetry import TelemetryRecorder
+from tellolib.tello import Tello
 
 def check_tello_battery(tello):
     """
@@ -38,7 +51,7 @@ def tello_takeoff(tello):
     time.sleep(5)  # 安定するまで待機
     print("離陸しました。")
 
-def capture_360_panorama_at_height(tello, target_height_cm, num_images=12, delay_between_shots=2, output_filename_prefix="panorama", image_dir_base="panorama_images"):
+def capture_360_panorama_at_height(tello, target_height_cm, num_images=12, delay_between_shots=2, output_filename_prefix="panorama", image_dir_base="panorama_images", streaming=True, batch=None, writer=None, altitude=None, sweep=False):
     """
     指定された高さでTelloドローンを使用して360度パノラマ画像を撮影し、スティッチングします。
 
@@ -46,9 +59,19 @@ def capture_360_panorama_at_height(tello, target_height_cm, num_images=12, delay
         tello (Tello): 初期化されたTelloオブジェクト。
         target_height_cm (int): パノラマを撮影する目標の高さ（cm）。
         num_images (int): 360度を撮影するために必要な画像の枚数。
-        delay_between_shots (int): 各画像撮影間の待機時間（秒）。
+        delay_between_shots (int): 各画像の撮影前に機体が落ち着くのを待つ最大時間（秒）。落ち着けばすぐに撮影する。
         output_filename_prefix (str): 生成されるパノラマ画像のファイル名プレフィックス（例: "panorama_2m"）。
         image_dir_base (str): 撮影した画像を一時的に保存するベースディレクトリ名。
+        streaming (bool): True なら撮影しながら1枚ずつ合成し（StreamingStitcher）、
+            撮影完了と同時にパノラマを得る。位置合わせに失敗したフレームが多い場合は従来の cv2.Stitcher で合成する。
+        batch (PanoramaBatch): 指定すると、撮影中の合成が使えなかったときの合成を別プロセスに任せてすぐに戻る
+            （結果は batch.results() で受け取る）。
+        writer (FrameWriter): 撮影した画像を保存するスレッド。省略時はこの関数の中で作る。
+            画像はメモリ上のまま合成に使い、ファイルへの保存は裏で行う。
+        altitude (AltitudeController): 高さを合わせる制御。省略時はこの関数の中で作る。
+            高さごとの収束までの時間は altitude.print_stats() で表示できる。
+        sweep (bool): True なら止まらずに一定の速さで1周回しながら、映像から等間隔の向きのフレームを選ぶ（YawSweep）。
+            1周が15秒ほどで済む（止まって撮ると1分ほどかかる）。
     """
     # 現在のスクリプトのディレクトリを取得し、その中に画像ディレクトリを作成
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -58,39 +81,12 @@ def capture_360_panorama_at_height(tello, target_height_cm, num_images=12, delay
         os.makedirs(image_dir)
 
     print(f"\n高さ {target_height_cm / 100:.1f}m へ移動します...")
-    # tello.go_xyz_speedは非推奨になる可能性があります。
-    # 代わりに tello.move_up(), tello.move_down() などを組み合わせて使うことを検討してください。
-    # 簡単な高さ移動であれば tello.move_up(target_height_cm) などで十分かもしれません。
-    # ただし、go_xyz_speed は x, y, z の相対移動なので、現在位置からの移動になります。
-    # ターゲットの絶対高さを目指す場合は、tello.get_height() で現在の高さを取得し、差分を計算して移動させる必要があります。
-    # この例では、相対的な高さ移動としてそのまま go_xyz_speed を使用します。
-    # また、go_xyz_speed のZ軸は 'up' が正方向です。
-
-    # 現在の高さに調整するため、いったん上昇（または下降）指示
-    # Telloの高度計はあまり精密ではないため、go_xyz_speed(0, 0, target_height_cm, speed)は現在の高度からtarget_height_cmだけ移動します。
-    # もし絶対的な高さに到達させたい場合は、Tello SDKの制約上、ループで高度をチェックしながら細かく調整する必要があります。
-    # 今回は 'target_height_cm' を現在の高さからの「上昇量」として扱います。
-    # あるいは、最初のtakeoff後に一回だけgo_xyz_speedで目標高度まで移動し、その後は水平移動と回転のみを行う設計も考えられます。
-    # 例: tello.move_up(target_height_cm)
-
-    # ここでは、単純に 'target_height_cm' まで到達するように調整します（ただし、これは相対的な移動になります）
-    # より確実な方法としては、TelloSDKの `get_height()` を利用して、現在の高さと目標の高さの差分を計算し、
-    # `tello.move_up()` または `tello.move_down()` を使うのが良いでしょう。
-
-    current_height = tello.get_height() # cm
-    height_to_move = target_height_cm - current_height
-
-    if height_to_move > 0:
-        print(f"  現在の高さ {current_height}cm から {height_to_move}cm 上昇します。")
-        tello.move_up(height_to_move)
-    elif height_to_move < 0:
-        print(f"  現在の高さ {current_height}cm から {-height_to_move}cm 下降します。")
-        tello.move_down(-height_to_move)
-    else:
-        print(f"  すでに目標の高さ {target_height_cm}cm です。")
-
-    time.sleep(5) # 移動と安定を待機
-    print(f"  現在の高さ (推定): {tello.get_height()}cm") # 移動後の推定高さ
+    # 差を1回だけ move_up / move_down して5秒待つ代わりに、状態パケットの高さを見ながら rc で目標の高さに合わせ、
+    # 目標に入って落ち着いたらすぐ撮影に移る（高さの誤差が高さごとに積み重ならない）
+    if altitude is None:
+        altitude = AltitudeController(tello.send_rc_control, tello.get_current_state)
+    altitude.hold(target_height_cm)
+    print(f"  現在の高さ (推定): {tello.get_height()}cm") # 移動後の推定高さ
 
     tello.streamon()
     frame_read = tello.get_frame_read()
@@ -99,30 +95,74 @@ def capture_360_panorama_at_height(tello, target_height_cm, num_images=12, delay
 
     # 各画像間の回転角度を計算
     degrees_per_shot = 360 / num_images
-    captured_images = []
-
-    for i in range(num_images):
-        print(f"  画像 {i+1}/{num_images} を撮影中...")
-
-        # 画像をキャプチャ
-        frame = frame_read.frame
-        if frame is None:
-            print("  フレームの取得に失敗しました。スキップします。")
-            continue
+    # フレームはメモリ上のリングバッファに置いて、そのまま合成に使う
+    if writer is None:
+        writer = FrameWriter()
+    ring = FrameRing(num_images, writer=writer)
+    # 回転後は決め打ちで待たず、映像と姿勢が落ち着いたらすぐ撮影する
+    # （直近の5枚からブレが少なく、前の画像と重なりのある1枚を選ぶ）
+    trigger = SettleTrigger(frame_read, attitude=tello.get_current_state, timeout=delay_between_shots,
+                            selector=FrameSelector(n=5))
+    stitcher = StreamingStitcher(expected_step_deg=int(degrees_per_shot)) if streaming else None
+
+    if sweep:
+        # 30度ごとに止まって撮る代わりに、rc で回し続けながら映像から 360 / num_images 度おきのフレームを選ぶ
+        sweeper = YawSweep(frame_read, tello.get_current_state, tello.send_rc_control, shots=num_images)
+        shots = sweeper.capture()
+        for i, shot in enumerate(shots):
+            img_path = os.path.join(image_dir, f"{output_filename_prefix}_H{target_height_cm}_{i:02d}.jpg")
+            frame = ring.push(shot.frame, path=img_path)  # 保存は裏のスレッドで行う
+            if stitcher is not None:
+                stitcher.add(frame, yaw_deg=shot.yaw)
+        # 選んだフレームの向きはテレメトリから分かっているので、yaw の合成にそのまま使う
+        yaws = [shot.yaw for shot in shots]
+        print(f"高さ {target_height_cm / 100:.1f}m での全ての画像の撮影が完了しました。")
+        sweeper.print_stats()
+    else:
+        # 撮れなかったときは回転もしないので、撮れた枚数 × degrees_per_shot が各フレームの向きになる
+        yaws = []
+        for i in range(num_images):
+            print(f"  画像 {i+1}/{num_images} を撮影中...")
+
+            # 画像をキャプチャ（機体が落ち着くまで待つ）
+            frame = trigger.wait(since=tello.last_command_time)
+            if frame is None:
+                print("  フレームの取得に失敗しました。スキップします。")
+                continue
+
+            # ファイル名に高さと画像番号を含める
+            img_path = os.path.join(image_dir, f"{output_filename_prefix}_H{target_height_cm}_{i:02d}.jpg")
+            frame = ring.push(frame, path=img_path)  # 保存は裏のスレッドで行う
+            print(f"  画像を保存します: {img_path}")
+            yaws.append(len(yaws) * degrees_per_shot)
+            if stitcher is not None:
+                stitcher.add(frame)  # 次の回転の前にここで合成しておく（撮影後にまとめて合成する時間がなくなる）
+
+            # 次の画像のための回転
+            if i < num_images - 1:
+                tello.rotate_clockwise(int(degrees_per_shot))
+
+        print(f"高さ {target_height_cm / 100:.1f}m での全ての画像の撮影が完了しました。")
+        trigger.print_stats()
+        trigger.selector.print_stats()
+    tello.streamoff()
 
-        # ファイル名に高さと画像番号を含める
-        img_path = os.path.join(image_dir, f"{output_filename_prefix}_H{target_height_cm}_{i:02d}.jpg")
-        cv2.imwrite(img_path, frame)
-        captured_images.append(img_path)
-        print(f"  画像を保存しました: {img_path}")
+    output_path = os.path.join(script_dir, f"{output_filename_prefix}_H{target_height_cm}_panorama.jpg")
 
-        # 次の画像のための回転
-        if i < num_images - 1:
-            tello.rotate_clockwise(int(degrees_per_shot))
-            time.sleep(delay_between_shots) # ドローンが安定するまで待機
+    # 撮影中に合成したパノラマがあればそれを使う
+    if stitcher is not None and stitcher.reliable():
+        panorama = stitcher.panorama(full_circle=True)
+        cv2.imwrite(output_path, panorama)
+        print(f"  高さ {target_height_cm / 100:.1f}m のパノラマ画像を保存しました: {output_path}")
+        cv2.imshow(f"360 Panorama at {target_height_cm / 100:.1f}m", panorama)
+        cv2.waitKey(1)
+        return
 
-    print(f"高さ {target_height_cm / 100:.1f}m での全ての画像の撮影が完了しました。")
-    tello.streamoff()
+    # 撮影中の合成が使えなければ、合成を別プロセスに任せて、機体はすぐ次の高さへ向かう
+    if batch is not None:
+        options = {"yaws_deg": yaws} if batch.mode in ("yaw", "stream") else {}
+        batch.submit(f"{target_height_cm / 100:.1f}m", ring.frames(copy=True), output_path, **options)
+        return
 
     # 画像のスティッチング
     print(f"  高さ {target_height_cm / 100:.1f}m での画像のスティッチングを開始します...")
@@ -131,13 +171,8 @@ def capture_360_panorama_at_height(tello, target_height_cm, num_images=12, delay
     # シンプルに cv2.Stitcher_create() でもパノラマスティッチングが可能です。
     stitcher = cv2.Stitcher_create()
 
-    images_to_stitch = []
-    for img_path in captured_images:
-        img = cv2.imread(img_path)
-        if img is not None:
-            images_to_stitch.append(img)
-        else:
-            print(f"  画像の読み込みに失敗しました: {img_path}")
+    # 保存した画像を読み直さず、メモリ上のフレームをそのまま使う
+    images_to_stitch = ring.frames()
 
     if not images_to_stitch:
         print("  スティッチングできる画像がありません。スキップします。")
@@ -146,7 +181,6 @@ def capture_360_panorama_at_height(tello, target_height_cm, num_images=12, delay
     # スティッチング処理の実行
     status, panorama = stitcher.stitch(images_to_stitch)
 
-    output_path = os.path.join(script_dir, f"{output_filename_prefix}_H{target_height_cm}_panorama.jpg")
     if status == cv2.Stitcher.OK:
         cv2.imwrite(output_path, panorama)
         print(f"  高さ {target_height_cm / 100:.1f}m のパノラマ画像を保存しました: {output_path}")
@@ -162,7 +196,8 @@ def capture_360_panorama_at_height(tello, target_height_cm, num_images=12, delay
             print("  カメラパラメータの調整に失敗しました。")
 
     # 一時画像の削除（必要であればコメントアウトを外す）
-    # for img_path in captured_images:
+    # writer.flush()
+    # for img_path in glob.glob(os.path.join(image_dir, f"{output_filename_prefix}_H{target_height_cm}_*.jpg")):
     #     os.remove(img_path)
     # os.rmdir(image_dir) # ディレクトリ内の画像が全て削除されたらディレクトリも削除
 
@@ -181,25 +216,82 @@ if __name__ == "__main__":
     # 例: 200cm (地上から2m), 300cm (地上から3m)
     target_heights_cm = [200, 300, 400, 500]
 
+    # 高さごとの撮影を1組として、電池に収まる組だけを上昇・下降の少ない順に撮る。
+    # 所要時間と電池の消費は飛行のたびに tello_history.json に記録して見積もりに使い、
+    # 途中で電池が足りなくなったら panorama_progress.json に進み具合を残して、次の飛行で続きから撮る
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    capture_sets = [
+        CaptureSet(f"{height / 100:.1f}m", height, shots=12, step_deg=30,
+                   output=os.path.join(script_dir, f"multi_height_panorama_{i+1}_H{height}_panorama.jpg"))
+        for i, height in enumerate(target_heights_cm)
+    ]
+    scheduler = CaptureScheduler(EnergyModel.load(os.path.join(script_dir, "tello_history.json")), reserve=20)
+    progress_path = os.path.join(script_dir, "panorama_progress.json")
+
+    # 各高さのパノラマは撮影しながら合成し（StreamingStitcher）、位置合わせに失敗した高さだけ飛行中に別プロセスで合成し直す
+    batch = PanoramaBatch(mode="yaw")
+    # 撮影した画像のファイル保存も裏のスレッドで行う
+    writer = FrameWriter()
+    # 高さは rc で閉ループに合わせる（高さごとの収束までの時間を最後に表示する）
+    altitude = AltitudeController(tello.send_rc_control, tello.get_current_state)
+    # 飛行中の状態（高さ・姿勢・電池など）をログに残し、あとで python -m tellolib.telemetry info で見られるようにする
+    telemetry = None
+
     try:
         # 1. バッテリー残量の確認
         if not check_tello_battery(tello):
             print("バッテリー残量が不足しているか、Telloへの接続に失敗したため、処理を中断します。")
             exit() # プログラムを終了
 
+        # Tello と同じ共有の StateListener から、この機体の状態パケットを全て記録する
+        telemetry = TelemetryRecorder(os.path.join(script_dir, "telemetry", time.strftime("flight_%Y%m%d_%H%M%S.tlm")),
+                                      ip=tello.host)
+
+        # 前回の飛行で撮り終えた高さは飛ばさない。1組も電池に収まらなければ離陸しない
+        pending = scheduler.pending(capture_sets, progress_path)
+        battery_level = tello.get_battery()
+        schedule = scheduler.plan(pending, battery_level, takeoff=True)
+        scheduler.print_plan(schedule, battery_level)
+        if pending and not schedule.sets:
+            print("電池の残量では1つの高さも撮り終えられないため、処理を中断します。")
+            exit()
+
         # 2. 離陸
         tello_takeoff(tello)
 
-        # 3. 各高さでのパノラマ撮影
-        for i, height in enumerate(target_heights_cm):
-            # ファイル名を指定
-            panorama_file_name = f"multi_height_panorama_{i+1}"
-            capture_360_panorama_at_height(tello, height, output_filename_prefix=panorama_file_name)
-            time.sleep(3) # 各高度での撮影後に少し待機
+        # 3. 各高さでのパノラマ撮影（1つ撮り終えるごとに電池を確認し、順番を立て直す）
+        def capture(capture_set):
+            # ファイル名は高さのリストの順番で付ける（撮影の順番が変わっても同じ名前になる）
+            panorama_file_name = f"multi_height_panorama_{target_heights_cm.index(capture_set.height) + 1}"
+            telemetry.mark(f"capture {capture_set.label}")
+            capture_360_panorama_at_height(tello, capture_set.height, num_images=capture_set.shots,
+                                           output_filename_prefix=panorama_file_name, streaming=True,
+                                           batch=batch, writer=writer, altitude=altitude, sweep=True)
 
-        print("\n全てのパノラマ撮影が完了しました。着陸します。")
+        done, remaining = scheduler.run(pending, capture, battery=tello.get_battery, height=tello.get_height,
+                                        progress_path=progress_path)
+
+        if remaining:
+            print(f"\n電池が足りないため {', '.join(s.label for s in remaining)} の撮影は次の飛行で行います。着陸します。")
+        else:
+            print("\n全てのパノラマ撮影が完了しました。着陸します。")
         tello.land()
         print("着陸しました。")
+        altitude.print_stats()
+
+        # 飛行中に投入した合成の結果をまとめて受け取る
+        results = batch.print_results()
+        for result in results:
+            if result.shape is not None:
+                cv2.imshow(f"360 Panorama at {result.label}", cv2.imread(result.output_path))
+                cv2.waitKey(1)
+
+        # 4. 高さごとのパノラマを縦に1枚にする（タイルに分けて合成するので、メモリは1枚分で済む）
+        # 前回までの飛行で撮った高さも含め、全ての高さが揃ってから作る
+        stitched = [s.output for s in capture_sets if s.label in done and os.path.exists(s.output)]
+        if not remaining and len(stitched) >= 2:
+            mosaic_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "multi_height_mosaic.jpg")
+            stack_panoramas(stitched, mosaic_path)
 
     except Exception as e:
         print(f"エラーが発生しました: {e}")
@@ -208,6 +300,10 @@ if __name__ == "__main__":
         if tello.is_flying:
             print("エラーのためTelloを着陸させます...")
             tello.land()
+        if telemetry is not None:
+            telemetry.close()
         if tello.is_connected:
             tello.end()
+        batch.close()
+        writer.close()  # 残っている画像の保存を済ませる
         cv2.destroyAllWindows() # 開いているすべてのOpenCVウィンドウを閉じる
@@ -1,57 +1,58 @@
-import socket
+import asyncio
 import cv2
-import time
 import os
+import sys
+import time
 
-TELLO_IP = '192.168.10.1'
-TELLO_PORT = 8889
-TELLO_VIDEO_PORT = 11111
-tello_address = (TELLO_IP, TELLO_PORT)
-
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.settimeout(5)
-
-def send_command(command, wait=2):
-    try:
-        sock.sendto(command.encode('utf-8'), tello_address)
-        print(f"[SEND] {command}")
-        response, _ = sock.recvfrom(1024)
-        print(f"[RECV] {response.decode('utf-8')}")
-        time.sleep(wait)
-    except Exception as e:
-        print(f"[ERROR] {e}")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from tellolib.command import CommandChannel
+from tellolib.panorama.stitch import stitch_images
+from tellolib.quality import FrameSelector
+from tellolib.settle import SettleTrigger
+from tellolib.state import get_state_listener
+from tellolib.video import get_video_receiver
 
-def capture_panorama_at_height(cap, height_label, num_photos=12, angle_step=360//12):
+async def capture_panorama_at_height(tello, trigger, height_label, num_photos=12, angle_step=360//12):
     dir_path = f"panorama/{height_label}"
     os.makedirs(dir_path, exist_ok=True)
 
     print(f"[📷] {height_label}の高さでパノラマ撮影開始")
+    trigger.selector.reset()  # 前の高さの画像とは比べない
+    moved_at = time.time()
     for i in range(num_photos):
-        ret, frame = cap.read()
-        if ret:
+        # 回転が終わった後に受信したフレームのうち、映像と姿勢が落ち着いたものを使う
+        frame = await asyncio.get_running_loop().run_in_executor(None, trigger.wait, moved_at)
+        if frame is not None:
             filename = f"{dir_path}/img_{i:02d}.jpg"
             cv2.imwrite(filename, frame)
             print(f"  → 保存: {filename}")
         else:
             print(f"⚠️ 画像取得失敗")
-        send_command(f"cw {angle_step}", wait=2)
-        time.sleep(1)
+        await tello.send(f"cw {angle_step}")
+        moved_at = time.time()
 
-def create_panorama_from_dir(height_label):
+def create_panorama_from_dir(height_label, mode="opencv", angle_step=360//12, **options):
     dir_path = f"panorama/{height_label}"
     images = []
+    yaws = []
     for fname in sorted(os.listdir(dir_path)):
         if fname.endswith(".jpg"):
             img = cv2.imread(os.path.join(dir_path, fname))
             if img is not None:
                 images.append(img)
+                # 撮れなかった向きも回転はしているので、ファイル名の番号（img_03.jpg なら 3）× angle_step がその画像の向き
+                number = os.path.splitext(fname)[0].rsplit("_", 1)[-1]
+                yaws.append((int(number) if number.isdigit() else len(yaws)) * angle_step)
 
     if len(images) < 2:
         print(f"[⚠️] {height_label}m: 合成用画像が足りません")
         return
 
-    stitcher = cv2.Stitcher_create() if hasattr(cv2, 'Stitcher_create') else cv2.createStitcher()
-    status, pano = stitcher.stitch(images)
+    # mode="yaw" なら一定角度ずつ回転した前提で円筒投影する（cv2.Stitcher より数十倍速い）
+    # mode="features" なら特徴点を options["cache_dir"] に保存し、合成し直すときは検出と照合を省く
+    if mode in ("yaw", "stream"):
+        options.setdefault("yaws_deg", yaws)
+    status, pano = stitch_images(images, mode=mode, **options)
 
     if status == cv2.Stitcher_OK:
         output_path = f"panorama_{height_label}.jpg"
@@ -60,31 +61,36 @@ def create_panorama_from_dir(height_label):
     else:
         print(f"[❌] パノラマ合成失敗 @ {height_label}")
 
-def main():
+async def main():
     heights = {
         "2m": 200
     }
 
-    send_command("command")
-    send_command("streamon")
-    cap = cv2.VideoCapture(f'udp://@0.0.0.0:{TELLO_VIDEO_PORT}')
-    time.sleep(2)
+    async with CommandChannel() as tello:
+        await tello.send("command")
+        video = get_video_receiver()
+        state = get_state_listener()
+        # 落ち着くまでに届いた直近の5枚から、ブレが少なく前の画像と重なりのある1枚を選ぶ
+        trigger = SettleTrigger(video, attitude=lambda: state.latest()[1], selector=FrameSelector(n=5))
+        await tello.send("streamon")
+        await asyncio.sleep(2)  # ストリームの開始を待つ
 
-    send_command("takeoff", wait=5)
-    time.sleep(2)
+        await tello.send("takeoff")
 
-    for label, move_cm in heights.items():
-        send_command(f"up {move_cm}", wait=4)
-        capture_panorama_at_height(cap, label)
+        for label, move_cm in heights.items():
+            await tello.send(f"up {move_cm}")
+            await capture_panorama_at_height(tello, trigger, label)
 
-    send_command("land", wait=5)
-    send_command("streamoff")
-    cap.release()
-    sock.close()
+        await tello.send("land")
+        await tello.send("streamoff")
+        video.print_stats()
+        trigger.print_stats()
+        trigger.selector.print_stats()
+        tello.print_summary()
 
     # パノラマ合成
     for label in heights.keys():
-        create_panorama_from_dir(label)
+        create_panorama_from_dir(label, mode="yaw")
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
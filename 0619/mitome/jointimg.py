@@ -1,7 +1,11 @@
 import cv2
 import os
+import sys
 
-def create_panorama_from_images(image_folder="panorama_images", output_filename="360_panorama_combined.jpg"):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from tellolib.panorama.stitch import stitch_images
+
+def create_panorama_from_images(image_folder="panorama_images", output_filename="360_panorama_combined.jpg", mode="opencv", **options):
     """
     指定されたフォルダ内の画像ファイル（ファイル名がソート順に並ぶことを前提）を読み込み、
     OpenCVのStitcher機能を使用してパノラマ画像を生成します。
@@ -9,6 +13,11 @@ def create_panorama_from_images(image_folder="panorama_images", output_filename=
     Args:
         image_folder (str): 画像ファイルが保存されているフォルダのパス。
         output_filename (str): 生成されるパノラマ画像のファイル名。
+        mode (str): 合成方法。"opencv" は従来の cv2.Stitcher、
+            "yaw" は 360度を枚数で等分した回転角度を前提にした円筒投影（数十倍速い）、
+            "features" は cv2.Stitcher と同じ手順で特徴点と照合結果をキャッシュする（2回目以降は検出と照合を省く）、
+            "sequential" は "features" のうちファイル名順に隣り合う画像（と最後と最初）だけを照合する（枚数に比例）。
+        **options: 合成方法ごとの追加の引数（"features" の cache_dir, projection, blend など）。
     """
     img_list = []
     
@@ -37,12 +46,9 @@ def create_panorama_from_images(image_folder="panorama_images", output_filename=
 
     print(f"{len(img_list)} 枚の画像を結合します...")
 
-    # OpenCVのStitcherオブジェクトを作成
-    # デフォルトのモード（PANORAMA）で作成します
-    stitcher = cv2.Stitcher.create()
-
     # 画像のスティッチングを実行
-    status, panorama = stitcher.stitch(img_list)
+    # mode="opencv" ではデフォルトのモード（PANORAMA）の cv2.Stitcher を使います
+    status, panorama = stitch_images(img_list, mode=mode, **options)
 
     if status == cv2.Stitcher_OK:
         # パノラマ画像を保存
@@ -73,4 +79,14 @@ if __name__ == "__main__":
     # 出力ファイル名を指定
     output_panorama_file = "2m_height_360_panorama.jpg"
 
-    create_panorama_from_images(input_image_directory, output_panorama_file)
\ No newline at end of file
+    # 合成方法（"opencv", "yaw", "features" または "sequential"）
+    stitch_mode = "yaw"
+
+    # "features" の場合は特徴点をここに保存し、投影（projection）やブレンド（blend）を変えて合成し直すときに再利用する
+    feature_cache_dir = "feature_cache"
+
+    if stitch_mode in ("features", "sequential"):
+        create_panorama_from_images(input_image_directory, output_panorama_file, mode=stitch_mode,
+                                    cache_dir=feature_cache_dir, projection="spherical", blend="multiband", verbose=True)
+    else:
+        create_panorama_from_images(input_image_directory, output_panorama_file, mode=stitch_mode)
\ No newline at end of file
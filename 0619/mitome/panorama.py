@@ -1,8 +1,13 @@
-from djitellopy import Tello
 import cv2
 import os
+import sys
 import time
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from tellolib.quality import FrameSelector
+from tellolib.settle import SettleTrigger
+from tellolib.tello import Tello
+
 tello = Tello()
 tello.connect()
 
@@ -15,6 +20,11 @@ tello.move_up(500) # Nm (N00cm) 上昇
 time.sleep(5)
 
 tello.streamon() # ビデオストリーム開始
+frame_read = tello.get_frame_read() # 受信は1つを使い回す
+# 決め打ちで待たずに、映像と姿勢が落ち着いたらすぐ撮影する（最大2秒）
+# 直近の5枚からブレが少なく、前の画像と重なりのある1枚を選ぶ
+selector = FrameSelector(n=5)
+trigger = SettleTrigger(frame_read, attitude=tello.get_current_state, timeout=2, selector=selector)
 
 # 画像保存用のディレクトリを作成（任意）
 if not os.path.exists("panorama_images"):
@@ -26,8 +36,8 @@ num_images = 12
 
 for i in range(num_images):
     print(f"{i+1}/{num_images} 枚目を撮影中...")
-    # ストリームからフレームを取得
-    frame = tello.get_frame_read().frame
+    # 直前のコマンド（回転）が終わった後、機体が落ち着いたときのフレームを取得
+    frame = trigger.wait(since=tello.last_command_time)
 
     if frame is not None:
         # 画像を保存（ファイル名を適宜変更してください）
@@ -39,10 +49,12 @@ for i in range(num_images):
     # 最後の撮影後以外は回転
     if i < num_images - 1:
         tello.rotate_clockwise(rotation_angle)
-        time.sleep(2) # 回転後、安定するまで少し待つ
 
 tello.streamoff() # ビデオストリーム停止
 tello.land()
 print("撮影と着陸が完了しました。")
+frame_read.print_stats()
+trigger.print_stats()
+selector.print_stats()
 
 cv2.destroyAllWindows()
\ No newline at end of file
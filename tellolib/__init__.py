@@ -0,0 +1,16 @@
+"""
+Tello 制御用の共通ライブラリ。
+
+各日付フォルダのスクリプトから
+    sys.path.append(<リポジトリのルート>)
+した上で ``from tellolib.tello import Tello`` のように使います。
+
+コマンドは全て TelloClient（UDP 8889）を経由し、状態は StateListener（UDP 8890）で受信します。
+``python -m tellolib.mission`` のようにコマンドラインから使うモジュール（mission, swarm, planner など）は
+ここでは読み込まないので、``from tellolib.mission import Mission`` のように直接読み込んでください。
+"""
+from .client import TelloClient, close_all, get_client
+from .command import CommandChannel
+from .state import StateListener, get_state_listener
+from .tello import Tello, TelloError
+from .transport import Transport, UdpTransport
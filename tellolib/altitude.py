@@ -0,0 +1,186 @@
+"""
+状態パケットの高さ（h と tof）を見ながら、rc の上下の速度指令で目標の高さに合わせる高度制御。
+
+これまでのスクリプトは目標の高さと get_height() の差を1回だけ計算して move_up / move_down を送り、
+その後 time.sleep(5) で落ち着くのを待っていました（0619.py は相対の move_up を重ね、最後に SDK の
+上限いっぱいの move_down(500) を送っていた）。移動量の誤差が高さごとに積み重なり、待ち時間も決め打ちです。
+
+AltitudeController は状態パケットが届くたびに高さと上下の速度を推定し、
+    ud = gain × (目標 - 高さ) - damping × 速度
+の rc 指令を送ります（PD 制御）。高さが目標から tolerance 以内に hold 秒とどまったら収束とみなし、
+rc を 0 に戻してすぐに返ります。高さごとの収束までの時間と誤差・行き過ぎを記録します。
+
+    altitude = AltitudeController(tello.send_rc_control, tello.get_current_state)
+    altitude.hold(200)
+    ...
+    altitude.print_stats()
+
+高さは気圧の h を基本にし、tof（下向きの距離センサ）が届く範囲ではその差を h の補正に使います。
+"""
+import collections
+import time
+
+# 高さごとの結果。converge_time は目標に入って落ち着くまでの秒数、error は最後の誤差[cm]、
+# overshoot は目標を行き過ぎた最大の量[cm]、reason は "converged" か "timeout"
+AltitudeRecord = collections.namedtuple(
+    "AltitudeRecord", ["target", "start", "converge_time", "error", "overshoot", "reason"])
+
+TOF_OFFSET_CM = 10      # 接地しているときの tof の値（センサと機体の底の差）
+TOF_MAX_CM = 300        # tof を信用する上限（これより遠いと値が飛ぶ）
+RC_MAX = 100            # rc の指令の上限
+
+
+class AltitudeEstimator:
+    """
+    状態パケットから地上からの高さ[cm]と上下の速度[cm/s]を推定します。
+
+    h は気圧から求めた離陸地点からの高さで、範囲は広いもののずれていきます。tof が信用できる範囲
+    （TOF_MAX_CM 以内）にあるときは tof と h の差をなめらかに追いかけて、その差を h に足します。
+    """
+
+    def __init__(self, smoothing=0.3):
+        self.smoothing = smoothing
+        self.offset = 0.0
+        self.height = None
+        self.velocity = 0.0
+        self._time = None
+
+    def update(self, timestamp, state):
+        h = state.get("h")
+        if h is None:
+            return self.height
+        tof = state.get("tof")
+        if tof is not None and TOF_OFFSET_CM < tof <= TOF_MAX_CM:
+            self.offset += (tof - TOF_OFFSET_CM - h - self.offset) * self.smoothing
+        height = h + self.offset
+        if self.height is not None and self._time is not None and timestamp > self._time:
+            velocity = (height - self.height) / (timestamp - self._time)
+            self.velocity += (velocity - self.velocity) * (1.0 - self.smoothing)
+        self.height = height
+        self._time = timestamp
+        return height
+
+
+class AltitudeController:
+    """
+    rc の上下の速度指令で目標の高さに合わせます。
+
+    Args:
+        send_rc (callable): rc を送る関数 send_rc(左右, 前後, 上下, 回転)（tello.send_rc_control）。
+        state (callable): 最新の状態の辞書を返す関数（tello.get_current_state）。
+            パケットが届くたびに新しい辞書を返すものとし、同じ辞書が続く間は次のパケットを待ちます。
+        gain (float): 誤差 1cm あたりの rc の指令。
+        damping (float): 速度 1cm/s あたりに差し引く rc の指令（行き過ぎを抑える）。
+        max_speed (int): rc の指令の上限（0〜100）。
+        min_speed (int): 目標の外にいるときの指令の下限（小さい指令では機体が動かない）。
+        tolerance (float): 目標に入ったとみなす誤差[cm]。
+        hold (float): 目標に入ったままこの秒数たったら収束とみなす。
+        timeout (float): 収束しなくてもこの秒数で打ち切る。
+        rate (float): 状態を読む頻度（Hz）。
+        verbose (bool): ログを出すかどうか。
+    """
+
+    def __init__(self, send_rc, state, gain=2.0, damping=0.5, max_speed=60, min_speed=12, tolerance=5.0,
+                 hold=0.4, timeout=20.0, rate=30.0, verbose=True):
+        self.send_rc = send_rc
+        self.state = state
+        self.gain = gain
+        self.damping = damping
+        self.max_speed = min(max_speed, RC_MAX)
+        self.min_speed = min_speed
+        self.tolerance = tolerance
+        self.hold_time = hold
+        self.timeout = timeout
+        self.period = 1.0 / rate
+        self.verbose = verbose
+        self.estimator = AltitudeEstimator()
+        self.records = []
+        self._last_state = None
+
+    def _command(self, error):
+        ud = self.gain * error - self.damping * self.estimator.velocity
+        # 目標の外では小さすぎる指令を下限まで上げる（目標の中では残りの誤差を小さな指令で詰める）
+        if abs(error) > self.tolerance and abs(ud) < self.min_speed and ud * error > 0:
+            ud = self.min_speed if error > 0 else -self.min_speed
+        return int(round(max(-self.max_speed, min(self.max_speed, ud))))
+
+    def hold(self, target, timeout=None):
+        """
+        目標の高さ target[cm] に合わせ、AltitudeRecord を返します。
+        """
+        timeout = self.timeout if timeout is None else timeout
+        started = time.time()
+        deadline = started + timeout
+        inside_since = None
+        start = None
+        overshoot = 0.0
+        last_ud = None
+        last_sent = 0.0
+        reason = "timeout"
+        error = None
+        try:
+            while True:
+                now = time.time()
+                state = self.state()
+                if state and state is not self._last_state:
+                    self._last_state = state
+                    height = self.estimator.update(now, state)
+                    if height is not None:
+                        if start is None:
+                            start = height
+                        error = target - height
+                        # 出発した側と反対に目標を越えた量
+                        if (target - start) * error < 0:
+                            overshoot = max(overshoot, abs(error))
+                        if abs(error) <= self.tolerance:
+                            inside_since = inside_since or now
+                            if now - inside_since >= self.hold_time:
+                                reason = "converged"
+                                break
+                        else:
+                            inside_since = None
+                        ud = self._command(error)
+                        # 指令が変わったときと、0.5秒ごとに送る（rc には応答がないので送りっぱなし）
+                        if ud != last_ud or now - last_sent >= 0.5:
+                            self.send_rc(0, 0, ud, 0)
+                            last_ud, last_sent = ud, now
+                if now >= deadline:
+                    break
+                time.sleep(self.period)
+        finally:
+            self.send_rc(0, 0, 0, 0)
+
+        elapsed = time.time() - started
+        record = AltitudeRecord(target, start, elapsed, error, overshoot, reason)
+        self.records.append(record)
+        if self.verbose:
+            label = "収束" if reason == "converged" else "時間切れ"
+            start_text = "-" if start is None else f"{start:.0f}cm"
+            error_text = "-" if error is None else f"{error:+.0f}cm"
+            print(f"[ALT] {target}cm: {label} {elapsed:.2f}秒 (開始 {start_text}, 誤差 {error_text}, "
+                  f"行き過ぎ {overshoot:.0f}cm)")
+        return record
+
+    # --- 統計 ---
+
+    def summary(self):
+        """
+        高さごとの収束までの時間の統計を辞書で返します。
+        """
+        times = [r.converge_time for r in self.records]
+        if not times:
+            return {"levels": 0, "mean": 0.0, "max": 0.0, "total": 0.0, "timeouts": 0}
+        return {
+            "levels": len(times),
+            "mean": sum(times) / len(times),
+            "max": max(times),
+            "total": sum(times),
+            "timeouts": sum(1 for r in self.records if r.reason != "converged"),
+        }
+
+    def print_stats(self):
+        s = self.summary()
+        print(f"[ALT] {s['levels']} 段: 収束まで 平均 {s['mean']:.2f}秒 / 最大 {s['max']:.2f}秒 / "
+              f"合計 {s['total']:.1f}秒 / 時間切れ {s['timeouts']} 段")
+        for r in self.records:
+            print(f"[ALT]   {r.target}cm: {r.converge_time:.2f}秒 (行き過ぎ {r.overshoot:.0f}cm)")
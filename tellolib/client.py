@@ -0,0 +1,181 @@
+"""
+Tello のコマンド送受信クライアント（同期版）。
+
+スクリプトごとにコピーされていた socket の作成と send_command をまとめたもので、
+asyncio 版の CommandChannel と djitellopy 互換の Tello クラスもこのクライアントを経由して送信します。
+"""
+import collections
+import threading
+import time
+
+from .protocol import TELLO_IP, TELLO_PORT, command_policy, command_type
+from .transport import UdpTransport
+
+# 各コマンドの記録
+#   latency: 送信から応答までの時間（秒）
+#   overhead: そのうち手元の処理（エンコード・送信・待ち受け準備など）にかかった時間（秒）
+CommandRecord = collections.namedtuple(
+    "CommandRecord", ["command", "response", "latency", "attempts", "overhead"])
+
+
+class CommandLog:
+    """
+    コマンドの記録と、種類ごとの応答時間の集計。
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def summary(self):
+        """
+        コマンドの種類ごとの応答時間の集計を返します。
+
+        Returns:
+            dict: {種類: {"count", "total", "mean", "max", "timeouts", "overhead"}}
+        """
+        stats = {}
+        for record in self.records:
+            name = command_type(record.command)
+            s = stats.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0,
+                                        "timeouts": 0, "overhead": 0.0})
+            s["count"] += 1
+            s["total"] += record.latency
+            s["max"] = max(s["max"], record.latency)
+            s["overhead"] += record.overhead
+            s["timeouts"] += record.attempts - 1 + (record.response is None and name != "rc")
+        for s in stats.values():
+            s["mean"] = s["total"] / s["count"]
+        return stats
+
+    def print_summary(self):
+        print("[STATS] コマンド別の応答時間")
+        total = 0.0
+        overhead = 0.0
+        for name, s in sorted(self.summary().items(), key=lambda kv: -kv[1]["total"]):
+            total += s["total"]
+            overhead += s["overhead"]
+            print(f"  {name:<10} {s['count']:3d}回  平均 {s['mean'] * 1000:7.0f} ms  "
+                  f"最大 {s['max'] * 1000:7.0f} ms  合計 {s['total']:6.1f} 秒  タイムアウト {s['timeouts']}")
+        count = max(len(self.records), 1)
+        print(f"  合計 {total:.1f} 秒 (手元の処理 1コマンドあたり {overhead / count * 1e6:.0f} µs)")
+
+
+class TelloClient(CommandLog):
+    """
+    1台の Tello に対するコマンドクライアント。
+
+    Tello の応答にはコマンドとの対応を示す番号がないため、
+    同時に送るコマンドは常に1つだけになるようロックで直列化します。
+
+    Args:
+        ip (str): Tello の IP アドレス。
+        port (int): コマンドポート。
+        transport (Transport): 通信路。省略時は UdpTransport を作る。
+        verbose (bool): 送受信をログに出すかどうか。
+    """
+
+    def __init__(self, ip=TELLO_IP, port=TELLO_PORT, transport=None, verbose=True):
+        super().__init__()
+        self.ip = ip
+        self.port = port
+        self.transport = transport if transport is not None else UdpTransport(ip, port)
+        self.verbose = verbose
+        self._lock = threading.Lock()
+
+    def send(self, command, timeout=None, retries=None):
+        """
+        コマンドを送信し、"ok" / "error" などの応答が届くまで待って返します。
+
+        Args:
+            command (str): Tello に送るコマンド文字列。
+            timeout (float): 応答待ちのタイムアウト（秒）。省略時は command_policy に従う。
+            retries (int): タイムアウト時の再送回数。省略時は command_policy に従う。
+        Returns:
+            str: Tello の応答（"ok", "error", 問い合わせの値など）。応答がなければ None。
+        """
+        default_timeout, default_retries = command_policy(command)
+        timeout = default_timeout if timeout is None else timeout
+        retries = default_retries if retries is None else retries
+        data = command.encode('utf-8')
+
+        with self._lock:
+            drain = getattr(self.transport, "drain", None)
+            if drain is not None:
+                for stale in drain():
+                    if self.verbose:
+                        print(f"[DROP] 遅れて届いた応答を破棄: {stale.decode('utf-8', 'replace').strip()}")
+
+            start = time.perf_counter()
+            overhead = 0.0
+            attempts = 0
+            decoded = None
+
+            while attempts <= retries:
+                attempts += 1
+                sent = time.perf_counter()
+                self.transport.send(data)
+                overhead += time.perf_counter() - sent
+                if self.verbose:
+                    print(f"[SEND] {command}" + (f" (再送 {attempts - 1})" if attempts > 1 else ""))
+                if timeout is None:
+                    break
+                response = self.transport.recv(timeout)
+                if response is not None:
+                    decoded = response.decode('utf-8', 'replace').strip()
+                    break
+                if self.verbose:
+                    print(f"[TIMEOUT] {command} の応答なし ({timeout:.1f}秒)")
+
+            latency = time.perf_counter() - start
+            self.records.append(CommandRecord(command, decoded, latency, attempts, overhead))
+
+        if self.verbose and decoded is not None:
+            print(f"[RECV] {decoded} ({latency * 1000:.0f} ms)")
+        if decoded == "error":
+            print(f"[WARN] コマンド '{command}' に対して error が返されました")
+        return decoded
+
+    def close(self):
+        """
+        ソケットを閉じます。get_client で共有しているクライアントなら共有からも外します。
+        """
+        self.transport.close()
+        with _clients_lock:
+            if _clients.get((self.ip, self.port)) is self:
+                del _clients[(self.ip, self.port)]
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(ip=TELLO_IP, port=TELLO_PORT, transport=None, verbose=None):
+    """
+    機体ごとに共有する TelloClient を返します。
+
+    同じ機体に対して何度呼んでも同じソケットを使い回すので、
+    複数のモジュールから送信しても応答の取り違えが起きません。
+    transport と verbose は最初に作るときだけ使います。すでにあるクライアントと違う値を
+    指定すると ValueError を送出します（None は「指定しない」）。
+    """
+    with _clients_lock:
+        client = _clients.get((ip, port))
+        if client is None:
+            client = TelloClient(ip, port, transport=transport, verbose=True if verbose is None else verbose)
+            _clients[(ip, port)] = client
+            return client
+    if transport is not None and transport is not client.transport:
+        raise ValueError(f"{ip}:{port} のクライアントは別の transport ですでに作られています")
+    if verbose is not None and verbose != client.verbose:
+        raise ValueError(f"{ip}:{port} のクライアントは verbose={client.verbose} ですでに作られています")
+    return client
+
+
+def close_all():
+    """
+    共有している全てのクライアントのソケットを閉じます。
+    """
+    with _clients_lock:
+        clients = list(_clients.values())
+    for client in clients:
+        client.close()
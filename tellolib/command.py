@@ -0,0 +1,58 @@
+"""
+Tello SDK のテキストコマンドを asyncio で送受信するコマンドチャネル。
+
+従来の send_command は応答を受け取った後も固定の wait 秒だけ time.sleep していましたが、
+Tello は移動・回転コマンドの動作が終わった時点で "ok" を返すため、その待機は不要です。
+このチャネルは "ok" / "error" の応答を待つだけで次のコマンドへ進み、
+コマンドの種類ごとにタイムアウトと再送回数を切り替え、各コマンドの応答時間を記録します。
+
+送受信そのものは TelloClient が行い、このチャネルは応答待ちをイベントループから外すだけです。
+以前は asyncio のデータグラムのエンドポイントを自前で持っていましたが、同じ機体に Tello クラスや
+MissionRunner からも送るとソケットが2つになり、応答の取り違えが起きていました。get_client で
+共有するクライアント（機体ごとに1つのソケットとロック）を executor のスレッドから呼ぶことで、
+同期版と非同期版を1つのプロセスで混ぜても送信が直列になります。
+"""
+import asyncio
+
+from .client import get_client
+from .protocol import TELLO_IP, TELLO_PORT
+
+
+class CommandChannel:
+    """
+    Tello の UDP 8889 番ポートに対する非同期コマンドチャネル。
+
+    ソケットは get_client で共有するので、開く・閉じる操作はありません。async with はスクリプトの
+    ブロックを区切るためだけに使え、抜けてもソケットは閉じません（閉じるには client.close() を呼ぶ）。
+
+    使い方:
+        async with CommandChannel() as tello:
+            await tello.send("command")
+            await tello.send("takeoff")
+    """
+
+    def __init__(self, ip=TELLO_IP, port=TELLO_PORT, verbose=None, client=None):
+        self.client = client if client is not None else get_client(ip, port, verbose=verbose)
+
+    @property
+    def records(self):
+        return self.client.records
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        pass
+
+    async def send(self, command, timeout=None, retries=None):
+        """
+        コマンドを送信し、応答を待って返します（TelloClient.send の非同期版）。
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.client.send, command, timeout, retries)
+
+    def summary(self):
+        return self.client.summary()
+
+    def print_summary(self):
+        self.client.print_summary()
@@ -0,0 +1,277 @@
+"""
+任意の文字列を空中に描くための、ストロークフォントと文字配置・経路計画。
+
+フォントは HEL.py の draw_h / draw_e / draw_l と同じ寸法（1単位 = 10cm のとき
+高さ60cm・横棒40cm・文字の間隔80cm）の直線ストロークで定義しています。
+文字列の配置（文字送り・カーニング・拡大縮小）は NumPy の配列演算だけで行うので、
+長い文字列でも1文字ごとの Python の処理は発生しません。
+
+    python -m tellolib.glyphs "HELLO" --height 60 --show
+"""
+import argparse
+
+import numpy as np
+
+from .planner import GO_MIN_CM, compile_path, estimate_time, simplify
+
+GLYPH_HEIGHT = 6.0   # フォント座標での文字の高さ
+GLYPH_WIDTH = 4.0    # フォント座標での文字の幅
+LETTER_SPACING = 4.0 # 文字と文字の間隔（HEL.py の move_to_next_letter の 80cm 相当）
+
+# 各文字のストローク（一筆で描ける折れ線）。座標は左下が原点、y が上。
+# go は最も長い軸が 20cm 未満の移動を飛べないので、どの線分も x か y が2単位以上になるようにしている
+# （既定の高さ 60cm では1単位が 10cm）
+FONT = {
+    "A": [[(0, 0), (2, 6), (4, 0)], [(1, 3), (3, 3)]],
+    "B": [[(0, 0), (0, 6), (2, 6), (4, 4), (2, 3), (0, 3)], [(2, 3), (4, 2), (2, 0), (0, 0)]],
+    "C": [[(4, 6), (0, 6), (0, 0), (4, 0)]],
+    "D": [[(0, 0), (0, 6), (2, 6), (4, 4), (4, 2), (2, 0), (0, 0)]],
+    "E": [[(4, 6), (0, 6), (0, 0), (4, 0)], [(0, 3), (4, 3)]],
+    "F": [[(4, 6), (0, 6), (0, 0)], [(0, 3), (3, 3)]],
+    "G": [[(4, 6), (0, 6), (0, 0), (4, 0), (4, 3), (2, 3)]],
+    "H": [[(0, 0), (0, 6)], [(4, 0), (4, 6)], [(0, 3), (4, 3)]],
+    "I": [[(0, 6), (4, 6)], [(2, 6), (2, 0)], [(0, 0), (4, 0)]],
+    "J": [[(4, 6), (4, 0), (0, 0), (0, 2)]],
+    "K": [[(0, 0), (0, 6)], [(4, 6), (0, 3), (4, 0)]],
+    "L": [[(0, 6), (0, 0), (4, 0)]],
+    "M": [[(0, 0), (0, 6), (2, 3), (4, 6), (4, 0)]],
+    "N": [[(0, 0), (0, 6), (4, 0), (4, 6)]],
+    "O": [[(0, 0), (0, 6), (4, 6), (4, 0), (0, 0)]],
+    "P": [[(0, 0), (0, 6), (4, 6), (4, 3), (0, 3)]],
+    "Q": [[(0, 0), (0, 6), (4, 6), (4, 0), (0, 0)], [(2, 2), (4, 0)]],
+    "R": [[(0, 0), (0, 6), (4, 6), (4, 3), (0, 3), (4, 0)]],
+    "S": [[(4, 6), (0, 6), (0, 3), (4, 3), (4, 0), (0, 0)]],
+    "T": [[(0, 6), (4, 6)], [(2, 6), (2, 0)]],
+    "U": [[(0, 6), (0, 0), (4, 0), (4, 6)]],
+    "V": [[(0, 6), (2, 0), (4, 6)]],
+    "W": [[(0, 6), (1, 0), (2, 4), (3, 0), (4, 6)]],
+    "X": [[(0, 0), (4, 6)], [(0, 6), (4, 0)]],
+    "Y": [[(0, 6), (2, 3), (4, 6)], [(2, 3), (2, 0)]],
+    "Z": [[(0, 6), (4, 6), (0, 0), (4, 0)]],
+    "0": [[(0, 0), (0, 6), (4, 6), (4, 0), (0, 0)], [(0, 0), (4, 6)]],
+    "1": [[(0, 4), (2, 6), (2, 0)], [(0, 0), (4, 0)]],
+    "2": [[(0, 6), (4, 6), (4, 3), (0, 3), (0, 0), (4, 0)]],
+    "3": [[(0, 6), (4, 6), (4, 0), (0, 0)], [(0, 3), (4, 3)]],
+    "4": [[(0, 6), (0, 3), (4, 3)], [(3, 6), (3, 0)]],
+    "5": [[(4, 6), (0, 6), (0, 3), (4, 3), (4, 0), (0, 0)]],
+    "6": [[(4, 6), (0, 6), (0, 0), (4, 0), (4, 3), (0, 3)]],
+    "7": [[(0, 6), (4, 6), (1, 0)]],
+    "8": [[(0, 0), (0, 6), (4, 6), (4, 0), (0, 0)], [(0, 3), (4, 3)]],
+    "9": [[(4, 3), (0, 3), (0, 6), (4, 6), (4, 0), (0, 0)]],
+    "-": [[(1, 3), (3, 3)]],
+    " ": [],
+}
+
+# 隣り合うと間が空きすぎて見える組み合わせ（フォント座標で詰める量）
+KERNING = {
+    ("A", "V"): -1, ("V", "A"): -1, ("A", "W"): -1, ("W", "A"): -1, ("A", "T"): -1, ("T", "A"): -1,
+    ("A", "Y"): -1, ("Y", "A"): -1, ("L", "T"): -2, ("L", "V"): -1, ("L", "Y"): -1, ("L", "W"): -1,
+    ("P", "A"): -1, ("F", "A"): -1, ("T", "J"): -1,
+}
+
+
+def _pack_font(font, kerning):
+    # フォントを連続した配列に詰める（文字 -> ストロークの範囲 -> 点の範囲）
+    chars = sorted(font)
+    points = []
+    stroke_offsets = [0]
+    glyph_offsets = [0]
+    for char in chars:
+        for stroke in font[char]:
+            points.extend(stroke)
+            stroke_offsets.append(len(points))
+        glyph_offsets.append(len(stroke_offsets) - 1)
+    code_to_glyph = np.full(128, -1, dtype=np.int64)
+    for index, char in enumerate(chars):
+        code_to_glyph[ord(char)] = index
+    advance = np.full(len(chars), GLYPH_WIDTH + LETTER_SPACING)
+    kern = np.zeros((len(chars), len(chars)))
+    for (left, right), value in kerning.items():
+        kern[chars.index(left), chars.index(right)] = value
+    return (np.asarray(points, dtype=np.float64).reshape(-1, 2), np.asarray(stroke_offsets),
+            np.asarray(glyph_offsets), code_to_glyph, advance, kern)
+
+
+_POINTS, _STROKE_OFFSETS, _GLYPH_OFFSETS, _CODE_TO_GLYPH, _ADVANCE, _KERN = _pack_font(FONT, KERNING)
+
+
+def _ranges(starts, counts):
+    # [starts[i], starts[i] + counts[i]) を全て連結した添字の配列
+    total = counts.sum()
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.cumsum(counts)
+    offsets = np.repeat(starts - (ends - counts), counts)
+    return np.arange(total) + offsets
+
+
+def layout(text, height=60.0, box=None):
+    """
+    文字列のストロークを配置します。
+
+    Args:
+        text (str): 描く文字列（英大文字・数字・'-'・空白。小文字は大文字として扱う）。
+        height (float): 文字の高さ（cm）。box を指定した場合は無視する。
+        box (tuple): (幅, 高さ) cm。文字列全体がこの枠に収まる最大の大きさにする。
+    Returns:
+        tuple: (points, stroke_offsets)。points は (N, 2) の配列（cm、左下原点、右と上が正）、
+            stroke_offsets[i]:stroke_offsets[i+1] が i 番目のストロークの点。
+    """
+    points, offsets, _ = _layout(text, height, box)
+    return points, offsets
+
+
+def _layout(text, height, box):
+    # layout の本体。文字の高さ（cm）も返す
+    codes = np.frombuffer(text.upper().encode('ascii', 'replace'), dtype=np.uint8)
+    glyphs = _CODE_TO_GLYPH[np.minimum(codes, 127)]
+    if (glyphs < 0).any():
+        bad = sorted({text[i] for i in np.flatnonzero(glyphs < 0)})
+        raise ValueError(f"フォントにない文字です: {''.join(bad)}")
+
+    # 文字送り: advance + 次の文字とのカーニングの累積和
+    step = _ADVANCE[glyphs].copy()
+    step[:-1] += _KERN[glyphs[:-1], glyphs[1:]]
+    origin_x = np.cumsum(step) - step  # 空文字列なら空の配列になる
+    width = origin_x[-1] + GLYPH_WIDTH if len(glyphs) else 0.0
+
+    if box is not None:
+        scale = min(box[0] / width if width else np.inf, box[1] / GLYPH_HEIGHT)
+    else:
+        scale = height / GLYPH_HEIGHT
+
+    # 文字 -> ストローク -> 点 の順に添字を展開する
+    stroke_counts = _GLYPH_OFFSETS[glyphs + 1] - _GLYPH_OFFSETS[glyphs]
+    strokes = _ranges(_GLYPH_OFFSETS[glyphs], stroke_counts)
+    point_counts = _STROKE_OFFSETS[strokes + 1] - _STROKE_OFFSETS[strokes]
+    point_ids = _ranges(_STROKE_OFFSETS[strokes], point_counts)
+
+    shift = np.repeat(np.repeat(origin_x, stroke_counts), point_counts)
+    points = _POINTS[point_ids].copy()
+    points[:, 0] += shift
+    points *= scale
+    offsets = np.concatenate(([0], np.cumsum(point_counts)))
+    return points, offsets, scale * GLYPH_HEIGHT
+
+
+def order_strokes(points, offsets, window=8):
+    """
+    ペンを上げて移動する距離が短くなるよう、ストロークの順番と向きを決めます。
+
+    現在位置から最も近い端点を持つストロークを貪欲に選び、その端点から描きます。
+    候補は未描画のストロークのうち先頭から window 本に限るので、
+    文字列が長くなっても1ステップあたりの計算量は一定です。
+
+    Returns:
+        list: (ストローク番号, 逆向きに描くかどうか) のリスト。
+    """
+    # 端点を (ストローク, 始点/終点, xy) の配列にまとめ、未描画のストロークはマスクで持つ
+    ends = np.stack([points[offsets[:-1]], points[offsets[1:] - 1]], axis=1)
+    unvisited = np.ones(len(ends), dtype=bool)
+    first = 0  # 未描画のうち最も番号の小さいストローク
+    order = []
+    current = ends[0, 0] if len(ends) else None
+    while first < len(ends):
+        candidates = first + np.flatnonzero(unvisited[first:])[:window]
+        distances = np.linalg.norm(ends[candidates] - current, axis=2)  # (候補, 始点/終点)
+        best, side = np.unravel_index(int(np.argmin(distances)), distances.shape)
+        stroke = int(candidates[best])
+        order.append((stroke, bool(side)))
+        current = ends[stroke, 1 - side]
+        unvisited[stroke] = False
+        while first < len(ends) and not unvisited[first]:
+            first += 1
+    return order
+
+
+def plan_text(text, height=60.0, box=None, plane="horizontal", window=8):
+    """
+    文字列を一続きの飛行経路にします。
+
+    Args:
+        text (str): 描く文字列。
+        height (float): 文字の高さ（cm）。
+        box (tuple): (幅, 高さ) cm の枠に収める場合に指定。
+        plane (str): "horizontal" なら HEL.py と同じく文字の上を前方とした水平面に、
+            "vertical" なら地上から見上げる鉛直面（文字の上が上昇）に描く。
+        window (int): order_strokes を参照。
+    Returns:
+        tuple: (経路, 統計)。経路は planner の形式で、最初のストロークの始点が原点。
+            統計は {"strokes", "transits", "draw_cm", "transit_cm"}。
+    Raises:
+        ValueError: 文字が小さすぎて、どの軸も go の下限（20cm）に届かない移動が含まれるとき。
+    """
+    points, offsets, size = _layout(text, height, box)
+    order = order_strokes(points, offsets, window=window)
+
+    sequence = []
+    pen = []  # 各点へ向かう移動がストロークの描画なら True、ペンを上げた移動なら False
+    for stroke, reverse in order:
+        stroke_points = points[offsets[stroke]:offsets[stroke + 1]]
+        if reverse:
+            stroke_points = stroke_points[::-1]
+        sequence.append(stroke_points)
+        pen.extend([False] + [True] * (len(stroke_points) - 1))
+    if not sequence:
+        return [], {"strokes": 0, "transits": 0, "draw_cm": 0.0, "transit_cm": 0.0}
+    sequence = np.concatenate(sequence)
+    pen = np.asarray(pen)
+
+    steps = np.diff(sequence, axis=0)
+    lengths = np.linalg.norm(steps, axis=1)
+    # go は最も長い軸が 20cm 未満の移動を飛べないので、その大きさでは描けない（B や D の角など）
+    reach = np.abs(steps).max(axis=1)
+    short = reach[reach > 1e-6]
+    if len(short) and short.min() < GO_MIN_CM - 1e-6:
+        need = size * GO_MIN_CM / short.min()
+        raise ValueError(f"'{text}' は文字の高さ {size:.0f}cm では描けません"
+                         f"（{short.min():.0f}cm の移動が go の下限 {GO_MIN_CM}cm に届かない）。"
+                         f"高さ {np.ceil(need):.0f}cm 以上にしてください")
+    moves = pen[1:]
+    transits = (~moves) & (lengths > 1e-6)
+    stats = {"strokes": len(order), "transits": int(transits.sum()),
+             "draw_cm": float(lengths[moves].sum()), "transit_cm": float(lengths[transits].sum())}
+
+    u = sequence[:, 0] - sequence[0, 0]
+    v = sequence[:, 1] - sequence[0, 1]
+    zeros = np.zeros_like(u)
+    if plane == "vertical":
+        xyz = np.stack([zeros, -u, v], axis=1)
+    else:
+        xyz = np.stack([v, -u, zeros], axis=1)
+    path = [("line", tuple(p)) for p in xyz[1:].tolist()]
+    return path, stats
+
+
+def compile_text(text, height=60.0, box=None, plane="horizontal", speed=None):
+    """
+    文字列を描く go コマンドの列を返します。
+    """
+    path, stats = plan_text(text, height=height, box=box, plane=plane)
+    kwargs = {} if speed is None else {"speed": speed}
+    return compile_path(simplify(path), **kwargs), stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文字列を描く飛行経路を作ります")
+    parser.add_argument("text")
+    parser.add_argument("--height", type=float, default=60.0, help="文字の高さ（cm）")
+    parser.add_argument("--box", type=float, nargs=2, metavar=("W", "H"), help="収める枠（cm）")
+    parser.add_argument("--plane", choices=["horizontal", "vertical"], default="horizontal")
+    parser.add_argument("--show", action="store_true", help="コマンド列を表示する")
+    args = parser.parse_args()
+
+    try:
+        commands, stats = compile_text(args.text, height=args.height, box=args.box, plane=args.plane)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"[GLYPH] '{args.text}': ストローク {stats['strokes']} 本, ペンを上げた移動 {stats['transits']} 回 "
+          f"({stats['transit_cm']:.0f}cm), 描画 {stats['draw_cm']:.0f}cm")
+    print(f"[GLYPH] {len(commands)} コマンド, 見積もり {estimate_time(commands):.1f} 秒")
+    if args.show:
+        for command in commands:
+            print(f"  {command}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,523 @@
+"""
+飛行の手順を JSON（または YAML）のミッションファイルに書き、共通のコマンドクライアントで実行するインタプリタ。
+
+これまでは図形ごとに Python のスクリプトを書き、辺の長さや回転角を変数と time.sleep の間に埋め込んでいました。
+ミッションファイルなら形を変えるのにコードの編集は要りません。実行前に全体を検査し、
+所要時間と電池の消費を見積もってから実行します。コマンドは1つずつ順に送り、応答を待ってから次を送ります
+（コマンドを重ねて送ることはしません）。time.sleep の決め打ちの待ちをなくし、撮影した画像の保存を
+裏のスレッドに移したことで、コマンドとコマンドの間の空き時間を減らしています。
+
+    {
+      "name": "菱形",
+      "params": {"side": 100},
+      "steps": [
+        "takeoff",
+        {"up": 50},
+        {"repeat": 2, "steps": [
+          {"forward": "side"}, {"cw": 120},
+          {"forward": "side"}, {"cw": 60}
+        ]},
+        "land"
+      ]
+    }
+
+ステップの書き方:
+    "takeoff", "cw 90", "forward {side}"     コマンドの文字列（{名前} は params とループ変数で置き換える）
+    {"forward": 100}, {"cw": "360 / n"}      1つの引数のコマンド。値は数値か、params を使った式
+    {"go": [x, y, z, speed]}                  複数の引数のコマンド（go, curve）
+    {"repeat": 12, "var": "i", "steps": [...]}  繰り返し（var の値は 0 から）
+    {"capture": "img_{i:02d}.jpg", "settle": true}  映像の1枚を保存する（settle なら落ち着くまで待つ）
+    {"wait": 1.5}                             決め打ちで待つ（なるべく wait_until を使う）
+    {"wait_until": {"h": [140, null], "yaw": [-5, 5]}, "timeout": 5}
+                                              状態パケットの値が範囲に入るまで待つ（null は上限・下限なし）
+
+トップレベルには "params", "optimize"（true なら連続する移動を planner で go にまとめる）、
+"output_dir"（capture の保存先）、"reserve"（着陸時に残す電池の%）を書けます。
+
+    python -m tellolib.mission check missions/hishigata.json --show   # 検査と見積もりだけ
+    python -m tellolib.mission run missions/hishigata.json            # 実行
+    python -m tellolib.mission run missions/U.json --record U.tlm     # 状態を記録しながら実行（telemetry を参照）
+    python -m tellolib.mission serve                                  # 標準入力から受け取ったファイルを次々に実行
+
+serve は1つのプロセスで接続・映像の受信を保ったまま、形を変えたミッションを起動し直さずに続けて飛ばせます。
+YAML のファイルを読むには PyYAML が必要です。
+"""
+import argparse
+import ast
+import collections
+import json
+import operator
+import os
+import sys
+import time
+
+from .client import get_client
+from .planner import CURVE_MAX_RADIUS_CM, CURVE_MIN_RADIUS_CM, arc_geometry, estimate_command_time, optimize_commands
+from .protocol import (BATTERY_FLIGHT_TIME_S, DEFAULT_SPEED_CM_S, MOVE_COMMANDS, ROTATE_COMMANDS, TELLO_IP,
+                       TELLO_PORT, command_type)
+from .tello import TelloError
+
+# 実行する1つの手順。kind は "command", "capture", "wait", "wait_until"、where はファイル内の位置
+Step = collections.namedtuple("Step", ["kind", "value", "options", "where"])
+MissionEstimate = collections.namedtuple(
+    "MissionEstimate", ["commands", "flight_time", "total_time", "battery"])
+
+# 引数のないコマンドと、引数の数と範囲（Tello SDK 2.0 と同じ）
+SIMPLE_COMMANDS = {"command", "takeoff", "land", "streamon", "streamoff", "emergency"}
+ARGUMENT_RANGES = {name: [(20, 500)] for name in MOVE_COMMANDS}
+ARGUMENT_RANGES.update({name: [(1, 360)] for name in ROTATE_COMMANDS})
+ARGUMENT_RANGES.update({
+    "speed": [(10, 100)],
+    "go": [(-500, 500)] * 3 + [(10, 100)],
+    "curve": [(-500, 500)] * 6 + [(10, 60)],
+})
+# 撮影1回の見積もり時間（秒）と、落ち着くまで待つときの上限の既定値
+CAPTURE_ESTIMATE_S = 0.3
+CAPTURE_SETTLE_TIMEOUT_S = 3.0
+DEFAULT_RESERVE_PERCENT = 20
+
+_OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+              ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod}
+
+
+class MissionError(ValueError):
+    """
+    ミッションファイルの誤り。problems に見つかった全ての誤りを (位置, 内容) で持ちます。
+    """
+
+    def __init__(self, problems):
+        self.problems = problems
+        super().__init__("ミッションに誤りがあります:\n" + "\n".join(f"  {where}: {message}" for where, message in problems))
+
+
+# --- 読み込みと展開 ---
+
+def load_mission(path):
+    """
+    ミッションファイル（.json, .yaml, .yml）を読み込んで Mission を返します。
+    """
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if path.lower().endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError("YAML のミッションファイルを読むには PyYAML が必要です: pip install pyyaml")
+        data = yaml.safe_load(text)
+    else:
+        data = json.loads(text)
+    return Mission(data, source=path)
+
+
+def evaluate(expression, names):
+    """
+    数値か、names の値を使った四則演算の式（"side / 2" など）を計算します。
+    """
+    if isinstance(expression, (int, float)) and not isinstance(expression, bool):
+        return expression
+    if not isinstance(expression, str):
+        raise ValueError(f"数値か式を指定してください: {expression!r}")
+
+    def visit(node):
+        if isinstance(node, ast.Expression):
+            return visit(node.body)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return node.value
+        if isinstance(node, ast.Name):
+            if node.id not in names:
+                raise ValueError(f"params にない名前です: {node.id}")
+            return names[node.id]
+        if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+            return _OPERATORS[type(node.op)](visit(node.left), visit(node.right))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            value = visit(node.operand)
+            return -value if isinstance(node.op, ast.USub) else value
+        raise ValueError(f"使えない式です: {expression}")
+
+    try:
+        return visit(ast.parse(expression, mode="eval"))
+    except SyntaxError:
+        raise ValueError(f"式を読み取れません: {expression}")
+
+
+class Mission:
+    """
+    読み込んだミッション。steps はループと式を展開した Step のリスト（作った時点で検査済み）。
+
+    Args:
+        data (dict): ミッションファイルの内容。
+        source (str): 読み込んだファイル（エラーの表示に使う）。
+    Raises:
+        MissionError: 誤りが1つでもあれば、全ての誤りをまとめて送出する。
+    """
+
+    def __init__(self, data, source=None):
+        self.source = source
+        if not isinstance(data, dict) or not isinstance(data.get("steps"), list):
+            raise MissionError([("(全体)", '"steps" のリストがありません')])
+        self.name = data.get("name") or (os.path.basename(source) if source else "mission")
+        self.params = dict(data.get("params") or {})
+        self.output_dir = data.get("output_dir", ".")
+        self.reserve = data.get("reserve", DEFAULT_RESERVE_PERCENT)
+        self.problems = []
+        self.steps = []
+        self._expand(data["steps"], self.params, "steps")
+        if data.get("optimize"):
+            self.steps = _optimize(self.steps)
+        self._check_sequence()
+        if self.problems:
+            raise MissionError(self.problems)
+
+    # ステップを展開して self.steps に積む
+    def _expand(self, steps, names, where):
+        for index, step in enumerate(steps):
+            here = f"{where}[{index}]"
+            try:
+                self._expand_step(step, names, here)
+            except (ValueError, KeyError, IndexError, TypeError, ArithmeticError) as e:
+                self.problems.append((here, str(e)))
+
+    def _expand_step(self, step, names, where):
+        if isinstance(step, str):
+            self._add_command(step.format_map(names).split(), where)
+            return
+        if not isinstance(step, dict) or not step:
+            raise ValueError(f"ステップは文字列か辞書で書いてください: {step!r}")
+        if "repeat" in step:
+            count = int(evaluate(step["repeat"], names))
+            var = step.get("var", "i")
+            for i in range(count):
+                self._expand(step.get("steps", []), dict(names, **{var: i}), f"{where}.steps(#{i})")
+            return
+        if "capture" in step:
+            options = {"settle": bool(step.get("settle", False)),
+                       "timeout": float(evaluate(step.get("timeout", CAPTURE_SETTLE_TIMEOUT_S), names))}
+            self.steps.append(Step("capture", str(step["capture"]).format_map(names), options, where))
+            return
+        if "wait" in step:
+            seconds = float(evaluate(step["wait"], names))
+            if seconds < 0:
+                raise ValueError("wait は0以上にしてください")
+            self.steps.append(Step("wait", seconds, {}, where))
+            return
+        if "wait_until" in step:
+            conditions = {}
+            for key, bounds in step["wait_until"].items():
+                if not isinstance(bounds, list) or len(bounds) != 2:
+                    raise ValueError(f"wait_until の {key} は [下限, 上限] で書いてください")
+                low, high = bounds
+                conditions[key] = (None if low is None else float(evaluate(low, names)),
+                                   None if high is None else float(evaluate(high, names)))
+            options = {"timeout": float(evaluate(step.get("timeout", 5.0), names)),
+                       "on_timeout": step.get("on_timeout", "continue")}
+            if options["on_timeout"] not in ("continue", "abort"):
+                raise ValueError('on_timeout は "continue" か "abort" にしてください')
+            self.steps.append(Step("wait_until", conditions, options, where))
+            return
+        if len(step) != 1:
+            raise ValueError(f"コマンドのステップはキーを1つだけにしてください: {sorted(step)}")
+        (name, args), = step.items()
+        args = args if isinstance(args, list) else [args]
+        self._add_command([name] + [evaluate(a, names) for a in args], where)
+
+    def _add_command(self, parts, where):
+        name, args = str(parts[0]), parts[1:]
+        if name not in SIMPLE_COMMANDS and name not in ARGUMENT_RANGES:
+            raise ValueError(f"知らないコマンドです: {name}")
+        ranges = ARGUMENT_RANGES.get(name, [])
+        if len(args) != len(ranges):
+            raise ValueError(f"{name} の引数は {len(ranges)} 個です（{len(args)} 個あります）")
+        values = [int(round(float(a))) for a in args]
+        for value, (low, high) in zip(values, ranges):
+            if not low <= value <= high:
+                raise ValueError(f"{name} の引数 {value} が範囲 {low}〜{high} の外です")
+        if name == "go" and max(abs(v) for v in values[:3]) < 20:
+            raise ValueError("go は x, y, z のどれかが 20 以上でないと動きません")
+        if name == "curve":
+            geometry = arc_geometry((0, 0, 0), tuple(values[0:3]), tuple(values[3:6]))
+            if geometry is None or not CURVE_MIN_RADIUS_CM <= geometry[0] <= CURVE_MAX_RADIUS_CM:
+                raise ValueError(f"curve の半径が {CURVE_MIN_RADIUS_CM}〜{CURVE_MAX_RADIUS_CM}cm の範囲にありません")
+        self.steps.append(Step("command", " ".join([name] + [str(v) for v in values]), {}, where))
+
+    def _check_sequence(self):
+        # 離陸前の移動、streamon 前の撮影、着陸し忘れを調べる
+        flying = streaming = False
+        for step in self.steps:
+            if step.kind == "capture" and not streaming:
+                self.problems.append((step.where, "streamon の前に capture しています"))
+            if step.kind != "command":
+                continue
+            name = command_type(step.value)
+            if name == "takeoff":
+                if flying:
+                    self.problems.append((step.where, "飛行中に takeoff しています"))
+                flying = True
+            elif name in ("land", "emergency"):
+                flying = False
+            elif name in ("streamon", "streamoff"):
+                streaming = name == "streamon"
+            elif name not in SIMPLE_COMMANDS and name != "speed" and not flying:
+                self.problems.append((step.where, f"離陸前に {name} しています"))
+        if flying:
+            self.problems.append(("steps", "land せずに終わっています"))
+
+    @property
+    def commands(self):
+        return [step.value for step in self.steps if step.kind == "command"]
+
+    def estimate(self):
+        """
+        所要時間と電池の消費を見積もって MissionEstimate を返します。
+
+        wait_until と settle つきの capture は timeout いっぱいまで待つとして数えます（最大の見積もり）。
+        """
+        speed = DEFAULT_SPEED_CM_S
+        total = flight = 0.0
+        flying = False
+        for step in self.steps:
+            if step.kind == "command":
+                name = command_type(step.value)
+                if name == "speed":
+                    speed = int(step.value.split()[1])
+                seconds = estimate_command_time(step.value, speed)
+                flying = flying or name == "takeoff"
+            elif step.kind == "capture":
+                seconds = step.options["timeout"] if step.options["settle"] else CAPTURE_ESTIMATE_S
+            elif step.kind == "wait":
+                seconds = step.value
+            else:
+                seconds = step.options["timeout"]
+            total += seconds
+            if flying:
+                flight += seconds
+            if step.kind == "command" and command_type(step.value) in ("land", "emergency"):
+                flying = False
+        return MissionEstimate(len(self.commands), flight, total, flight / BATTERY_FLIGHT_TIME_S * 100.0)
+
+    def print_plan(self, show=False):
+        estimate = self.estimate()
+        print(f"[MISSION] {self.name}: {len(self.steps)} ステップ / コマンド {estimate.commands} 個 / "
+              f"見積もり {estimate.total_time:.1f}秒 (飛行 {estimate.flight_time:.1f}秒) / 電池 {estimate.battery:.1f}%")
+        if show:
+            for step in self.steps:
+                print(f"  {step.kind:<10} {step.value}" + (f"  {step.options}" if step.options else ""))
+
+
+def _optimize(steps):
+    # 撮影や待ちの間で区切った移動のかたまりごとに planner で go / curve にまとめる
+    result, block = [], []
+
+    def flush():
+        if block:
+            where = block[0].where
+            result.extend(Step("command", command, {}, where) for command in optimize_commands([s.value for s in block]))
+            block.clear()
+
+    for step in steps:
+        if step.kind == "command":
+            block.append(step)
+        else:
+            flush()
+            result.append(step)
+    flush()
+    return result
+
+
+# --- 実行 ---
+
+class MissionRunner:
+    """
+    Mission を共通の TelloClient で実行します。
+
+    Tello の応答には番号がなく同時に1つのコマンドしか送れないので、コマンドは1つずつ順に送ります。
+    決め打ちの sleep は入れずに "ok" が返ったら次のコマンドを送り、撮影したフレームの保存だけは
+    FrameWriter の裏のスレッドに任せて次のコマンドの送信を待たせません。
+    コマンドが失敗したら、飛行中なら着陸させてから TelloError を送出します。
+
+    Args:
+        client (TelloClient): 送信に使うクライアント。省略時は get_client() を共有する。
+        telemetry (TelemetryRecorder): 指定するとコマンドと撮影を出来事としてテレメトリのログに残す。
+        video_options (dict): 映像の受信機に渡すデコードの設定（{"decode": "keyframes", "reduce": 2} など）。
+            撮影のときしか映像を使わないミッションでは、デコードを減らして CPU を空けられる。
+        verbose (bool): ログを出すかどうか。
+    """
+
+    def __init__(self, client=None, ip=TELLO_IP, port=TELLO_PORT, telemetry=None, video_options=None, verbose=True):
+        self.client = client if client is not None else get_client(ip, port, verbose=False)
+        self.telemetry = telemetry
+        self.video_options = video_options or {}
+        self.verbose = verbose
+        self._state = None
+        self._video = None
+        self._trigger = None
+        self._writer = None
+        self._connected = False
+
+    # 状態と映像は使うときに初めて起動する（映像には OpenCV が必要）
+    @property
+    def state(self):
+        if self._state is None:
+            from .state import get_state_listener
+            self._state = get_state_listener()
+        return self._state
+
+    def _capture(self, path, settle, timeout, since):
+        if self._video is None:
+            from .panorama.capture import FrameWriter
+            from .settle import SettleTrigger
+            from .video import get_video_receiver
+            self._video = get_video_receiver(verbose=self.verbose, **self.video_options)
+            self._writer = FrameWriter()
+            self._trigger = SettleTrigger(self._video, attitude=lambda: self.state.latest()[1], verbose=self.verbose)
+        if settle:
+            frame = self._trigger.wait(since=since, timeout=timeout)
+        else:
+            frame = self._video.wait_for_frame(newer_than=since, timeout=timeout)[0]
+        if frame is None:
+            print(f"[MISSION] {path}: フレームを取得できませんでした")
+            return
+        self._writer.write(path, frame)
+
+    def _wait_until(self, conditions, timeout):
+        deadline = time.time() + timeout
+        while True:
+            state = self.state.latest()[1]
+            if state and all(key in state and (low is None or state[key] >= low) and (high is None or state[key] <= high)
+                             for key, (low, high) in conditions.items()):
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            self.state.wait_for_update(min(remaining, 1.0))
+
+    def check_battery(self, mission):
+        """
+        電池の残量が見積もりの消費と予備（mission.reserve）に足りるかを返します。
+        """
+        response = self.client.send("battery?")
+        try:
+            battery = float(response)
+        except (TypeError, ValueError):
+            print(f"[MISSION] 電池の残量を取得できませんでした: {response}")
+            return True
+        needed = mission.estimate().battery + mission.reserve
+        if battery < needed:
+            print(f"[MISSION] 電池が足りません: 残り {battery:.0f}% / 必要 {needed:.0f}%（予備 {mission.reserve}% を含む）")
+            return False
+        return True
+
+    def run(self, mission):
+        """
+        ミッションを実行し、(経過時間[秒], 送ったコマンドの数) を返します。
+        """
+        if not self._connected:
+            if self.client.send("command") != "ok":
+                raise TelloError("Tello に接続できませんでした")
+            self._connected = True
+        if not self.check_battery(mission):
+            raise TelloError("電池が足りないのでミッションを中止しました")
+        if self.verbose:
+            mission.print_plan()
+        os.makedirs(mission.output_dir, exist_ok=True)
+        started = time.perf_counter()
+        last_ok = time.time()
+        flying = False
+        sent = 0
+        try:
+            for step in mission.steps:
+                if self.telemetry is not None:
+                    self.telemetry.mark(f"{step.kind} {step.value}")
+                if step.kind == "command":
+                    response = self.client.send(step.value)
+                    sent += 1
+                    name = command_type(step.value)
+                    if response != "ok":
+                        raise TelloError(f"{step.where}: コマンド '{step.value}' が失敗しました: {response}")
+                    last_ok = time.time()
+                    if name == "takeoff":
+                        flying = True
+                    elif name in ("land", "emergency"):
+                        flying = False
+                elif step.kind == "capture":
+                    self._capture(os.path.join(mission.output_dir, step.value), step.options["settle"],
+                                  step.options["timeout"], last_ok)
+                elif step.kind == "wait":
+                    time.sleep(step.value)
+                elif not self._wait_until(step.value, step.options["timeout"]):
+                    message = f"{step.where}: {step.options['timeout']:.1f}秒以内に {step.value} になりませんでした"
+                    if step.options["on_timeout"] == "abort":
+                        raise TelloError(message)
+                    print(f"[MISSION] {message}")
+        except BaseException:
+            if flying:
+                print("[MISSION] 中断したので着陸します")
+                self.client.send("land")
+            raise
+        finally:
+            if self._writer is not None:
+                self._writer.flush()
+        elapsed = time.perf_counter() - started
+        if self.verbose:
+            print(f"[MISSION] {mission.name}: 完了 {elapsed:.1f}秒 / コマンド {sent} 個 "
+                  f"(見積もり {mission.estimate().total_time:.1f}秒)")
+        return elapsed, sent
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def _run_files(runner, paths):
+    for path in paths:
+        try:
+            runner.run(load_mission(path))
+        except (MissionError, TelloError, OSError, RuntimeError, ValueError) as e:
+            print(f"[MISSION] {path}: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ミッションファイルを検査・実行します")
+    sub = parser.add_subparsers(dest="action", required=True)
+    check = sub.add_parser("check", help="検査して所要時間と電池の消費を見積もる（飛ばさない）")
+    check.add_argument("missions", nargs="+")
+    check.add_argument("--show", action="store_true", help="展開したステップを表示する")
+    run = sub.add_parser("run", help="ミッションのステップを1つずつ順に実行する")
+    run.add_argument("missions", nargs="+")
+    serve = sub.add_parser("serve", help="標準入力から1行に1つずつファイル名を受け取り、続けて実行する")
+    for command in (run, serve):
+        command.add_argument("--record", help="状態をテレメトリのログ（ディレクトリ）に記録する")
+        command.add_argument("--decode", choices=["all", "keyframes"], default="all",
+                             help="keyframes は H.264 のキーフレーム（約1秒に1枚）だけをデコードする（settle の判定は遅くなる）")
+        command.add_argument("--reduce", type=int, choices=[1, 2, 4, 8], default=1, help="撮影する画像を縦横 1/N にする")
+    args = parser.parse_args()
+
+    if args.action == "check":
+        failed = False
+        for path in args.missions:
+            try:
+                load_mission(path).print_plan(show=args.show)
+            except (MissionError, OSError, RuntimeError, ValueError) as e:
+                print(f"[MISSION] {path}: {e}")
+                failed = True
+        sys.exit(1 if failed else 0)
+
+    runner = MissionRunner(video_options={"decode": args.decode, "reduce": args.reduce})
+    if args.record:
+        from .telemetry import TelemetryRecorder
+        runner.telemetry = TelemetryRecorder(args.record, runner.state)
+    try:
+        if args.action == "run":
+            _run_files(runner, args.missions)
+        else:
+            print("[MISSION] ミッションファイルのパスを1行ずつ入力してください（Ctrl+D で終了）")
+            for line in sys.stdin:
+                if line.strip():
+                    _run_files(runner, [line.strip()])
+    finally:
+        runner.close()
+        if runner.telemetry is not None:
+            runner.telemetry.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+"""
+パノラマ合成（スティッチング）用のモジュール。OpenCV と NumPy が必要です。
+
+tellolib 本体（コマンド送信など）はこれらに依存しないので、
+パノラマを使わないスクリプトは OpenCV なしでも動きます。
+"""
@@ -0,0 +1,150 @@
+"""
+高さごとのパノラマ合成をプロセスプールで並列に行うバッチ処理。
+
+飛行スクリプトでは、ある高さの撮影が終わったら submit() で画像を渡してすぐ次の高さへ移動し、
+着陸後に results() でまとめて結果を受け取ります。合成は別プロセスで進むので機体を待たせません。
+
+撮影済みのフォルダをまとめて合成することもできます（CPU のコア数だけ並列に実行）:
+
+    python -m tellolib.panorama.batch 0619/mitome/panorama/4m 0619/mitome/panorama/5m \\
+        0619/kitano/panorama/2m --mode yaw --out panorama_out
+
+Windows ではワーカーがメインのスクリプトを読み込み直すため、
+呼び出し側のスクリプトは if __name__ == "__main__": の中で飛行させてください。
+"""
+import argparse
+import collections
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from .stitch import describe_status, stitch_images
+
+BatchResult = collections.namedtuple(
+    "BatchResult", ["label", "status", "output_path", "shape", "frames", "wait_time", "stitch_time"])
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def list_images(folder):
+    """
+    フォルダ内の画像のパスをファイル名順に返します。
+    """
+    return [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def _stitch_job(label, images, mode, options, output_path, submitted):
+    # ワーカープロセスで実行する。画像はパスでも配列でもよい
+    started = time.time()
+    frames = [cv2.imread(image) if isinstance(image, str) else image for image in images]
+    frames = [frame for frame in frames if frame is not None]
+    status, panorama = stitch_images(frames, mode=mode, **options)
+    shape = None
+    if status == cv2.Stitcher_OK and panorama is not None:
+        shape = panorama.shape
+        if output_path:
+            cv2.imwrite(output_path, panorama)
+    finished = time.time()
+    return BatchResult(label, status, output_path, shape, len(frames), started - submitted, finished - started)
+
+
+class PanoramaBatch:
+    """
+    パノラマ合成のジョブをプロセスプールに投げて、結果をあとでまとめて受け取ります。
+
+    Args:
+        mode (str): 合成方法（stitch_images の mode）。
+        workers (int): ワーカー数。省略時は CPU のコア数。
+        **options: stitch_images に渡す追加の引数。
+    """
+
+    def __init__(self, mode="yaw", workers=None, **options):
+        self.mode = mode
+        self.options = options
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = None
+        self._jobs = []  # (ラベル, Future)
+        self.started = time.perf_counter()
+
+    def submit(self, label, images, output_path=None, **options):
+        """
+        1組の画像の合成をバックグラウンドで開始します（すぐに戻る）。
+
+        Args:
+            label (str): 結果を区別するための名前（"2m" など）。
+            images (list): 画像のパスまたは画像（numpy.ndarray）のリスト。パスの方が受け渡しが軽い。
+            output_path (str): 合成したパノラマの保存先。
+            **options: このジョブだけに使う stitch_images の追加の引数。
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        merged = dict(self.options, **options)
+        future = self._executor.submit(_stitch_job, label, list(images), self.mode, merged, output_path, time.time())
+        self._jobs.append((label, future))
+        print(f"[BATCH] {label}: {len(images)} 枚の合成を開始しました")
+        return future
+
+    def submit_dir(self, label, folder, output_path=None, **options):
+        return self.submit(label, list_images(folder), output_path, **options)
+
+    def results(self):
+        """
+        全てのジョブの完了を待ち、投入した順に BatchResult のリストを返します。
+        """
+        results = []
+        for label, future in self._jobs:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"[BATCH] {label}: 合成中にエラーが発生しました: {e}")
+                results.append(BatchResult(label, None, None, None, 0, 0.0, 0.0))
+        self._jobs = []
+        return results
+
+    def print_results(self, results=None):
+        results = self.results() if results is None else results
+        print(f"[BATCH] {len(results)} 件の合成結果 (ワーカー {self.workers})")
+        for r in results:
+            if r.status == cv2.Stitcher_OK:
+                size = f"{r.shape[1]}x{r.shape[0]}"
+                where = f" -> {r.output_path}" if r.output_path else ""
+                print(f"  {r.label}: 成功 {size} ({r.frames}枚) 待ち {r.wait_time:.1f}秒 合成 {r.stitch_time:.1f}秒{where}")
+            elif r.status is None:
+                print(f"  {r.label}: エラー")
+            else:
+                print(f"  {r.label}: 失敗 {describe_status(r.status)} 合成 {r.stitch_time:.1f}秒")
+        print(f"  経過時間 {time.perf_counter() - self.started:.1f}秒")
+        return results
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="撮影済みの画像フォルダをまとめてパノラマにします")
+    parser.add_argument("folders", nargs="+", help="1つのパノラマになる画像のフォルダ（複数指定可）")
+    parser.add_argument("--mode", default="yaw", help="合成方法（opencv, yaw, stream など）")
+    parser.add_argument("--workers", type=int, default=None, help="ワーカー数（省略時は CPU のコア数）")
+    parser.add_argument("--out", default=".", help="出力先のフォルダ")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    with PanoramaBatch(mode=args.mode, workers=args.workers) as batch:
+        for folder in args.folders:
+            label = os.path.normpath(folder).replace(os.sep, "_")
+            batch.submit_dir(label, folder, os.path.join(args.out, f"{label}_panorama.jpg"))
+        batch.print_results()
+
+
+if __name__ == "__main__":
+    main()
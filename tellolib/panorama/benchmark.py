@@ -0,0 +1,310 @@
+"""
+リポジトリに入っている撮影済みの画像でパノラマ合成の時間とメモリを測るベンチマーク。
+
+各スクリプトの合成の入口（jointimg.create_panorama_from_images, kitano の create_panorama_from_dir,
+inaba/0619.py の take_picture の中の合成 stitch_panorama）と、stitch_images の全ての合成方法を
+画像のセットごとに1回ずつ新しいプロセスで実行し、時間・メモリの最大値・成否・出力の大きさを
+JSON Lines のファイルに追記します。同じファイルに実行を重ねると、前回からの変化を表に出します。
+
+    python -m tellolib.panorama.benchmark                      # 全部（数分かかる）
+    python -m tellolib.panorama.benchmark --modes yaw multires --entries --out bench.jsonl
+
+1行が1回の計測です:
+    {"run": "2026-10-18T12:00:00", "commit": "517a0d5", "entry": "stitch_images", "mode": "yaw",
+     "set": "0619/mitome/panorama/4m", "images": 12, "ok": true, "status": 0, "wall_time": 0.41,
+     "peak_rss": 123456789, "rss_delta": 2345678, "width": 4200, "height": 700, "error": null, ...}
+
+入口の関数は結果を cv2.imshow で表示するので、計測するプロセスの中だけ表示を無効にします。
+"""
+import argparse
+import contextlib
+import datetime
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import platform
+import queue as queue_module
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+
+from .batch import list_images
+from .stitch import MODES, stitch_images
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+# リポジトリに入っている撮影済みの画像（ROOT からの相対パス）
+IMAGE_SETS = (
+    "0619/mitome/panorama/4m",
+    "0619/mitome/panorama/5m",
+    "0619/kitano/panorama/2m",
+    "0619/inaba/panorama_images",
+)
+
+# 各スクリプトの合成の入口（ROOT からのパス, 関数名）
+ENTRIES = {
+    "create_panorama_from_images": ("0619/mitome/jointimg.py", "create_panorama_from_images"),
+    "create_panorama_from_dir": ("0619/kitano/panorama.py", "create_panorama_from_dir"),
+    "take_picture": ("0619/inaba/0619.py", "stitch_panorama"),
+}
+
+DEFAULT_OUTPUT = "panorama_benchmark.jsonl"
+CASE_TIMEOUT = 600.0   # 1回の計測の上限（秒）
+POLL_INTERVAL = 1.0    # 計測のプロセスが生きているかを確かめる間隔（秒）
+
+
+class ProcessFailed(RuntimeError):
+    """
+    計測のプロセスが結果を返さずに終了したか、時間内に終わらなかったときの例外。exitcode は終了コード。
+    """
+
+    def __init__(self, message, exitcode):
+        super().__init__(message)
+        self.exitcode = exitcode
+
+
+def peak_rss():
+    """
+    このプロセスのメモリ使用量の最大値（バイト）を返します。測れない環境では None。
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux は KB、macOS はバイト
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset  # Windows
+    except (ImportError, AttributeError):
+        return None
+
+
+def run_in_process(function, *args, timeout=CASE_TIMEOUT):
+    """
+    function(*args) を新しいプロセスで実行して戻り値を返します。
+
+    メモリの最大値はプロセスごとにしか測れないので、1回の計測ごとに新しいプロセスを使います。
+    プロセスが結果を返さずに終了したとき（OpenCV の中で落ちた、メモリが足りずに止められたなど）や
+    timeout 秒以内に終わらなかったときは ProcessFailed を送出します。
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_child, args=(queue, function, args))
+    process.start()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        try:
+            result = queue.get(timeout=POLL_INTERVAL)
+            break
+        except queue_module.Empty:
+            pass
+        if not process.is_alive():
+            # 終了の直前に送った結果がまだ届いていないこともあるので、もう1回だけ待つ
+            try:
+                result = queue.get(timeout=POLL_INTERVAL)
+                break
+            except queue_module.Empty:
+                process.join()
+                raise ProcessFailed(f"計測のプロセスが結果を返さずに終了しました（終了コード {process.exitcode}）",
+                                    process.exitcode) from None
+        if deadline is not None and time.monotonic() > deadline:
+            process.terminate()
+            process.join()
+            raise ProcessFailed(f"計測が {timeout:.0f}秒以内に終わりませんでした（終了コード {process.exitcode}）",
+                                process.exitcode)
+    process.join()
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+
+def _child(queue, function, args):
+    try:
+        queue.put(function(*args))
+    except Exception as e:
+        queue.put(e)
+
+
+def _load_entry(entry):
+    # スクリプトをモジュールとして読み込む（0619.py のように数字で始まる名前もあるのでパスから読む）
+    path, name = ENTRIES[entry]
+    spec = importlib.util.spec_from_file_location(f"benchmark_{entry}", os.path.join(ROOT, path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, name)
+
+
+def _disable_windows():
+    # 入口の関数は結果を表示して waitKey(0) で止まるので、計測するプロセスでは何もしないようにする
+    cv2.imshow = lambda *args, **kwargs: None
+    cv2.waitKey = lambda *args, **kwargs: -1
+    cv2.destroyAllWindows = lambda *args, **kwargs: None
+
+
+def _empty_record(entry, mode):
+    return {"entry": entry, "mode": mode, "ok": False, "status": None, "wall_time": None,
+            "peak_rss": None, "rss_delta": None, "width": None, "height": None, "error": None, "exitcode": None}
+
+
+def _measure(entry, mode, folder):
+    # 計測するプロセスで実行する。時間とメモリは画像の読み込みを除いた合成の部分だけを測る
+    record = _empty_record(entry, mode)
+    paths = list_images(folder)
+    record["images"] = len(paths)
+    workdir = tempfile.mkdtemp(prefix="panorama-bench-")
+    output_path = os.path.join(workdir, "panorama.jpg")
+    cwd = os.getcwd()
+    try:
+        if entry == "stitch_images":
+            run = _prepare_stitch_images(mode, paths, workdir)
+        else:
+            _disable_windows()
+            run, output_path = _prepare_entry(entry, folder, paths, workdir)
+        before = peak_rss()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            status, panorama = run()
+        record["wall_time"] = time.perf_counter() - started
+        record["peak_rss"] = peak_rss()
+        if before is not None and record["peak_rss"] is not None:
+            record["rss_delta"] = record["peak_rss"] - before
+        if panorama is None and os.path.exists(output_path):
+            panorama = cv2.imread(output_path)
+            status = cv2.Stitcher_OK if status is None else status
+        record["status"] = status
+        record["ok"] = status == cv2.Stitcher_OK and panorama is not None
+        if panorama is not None:
+            record["height"], record["width"] = panorama.shape[:2]
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return record
+
+
+def _prepare_stitch_images(mode, paths, workdir):
+    images = [cv2.imread(path) for path in paths]
+    images = [image for image in images if image is not None]
+    options = {}
+    if mode in ("features", "sequential"):
+        options["cache_dir"] = os.path.join(workdir, "feature_cache")  # 毎回キャッシュなしの状態で測る
+    return lambda: stitch_images(images, mode=mode, **options)
+
+
+def _prepare_entry(entry, folder, paths, workdir):
+    function = _load_entry(entry)
+    output_path = os.path.join(workdir, "panorama.jpg")
+    if entry == "create_panorama_from_images":
+        return lambda: (function(folder, output_path), None), output_path
+    if entry == "create_panorama_from_dir":
+        # カレントディレクトリの panorama/<ラベル> を読み、panorama_<ラベル>.jpg に保存する関数なので、作業用のフォルダに写す
+        label = os.path.basename(os.path.normpath(folder))
+        shutil.copytree(folder, os.path.join(workdir, "panorama", label))
+        os.chdir(workdir)
+        return lambda: (function(label), None), os.path.join(workdir, f"panorama_{label}.jpg")
+    images = [cv2.imread(path) for path in paths]
+    images = [image for image in images if image is not None]
+    return lambda: (function(0, images, output_path), None), output_path
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_results(path):
+    """
+    結果のファイルを読み込み、記録のリストを返します（ファイルがなければ空のリスト）。
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run_benchmark(sets=IMAGE_SETS, modes=tuple(MODES), entries=tuple(ENTRIES), output_path=DEFAULT_OUTPUT,
+                  verbose=True, timeout=CASE_TIMEOUT):
+    """
+    画像のセットごとに、入口の関数（既定の合成方法）と stitch_images の各合成方法を計測し、
+    結果を output_path に1行ずつ追記します。
+
+    Args:
+        sets (tuple): 画像のフォルダ（ROOT からの相対パスか絶対パス）。
+        modes (tuple): stitch_images で計測する合成方法。
+        entries (tuple): 計測する入口の関数（ENTRIES のキー）。
+        output_path (str): 結果を追記する JSON Lines のファイル。
+        timeout (float): 1回の計測の上限（秒）。超えた計測や途中で落ちた計測は、終了コードとともに失敗として記録する。
+    Returns:
+        list: 今回の記録のリスト。
+    """
+    previous = {(r["entry"], r["mode"], r["set"]): r for r in load_results(output_path)}
+    common = {
+        "run": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+    cases = [(entry, None) for entry in entries] + [("stitch_images", mode) for mode in modes]
+    records = []
+    if verbose:
+        print(f"{'セット':<28} {'入口':<28} {'方法':<10} {'結果':<6} {'時間':>8} {'前回比':>7} {'メモリ':>8}  出力")
+    for name in sets:
+        folder = name if os.path.isabs(name) else os.path.join(ROOT, name)
+        for entry, mode in cases:
+            record = dict(common, set=name)
+            try:
+                record.update(run_in_process(_measure, entry, mode, folder, timeout=timeout))
+            except ProcessFailed as e:
+                record.update(_empty_record(entry, mode), error=str(e), exitcode=e.exitcode)
+            records.append(record)
+            with open(output_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if verbose:
+                _print_record(record, previous.get((entry, mode, name)))
+    return records
+
+
+def _print_record(record, previous):
+    if record["error"]:
+        result = "エラー"
+    else:
+        result = "成功" if record["ok"] else f"失敗{record['status'] if record['status'] is not None else ''}"
+    wall = "-" if record["wall_time"] is None else f"{record['wall_time']:.2f}秒"
+    ratio = "-"
+    if previous and previous.get("wall_time") and record["wall_time"] is not None:
+        ratio = f"{record['wall_time'] / previous['wall_time']:.2f}x"
+    memory = "-" if record["rss_delta"] is None else f"{record['rss_delta'] / 2 ** 20:.0f}MB"
+    size = "-" if record["width"] is None else f"{record['width']}x{record['height']}"
+    print(f"{record['set']:<30} {record['entry']:<28} {record['mode'] or '-':<10} {result:<6} {wall:>8} "
+          f"{ratio:>7} {memory:>8}  {size}")
+    if record["error"]:
+        print(f"    {record['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="撮影済みの画像でパノラマ合成の時間とメモリを測ります")
+    parser.add_argument("--sets", nargs="+", default=list(IMAGE_SETS), help="画像のフォルダ")
+    parser.add_argument("--modes", nargs="*", default=list(MODES), help=f"合成方法（{', '.join(MODES)}）")
+    parser.add_argument("--entries", nargs="*", default=list(ENTRIES), help=f"入口の関数（{', '.join(ENTRIES)}）")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="結果を追記する JSON Lines のファイル")
+    parser.add_argument("--timeout", type=float, default=CASE_TIMEOUT, help="1回の計測の上限（秒）")
+    args = parser.parse_args()
+    run_benchmark(args.sets, args.modes, args.entries, args.out, timeout=args.timeout)
+
+
+if __name__ == "__main__":
+    main()
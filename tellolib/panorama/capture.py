@@ -0,0 +1,219 @@
+"""
+撮影したフレームをメモリに置いたまま合成に回すためのキャプチャ用バッファ。
+
+これまでのスクリプトは撮影のたびに cv2.imwrite で JPEG に保存し、合成の前に同じファイルを
+cv2.imread で読み直していました（1つの高さで12回ずつの圧縮と展開）。
+FrameRing はあらかじめ確保した NumPy の配列にフレームをコピーして、そのまま合成に渡します。
+ディスクへの保存は FrameWriter のスレッドが裏で行うので、撮影と回転を待たせません。
+
+    writer = FrameWriter()
+    ring = FrameRing(12, writer=writer)
+    for i in range(12):
+        ring.push(frame_read.frame, path=f"img_{i:02d}.jpg")
+        ...
+    status, pano = stitch_images(ring.frames(), mode="yaw")
+    writer.close()  # 保存が終わるのを待つ
+"""
+import atexit
+import queue
+import threading
+import time
+import weakref
+
+import cv2
+import numpy as np
+
+
+# 閉じていない FrameWriter。atexit への登録はモジュールで1回だけにし、閉じたものはここから外す
+_open_writers = weakref.WeakSet()
+
+
+def _close_writers():
+    # 閉じ忘れても、終了時に予約済みの保存を済ませる
+    for writer in list(_open_writers):
+        writer.close()
+
+
+atexit.register(_close_writers)
+
+
+class FrameWriter:
+    """
+    フレームをバックグラウンドのスレッドで画像ファイルに保存します。
+
+    Args:
+        params (list): cv2.imwrite に渡す保存パラメータ（JPEG の品質など）。
+        verbose (bool): 保存のたびにログを出すかどうか。
+    """
+
+    def __init__(self, params=None, verbose=False):
+        self.params = params or []
+        self.verbose = verbose
+        self.written = 0
+        self.failed = 0
+        self.busy_time = 0.0  # 保存にかかった時間の合計[秒]
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        _open_writers.add(self)
+
+    def write(self, path, frame):
+        """
+        保存を予約してすぐに戻ります。保存が終わるとセットされる threading.Event を返します。
+
+        frame はコピーしないので、保存が終わるまで書き換えないでください（FrameRing はこれを待ちます）。
+        close() の後に呼ぶと RuntimeError を送出します（保存するスレッドがもういないので、待っても終わらない）。
+        """
+        done = threading.Event()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"閉じた FrameWriter には保存を予約できません: {path}")
+            self._queue.put((path, frame, done))
+        return done
+
+    def pending(self):
+        return self._queue.unfinished_tasks
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            path, frame, done = item
+            started = time.perf_counter()
+            try:
+                if cv2.imwrite(path, frame, self.params):
+                    self.written += 1
+                    if self.verbose:
+                        print(f"[WRITE] 保存しました: {path}")
+                else:
+                    self.failed += 1
+                    print(f"[WRITE] 保存に失敗しました: {path}")
+            except Exception as e:
+                self.failed += 1
+                print(f"[WRITE] 保存中にエラーが発生しました: {path} ({e})")
+            finally:
+                self.busy_time += time.perf_counter() - started
+                done.set()
+                self._queue.task_done()
+
+    def flush(self):
+        """
+        予約済みの保存が全て終わるまで待ちます。
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        残りの保存を終えてからスレッドを止めます。
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+        _open_writers.discard(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class FrameRing:
+    """
+    あらかじめ確保した配列にフレームを順に保持するリングバッファ。
+
+    配列は最初のフレームの大きさで一度だけ確保し、以降は np.copyto で上書きするだけなので
+    撮影ごとのメモリ確保がありません。容量を超えると古いものから上書きされます。
+    ストリーム開始直後の小さな黒いフレームなどで確保した後に大きなフレームが来た場合は、
+    その大きさで確保し直します。
+
+    Args:
+        capacity (int): 保持するフレームの数（1回転分の枚数にする）。
+        shape (tuple): フレームの形 (高さ, 幅, 3)。省略時は最初のフレームに合わせる。
+        writer (FrameWriter): 指定すると push(frame, path) でディスクへの保存も予約する。
+    """
+
+    def __init__(self, capacity, shape=None, writer=None):
+        self.capacity = capacity
+        self.writer = writer
+        self._buffer = None
+        self._pending = [None] * capacity  # 各スロットの保存完了を表す Event
+        self._next = 0
+        self._count = 0
+        if shape is not None:
+            self._allocate(tuple(shape))
+
+    def _allocate(self, shape):
+        self._buffer = np.empty((self.capacity,) + shape, dtype=np.uint8)
+
+    def _reallocate(self, shape):
+        # 保存中のスロットを待ってから、保持しているフレームを新しい大きさに拡大して移す
+        old = self._buffer
+        self._allocate(shape)
+        for slot in range(self.capacity):
+            if self._pending[slot] is not None:
+                self._pending[slot].wait()
+                self._pending[slot] = None
+            cv2.resize(old[slot], (shape[1], shape[0]), dst=self._buffer[slot])
+
+    @property
+    def shape(self):
+        return None if self._buffer is None else self._buffer.shape[1:]
+
+    def __len__(self):
+        return self._count
+
+    def push(self, frame, path=None):
+        """
+        フレームをバッファにコピーして、その配列（バッファのビュー）を返します。
+
+        バッファより小さいフレームはバッファの大きさに拡大します。
+        path を指定すると writer でのファイル保存も予約します。
+        """
+        if frame is None:
+            return None
+        if self._buffer is None:
+            self._allocate(frame.shape)
+        elif frame.shape[0] * frame.shape[1] > self.shape[0] * self.shape[1]:
+            self._reallocate(frame.shape)
+        slot = self._next
+        # 上書きする前に、このスロットの保存が終わっていることを確認する
+        if self._pending[slot] is not None:
+            self._pending[slot].wait()
+            self._pending[slot] = None
+        target = self._buffer[slot]
+        if frame.shape != target.shape:
+            frame = cv2.resize(frame, (target.shape[1], target.shape[0]), interpolation=cv2.INTER_AREA)
+        np.copyto(target, frame)
+        if path is not None and self.writer is not None:
+            self._pending[slot] = self.writer.write(path, target)
+        self._next = (slot + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+        return target
+
+    def frames(self, copy=False):
+        """
+        保持しているフレームを古い順に返します。
+
+        既定ではバッファのビューを返すので、次の push で上書きされる前に使い終えてください。
+        別プロセスに渡す場合など、あとまで残す必要があるときは copy=True にします。
+        """
+        if self._count == 0:
+            return []
+        start = (self._next - self._count) % self.capacity
+        slots = [(start + i) % self.capacity for i in range(self._count)]
+        return [self._buffer[s].copy() if copy else self._buffer[s] for s in slots]
+
+    def clear(self):
+        """
+        中身を空にします（配列は確保したまま再利用する）。
+        """
+        self._next = 0
+        self._count = 0
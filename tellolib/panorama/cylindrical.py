@@ -0,0 +1,203 @@
+"""
+円筒投影（cylindrical projection）。
+
+機体がその場で回転して撮った画像は、円筒面に投影すると隣同士が平行移動だけでつながるので、
+ホモグラフィを推定しなくても位置合わせができます。
+"""
+import functools
+
+import cv2
+import numpy as np
+
+# 焦点距離と画像の幅の比。Tello の 960x720 の映像では約 0.95（リポジトリの撮影画像の
+# 30度ごとのずれから推定。カタログ値の対角 82.6度は静止画の画角で、映像はそれより狭い）
+TELLO_FOCAL_RATIO = 0.95
+
+
+def focal_length(width, focal_ratio=TELLO_FOCAL_RATIO):
+    return focal_ratio * width
+
+
+@functools.lru_cache(maxsize=16)
+def cylindrical_maps(width, height, focal):
+    """
+    cv2.remap 用の変換テーブル（円筒面上の座標 -> 元画像の座標）を返します。
+    同じ大きさの画像には同じテーブルを使い回すのでキャッシュします。
+
+    Returns:
+        tuple: (map_x, map_y, mask)。mask は元画像の範囲内に対応する画素が 255。
+    """
+    xs = np.arange(width, dtype=np.float64) - width / 2
+    ys = np.arange(height, dtype=np.float64) - height / 2
+    theta = xs / focal
+    map_x = np.broadcast_to(focal * np.tan(theta) + width / 2, (height, width))
+    map_y = ys[:, None] / np.cos(theta)[None, :] + height / 2
+    map_x = np.ascontiguousarray(map_x, dtype=np.float32)
+    map_y = np.ascontiguousarray(map_y, dtype=np.float32)
+    mask = ((map_x >= 0) & (map_x <= width - 1) & (map_y >= 0) & (map_y <= height - 1)).astype(np.uint8) * 255
+    for array in (map_x, map_y, mask):
+        array.setflags(write=False)
+    return map_x, map_y, mask
+
+
+def warp_cylindrical(image, focal=None):
+    """
+    画像を円筒面に投影します。
+
+    Args:
+        image (numpy.ndarray): 入力画像。
+        focal (float): 焦点距離（ピクセル）。省略時は TELLO_FOCAL_RATIO から求める。
+    Returns:
+        tuple: (投影した画像, mask)
+    """
+    height, width = image.shape[:2]
+    if focal is None:
+        focal = focal_length(width)
+    map_x, map_y, mask = cylindrical_maps(width, height, float(focal))
+    warped = cv2.remap(image, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+    return warped, mask
+
+
+@functools.lru_cache(maxsize=16)
+def _feather_weights(width, height, focal):
+    # 画像の端ほど小さくなる重み（継ぎ目をなめらかにするため）
+    _, _, mask = cylindrical_maps(width, height, focal)
+    weights = cv2.distanceTransform(mask, cv2.DIST_L2, 3).astype(np.float32)
+    weights /= max(float(weights.max()), 1.0)
+    weights.setflags(write=False)
+    return weights
+
+
+def feather_weights(width, height, focal):
+    return _feather_weights(width, height, float(focal))
+
+
+def composite(warped_frames, positions, focal):
+    """
+    円筒面に投影済みの画像を、指定した位置（左上, ピクセル）に重み付きで重ねます。
+
+    Args:
+        warped_frames (list): 同じ大きさの投影済み画像のリスト。
+        positions (list): 各画像の (x, y)。
+        focal (float): 投影に使った焦点距離（重みの計算に使う）。
+    Returns:
+        numpy.ndarray: 合成した画像（重なりのない余白は切り取る）。
+    """
+    height, width = warped_frames[0].shape[:2]
+    weights = feather_weights(width, height, focal)
+    positions = np.round(np.asarray(positions, dtype=np.float64)).astype(int)
+    positions -= positions.min(axis=0)
+    canvas_w, canvas_h = positions.max(axis=0) + (width, height)
+
+    total = np.zeros((canvas_h, canvas_w, 3), np.float32)
+    weight_sum = np.zeros((canvas_h, canvas_w), np.float32)
+    for frame, (x, y) in zip(warped_frames, positions):
+        region = (slice(y, y + height), slice(x, x + width))
+        total[region] += frame.astype(np.float32) * weights[..., None]
+        weight_sum[region] += weights
+
+    covered = weight_sum > 0
+    rows = np.flatnonzero(covered.any(axis=1))
+    cols = np.flatnonzero(covered.any(axis=0))
+    total = total[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    weight_sum = weight_sum[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    return np.clip(total / np.maximum(weight_sum, 1e-6)[..., None], 0, 255).astype(np.uint8)
+
+
+def refine_shift(previous, current, prior, max_residual=0.15, min_response=0.1):
+    """
+    隣り合う2枚の投影済み画像（グレースケール）の横方向のずれを、
+    予測値 prior のまわりだけ位相相関で補正します。
+
+    重なっている帯（previous の右側と current の左側）だけを比べるので、
+    全体の特徴点マッチングよりはるかに速く、特徴の少ない壁や床でも動きます。
+
+    Returns:
+        tuple: ((dx, dy), 信頼度)。補正できなければ ((prior, 0), 0.0)。
+    """
+    height, width = previous.shape[:2]
+    dx = int(round(prior))
+    overlap = width - dx
+    if dx <= 0 or overlap < width * 0.1:
+        return (float(prior), 0.0), 0.0
+    top, bottom = int(height * 0.15), int(height * 0.85)
+    a = np.ascontiguousarray(previous[top:bottom, dx:width], dtype=np.float32)
+    b = np.ascontiguousarray(current[top:bottom, 0:overlap], dtype=np.float32)
+    window = cv2.createHanningWindow((a.shape[1], a.shape[0]), cv2.CV_32F)
+    (sx, sy), response = cv2.phaseCorrelate(a, b, window)
+    if response < min_response or abs(sx) > overlap * max_residual or abs(sy) > height * max_residual:
+        return (float(prior), 0.0), 0.0
+    return (dx - sx, -sy), float(response)
+
+
+def stitch_cylindrical(images, yaws_deg=None, step_deg=None, focal_ratio=TELLO_FOCAL_RATIO,
+                       refine=True, work_scale=0.25, full_circle=True, verbose=False):
+    """
+    機体の向き（yaw）が分かっている画像を、特徴点マッチングなしで円筒パノラマにします。
+
+    各画像の横位置は yaw から決め（焦点距離 × 角度）、refine=True なら隣同士の重なりを
+    縮小画像の位相相関で少しだけ補正します。円筒投影の変換テーブルは画像の大きさごとに
+    1度だけ作って使い回します。
+
+    Args:
+        images (list): 撮影順の画像。真っ黒な画像や None は飛ばす（yaw の割り当ては変えない）。
+        yaws_deg (list): 各画像を撮ったときの yaw（度）。テレメトリの値があればそれを渡す。
+            撮れなかった向きを飛ばして images を詰めた場合は、残った画像の向きを渡す（i 番目なら i × 回転角度）。
+        step_deg (float): yaws_deg がない場合の1枚ごとの回転角度。省略時は 360 / 枚数
+            （1枚も欠けずに1周撮れた場合にだけ正しい）。
+        focal_ratio (float): 焦点距離と画像の幅の比。
+        refine (bool): 位相相関で位置を補正するかどうか。
+        work_scale (float): 補正に使う縮小画像の倍率。
+        full_circle (bool): 1周分以上撮れていれば、1周分の幅で切り出す。
+    Returns:
+        tuple: (status, panorama)。status は cv2.Stitcher と同じ値。
+    """
+    if yaws_deg is None:
+        step = step_deg if step_deg is not None else 360.0 / max(len(images), 1)
+        yaws_deg = [i * step for i in range(len(images))]
+    valid = [(yaw, image) for yaw, image in zip(yaws_deg, images)
+             if image is not None and float(image.std()) >= 2.0]
+    if len(valid) < 2:
+        return cv2.Stitcher_ERR_NEED_MORE_IMGS, None
+
+    size = (valid[0][1].shape[1], valid[0][1].shape[0])
+    for yaw, image in valid[1:]:
+        if image.shape[0] > size[1]:
+            size = (image.shape[1], image.shape[0])
+    focal = focal_ratio * size[0]
+
+    warped = []
+    small = []
+    for _, image in valid:
+        if (image.shape[1], image.shape[0]) != size:
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        frame, _ = warp_cylindrical(image, focal)
+        warped.append(frame)
+        if refine:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            small.append(cv2.resize(gray, None, fx=work_scale, fy=work_scale, interpolation=cv2.INTER_AREA))
+
+    # yaw は時計回りが正（cw で増える）なので、そのまま右方向の位置になる
+    yaws = np.unwrap(np.radians([yaw for yaw, _ in valid]))
+    positions = [(0.0, 0.0)]
+    for i in range(1, len(valid)):
+        prior = focal * (yaws[i] - yaws[i - 1])
+        shift, response = (prior, 0.0), 0.0
+        if refine:
+            (sx, sy), response = refine_shift(small[i - 1], small[i], prior * work_scale)
+            shift = (sx / work_scale, sy / work_scale) if response else (prior, 0.0)
+        positions.append((positions[-1][0] + shift[0], positions[-1][1] + shift[1]))
+        if verbose:
+            print(f"[STITCH] {i}: yaw {np.degrees(yaws[i]):.0f}° -> x {positions[-1][0]:.0f} (相関 {response:.2f})")
+
+    panorama = composite(warped, positions, focal)
+
+    if full_circle:
+        # 実際のずれから1周分の幅を求め、1枚目の中心から1周分を切り出す
+        span = yaws[-1] - yaws[0]
+        if span > 0:
+            circumference = int(round((positions[-1][0] - positions[0][0]) / span * 2 * np.pi))
+            start = int(round(size[0] / 2 - min(p[0] for p in positions)))
+            if start + circumference <= panorama.shape[1]:
+                panorama = panorama[:, start:start + circumference]
+    return cv2.Stitcher_OK, panorama
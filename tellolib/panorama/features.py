@@ -0,0 +1,485 @@
+"""
+特徴点と照合結果をディスクにキャッシュする、cv2.Stitcher と同じ手順のパノラマ合成。
+
+cv2.Stitcher は実行のたびに全ての画像の特徴点を検出し直し、全ての組を照合し直します。
+stitch_features は OpenCV の stitching_detailed と同じ手順（特徴点 -> 照合 -> カメラ推定 ->
+バンドル調整 -> 投影 -> 露出補正 -> 継ぎ目 -> ブレンド）を cv2.detail で組み立て、
+最初の2段の結果を FeatureCache に保存します。キャッシュは画像の内容のハッシュで引くので、
+同じ画像を投影方法やブレンド方法を変えて合成し直すときは検出と照合を丸ごと省けます。
+
+    status, pano = stitch_images(images, mode="features", cache_dir="feature_cache",
+                                 projection="spherical", blend="feather")
+
+キャッシュの形式（cache_dir の中）:
+    <画像のハッシュ>-<検出の設定>.kp.npy    特徴点 (N, 6) float32: x, y, size, angle, response, octave
+    <画像のハッシュ>-<検出の設定>.desc.npy  特徴量 (N, 32) uint8（np.load の mmap_mode で読む）
+    <画像1>-<画像2>-<照合の設定>.match.npz  照合結果（ホモグラフィ, 一致点, インライア）
+"""
+import hashlib
+import os
+import time
+
+import cv2
+import numpy as np
+
+from .cylindrical import TELLO_FOCAL_RATIO
+from .stream import is_blank
+
+# 処理ごとの解像度（メガピクセル）。cv2.Stitcher の PANORAMA モードの既定値と同じ
+WORK_MEGAPIX = 0.6
+SEAM_MEGAPIX = 0.1
+
+# 平面（plane）は360度では画像が無限に広がるので使わない
+PROJECTIONS = ("cylindrical", "spherical", "mercator")
+BLENDS = ("multiband", "feather", "none")
+
+
+def image_hash(image):
+    """
+    画像の内容（形と画素値）のハッシュを返します。
+    """
+    digest = hashlib.sha1(str(image.shape).encode("ascii"))
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()[:20]
+
+
+def _save_npy(path, array):
+    # 途中で止まっても壊れたファイルが残らないよう、一時ファイルに書いてから置き換える
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        np.save(f, array)
+    os.replace(temporary, path)
+
+
+class FeatureCache:
+    """
+    特徴点と照合結果をディスクに保存し、次回以降はそれを読み込みます。
+
+    Args:
+        directory (str): キャッシュを置くフォルダ。None ならメモリ上にだけ保持する（その実行の間だけ有効）。
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._memory = {}
+        self.feature_hits = 0
+        self.feature_misses = 0
+        self.match_hits = 0
+        self.match_misses = 0
+
+    def _path(self, name):
+        return os.path.join(self.directory, name) if self.directory else None
+
+    # --- 特徴点 ---
+
+    def features(self, image, key, finder):
+        """
+        画像の特徴点を返します（cv2.detail.ImageFeatures）。キャッシュになければ検出して保存する。
+
+        Args:
+            image (numpy.ndarray): 検出に使う（縮小済みの）画像。
+            key (str): 画像のハッシュと検出の設定を合わせたキー。
+            finder: cv2.ORB_create() などの検出器。
+        """
+        cached = self._load_features(key)
+        if cached is not None:
+            self.feature_hits += 1
+            keypoints, descriptors = cached
+        else:
+            self.feature_misses += 1
+            found = cv2.detail.computeImageFeatures2(finder, image)
+            keypoints = np.float32([(k.pt[0], k.pt[1], k.size, k.angle, k.response, k.octave)
+                                    for k in found.keypoints]).reshape(-1, 6)
+            descriptors = found.descriptors.get() if isinstance(found.descriptors, cv2.UMat) else found.descriptors
+            descriptors = np.zeros((0, 32), np.uint8) if descriptors is None else descriptors
+            self._store_features(key, keypoints, descriptors)
+
+        features = cv2.detail.ImageFeatures()
+        features.img_size = (image.shape[1], image.shape[0])
+        features.keypoints = tuple(cv2.KeyPoint(float(x), float(y), float(size), float(angle), float(response), int(octave))
+                                   for x, y, size, angle, response, octave in keypoints)
+        features.descriptors = cv2.UMat(np.ascontiguousarray(descriptors))
+        return features
+
+    def _load_features(self, key):
+        if key in self._memory:
+            return self._memory[key]
+        if not self.directory:
+            return None
+        kp_path, desc_path = self._path(key + ".kp.npy"), self._path(key + ".desc.npy")
+        if not (os.path.exists(kp_path) and os.path.exists(desc_path)):
+            return None
+        return np.load(kp_path, mmap_mode="r"), np.load(desc_path, mmap_mode="r")
+
+    def _store_features(self, key, keypoints, descriptors):
+        self._memory[key] = (keypoints, descriptors)
+        if self.directory:
+            _save_npy(self._path(key + ".kp.npy"), keypoints)
+            _save_npy(self._path(key + ".desc.npy"), descriptors)
+
+    # --- 照合 ---
+
+    def match(self, key, features1, features2, matcher):
+        """
+        2枚の特徴点の照合結果を (ホモグラフィ, 一致点 (M, 3), インライアのマスク, インライア数, 信頼度) で返します。
+        """
+        cached = self._load_match(key)
+        if cached is not None:
+            self.match_hits += 1
+            return cached
+        self.match_misses += 1
+        info = matcher.apply(features1, features2)
+        H = np.zeros((0, 0)) if info.H is None or not np.size(info.H) else np.float64(info.H)
+        matches = np.float32([(m.queryIdx, m.trainIdx, m.distance) for m in info.matches]).reshape(-1, 3)
+        mask = np.uint8(info.inliers_mask).ravel() if info.inliers_mask is not None else np.zeros(0, np.uint8)
+        result = (H, matches, mask, int(info.num_inliers), float(info.confidence))
+        self._memory[key] = result
+        if self.directory:
+            temporary = self._path(key + ".match.tmp.npz")
+            np.savez(temporary, H=H, matches=matches, mask=mask,
+                     info=np.float64([result[3], result[4]]))
+            os.replace(temporary, self._path(key + ".match.npz"))
+        return result
+
+    def _load_match(self, key):
+        if key in self._memory:
+            return self._memory[key]
+        path = self._path(key + ".match.npz")
+        if not path or not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return (data["H"], data["matches"], data["mask"], int(data["info"][0]), float(data["info"][1]))
+
+    def print_stats(self):
+        print(f"[CACHE] 特徴点 {self.feature_hits}/{self.feature_hits + self.feature_misses} 件, "
+              f"照合 {self.match_hits}/{self.match_hits + self.match_misses} 件をキャッシュから読み込みました")
+
+
+def _matches_info(src, dst, result, reverse=False):
+    # キャッシュの照合結果から cv2.detail.MatchesInfo を作る（reverse なら向きを逆にする）
+    H, matches, mask, num_inliers, confidence = result
+    info = cv2.detail.MatchesInfo()
+    info.src_img_idx, info.dst_img_idx = src, dst
+    if H.size:
+        info.H = np.linalg.inv(H) if reverse else H
+    if reverse:
+        info.matches = tuple(cv2.DMatch(int(t), int(q), float(d)) for q, t, d in matches)
+    else:
+        info.matches = tuple(cv2.DMatch(int(q), int(t), float(d)) for q, t, d in matches)
+    info.inliers_mask = np.uint8(mask)
+    info.num_inliers = num_inliers
+    info.confidence = confidence
+    return info
+
+
+def match_pairs(count, pairs="all", loop=True):
+    """
+    照合する画像の組 (i, j)（i < j）のリストを返します。
+
+    Args:
+        pairs (str): "all" は全ての組（cv2.Stitcher と同じ。枚数の2乗に比例）。
+            "sequential" は撮影順に隣り合う組だけ（枚数に比例）。機体がその場で一方向に回転して
+            撮った画像なら隣同士しか重ならないので、離れた組の誤った一致も入らない。
+        loop (bool): "sequential" で最後と最初の組（1周して戻ってきたところ）も照合するかどうか。
+    """
+    if pairs == "all":
+        return [(i, j) for i in range(count) for j in range(i + 1, count)]
+    if pairs == "sequential":
+        neighbours = [(i, i + 1) for i in range(count - 1)]
+        if loop and count > 2:
+            neighbours.append((0, count - 1))
+        return neighbours
+    raise ValueError(f"不明な照合方法です: {pairs}")
+
+
+def _pairwise_matches(keys, features, pairs, cache, matcher, match_key):
+    count = len(features)
+    empty = cv2.detail.MatchesInfo()
+    empty.src_img_idx = empty.dst_img_idx = -1
+    table = [empty] * (count * count)
+    for i, j in pairs:
+        result = cache.match(f"{keys[i]}-{keys[j]}-{match_key}", features[i], features[j], matcher)
+        table[i * count + j] = _matches_info(i, j, result)
+        table[j * count + i] = _matches_info(j, i, result, reverse=True)
+    return table
+
+
+def _subset(features, table, indices):
+    # 一番大きくつながった画像だけを残し、番号を振り直す
+    count = len(features)
+    kept = [features[i] for i in indices]
+    for new, feature in enumerate(kept):
+        feature.img_idx = new
+    sub = []
+    for a, i in enumerate(indices):
+        for b, j in enumerate(indices):
+            info = table[i * count + j]
+            if info.src_img_idx >= 0:
+                info.src_img_idx, info.dst_img_idx = a, b
+            sub.append(info)
+    return kept, sub
+
+
+class Registration:
+    """
+    register_features の結果（位置合わせ・露出補正・継ぎ目）。compose_panorama に渡すと、
+    同じ位置合わせのまま好きな解像度でパノラマを作れます。
+
+    Attributes:
+        images (list): 合成に使う（つながった）元の解像度の画像。
+        cameras (list): 各画像の (焦点距離, 縦横比, ppx, ppy, 回転行列)。work_scale の解像度での値。
+        work_scale (float): 位置合わせに使った解像度（元の画像に対する倍率）。
+        seam_scale (float): 継ぎ目と露出補正に使った解像度。
+        seam_masks (list): 各画像の継ぎ目のマスク（seam_scale の解像度）。
+    """
+
+    def __init__(self, images, cameras, work_scale, seam_scale, warped_scale, projection, compensator, seam_masks):
+        self.images = images
+        self.cameras = cameras
+        self.work_scale = work_scale
+        self.seam_scale = seam_scale
+        self.warped_scale = warped_scale
+        self.projection = projection
+        self.compensator = compensator
+        self.seam_masks = seam_masks
+
+    def K(self, index, scale):
+        """
+        元の画像に対して scale 倍の解像度でのカメラ行列を返します。
+        """
+        focal, aspect, ppx, ppy, _ = self.cameras[index]
+        ratio = scale / self.work_scale
+        return np.float32([[focal * ratio, 0, ppx * ratio], [0, focal * aspect * ratio, ppy * ratio], [0, 0, 1]])
+
+    def R(self, index):
+        return self.cameras[index][4]
+
+
+def register_features(images, cache_dir=None, cache=None, pairs="all", loop=True, projection="spherical",
+                      exposure=True, wave_correct=True, work_scale=None, seam_scale=None,
+                      max_features=500, match_conf=0.3, conf_thresh=1.0, focal_ratio=TELLO_FOCAL_RATIO,
+                      focal_tolerance=2.0, verbose=False):
+    """
+    特徴点の照合で画像の位置合わせを行い、露出補正と継ぎ目も低解像度で求めます。
+
+    Args:
+        work_scale (float): 特徴点の検出と位置合わせに使う解像度（元の画像に対する倍率）。
+            省略時は cv2.Stitcher と同じく WORK_MEGAPIX になる倍率。
+        seam_scale (float): 継ぎ目と露出補正に使う解像度。省略時は SEAM_MEGAPIX になる倍率。
+        focal_ratio (float): カメラの焦点距離と画像の幅の比（分かっていれば）。
+            推定した焦点距離がこの値から focal_tolerance 倍以上ずれていたら、位置合わせの失敗とみなす
+            （一致点の少ない組でバンドル調整が発散したときなど）。None なら確認しない。
+        その他の引数は stitch_features と同じ。
+    Returns:
+        tuple: (status, Registration)。失敗したときは (status, None)。
+    """
+    if projection not in PROJECTIONS:
+        raise ValueError(f"不明な投影方法です: {projection}（{', '.join(PROJECTIONS)} のいずれか）")
+    started = time.perf_counter()
+    images = [image for image in images if not is_blank(image)]
+    if len(images) < 2:
+        return cv2.Stitcher_ERR_NEED_MORE_IMGS, None
+    size = max((image.shape[1], image.shape[0]) for image in images)
+    images = [image if (image.shape[1], image.shape[0]) == size
+              else cv2.resize(image, size, interpolation=cv2.INTER_AREA) for image in images]
+    # 全く同じ画像（ストリームが止まっていたときなど）は1枚だけ使う
+    hashes = {}
+    for image in images:
+        hashes.setdefault(image_hash(image), image)
+    if len(hashes) < 2:
+        return cv2.Stitcher_ERR_NEED_MORE_IMGS, None
+    images = list(hashes.values())
+    hashes = list(hashes)
+    area = size[0] * size[1]
+    if work_scale is None:
+        work_scale = min(1.0, np.sqrt(WORK_MEGAPIX * 1e6 / area))
+    if seam_scale is None:
+        seam_scale = min(1.0, np.sqrt(SEAM_MEGAPIX * 1e6 / area))
+    seam_work_aspect = seam_scale / work_scale
+
+    # 1. 特徴点（キャッシュ）
+    if cache is None:
+        cache = FeatureCache(cache_dir)
+    finder = cv2.ORB_create(max_features)
+    feature_key = f"orb{max_features}-{work_scale:.4f}"
+    keys = []
+    features = []
+    for index, (image, digest) in enumerate(zip(images, hashes)):
+        small = cv2.resize(image, None, fx=work_scale, fy=work_scale, interpolation=cv2.INTER_LINEAR_EXACT)
+        feature = cache.features(small, f"{digest}-{feature_key}", finder)
+        feature.img_idx = index
+        keys.append(digest)
+        features.append(feature)
+
+    # 2. 照合（キャッシュ）
+    matcher = cv2.detail.BestOf2NearestMatcher(False, match_conf)
+    table = _pairwise_matches(keys, features, match_pairs(len(images), pairs, loop), cache, matcher,
+                              f"{feature_key}-{match_conf}")
+    prepared = time.perf_counter()
+
+    # 3. つながっている画像だけを残す
+    indices = [int(i) for i in np.ravel(cv2.detail.leaveBiggestComponent(features, table, conf_thresh))]
+    if len(indices) < 2:
+        return cv2.Stitcher_ERR_NEED_MORE_IMGS, None
+    if len(indices) < len(images):
+        features, table = _subset(features, table, indices)
+        images = [images[i] for i in indices]
+        if verbose:
+            print(f"[FEATURES] {len(indices)} 枚がつながりました（残りは合成に使いません）")
+
+    # 4. カメラの推定とバンドル調整
+    ok, cameras = cv2.detail.HomographyBasedEstimator().apply(features, table, None)
+    if not ok:
+        return cv2.Stitcher_ERR_HOMOGRAPHY_EST_FAIL, None
+    for camera in cameras:
+        camera.R = camera.R.astype(np.float32)
+    adjuster = cv2.detail.BundleAdjusterRay()
+    adjuster.setConfThresh(conf_thresh)
+    ok, cameras = adjuster.apply(features, table, cameras)
+    if not ok:
+        return cv2.Stitcher_ERR_CAMERA_PARAMS_ADJUST_FAIL, None
+    warped_scale = float(np.median([camera.focal for camera in cameras]))
+    if focal_ratio is not None and focal_tolerance:
+        expected = focal_ratio * size[0] * work_scale
+        if not expected / focal_tolerance < warped_scale < expected * focal_tolerance:
+            if verbose:
+                print(f"[FEATURES] 推定した焦点距離 {warped_scale:.0f}px が想定 {expected:.0f}px から離れすぎています")
+            return cv2.Stitcher_ERR_CAMERA_PARAMS_ADJUST_FAIL, None
+    rotations = [np.float32(camera.R) for camera in cameras]
+    if wave_correct:
+        rotations = cv2.detail.waveCorrect(rotations, cv2.detail.WAVE_CORRECT_HORIZ)
+    cameras = [(camera.focal, camera.aspect, camera.ppx, camera.ppy, np.float32(rotation))
+               for camera, rotation in zip(cameras, rotations)]
+    registration = Registration(images, cameras, work_scale, seam_scale, warped_scale, projection, None, None)
+
+    # 5. 継ぎ目と露出補正（低解像度）
+    warper = cv2.PyRotationWarper(projection, warped_scale * seam_work_aspect)
+    corners, masks, warped_images = [], [], []
+    for index, image in enumerate(images):
+        small = cv2.resize(image, None, fx=seam_scale, fy=seam_scale, interpolation=cv2.INTER_LINEAR_EXACT)
+        K, R = registration.K(index, seam_scale), registration.R(index)
+        corner, warped = warper.warp(small, K, R, cv2.INTER_LINEAR, cv2.BORDER_REFLECT)
+        mask = np.full(small.shape[:2], 255, np.uint8)
+        _, mask = warper.warp(mask, K, R, cv2.INTER_NEAREST, cv2.BORDER_CONSTANT)
+        corners.append(corner)
+        masks.append(mask)
+        warped_images.append(warped)
+    compensator_type = cv2.detail.ExposureCompensator_GAIN_BLOCKS if exposure else cv2.detail.ExposureCompensator_NO
+    registration.compensator = cv2.detail.ExposureCompensator_createDefault(compensator_type)
+    registration.compensator.feed(corners=corners, images=warped_images, masks=masks)
+    seam_finder = cv2.detail.DpSeamFinder("COLOR")
+    seam_masks = seam_finder.find([w.astype(np.float32) for w in warped_images], corners, masks)
+    registration.seam_masks = [m.get() if isinstance(m, cv2.UMat) else m for m in seam_masks]
+
+    if verbose:
+        cache.print_stats()
+        print(f"[FEATURES] 検出と照合 {prepared - started:.2f}秒 / 位置合わせ全体 {time.perf_counter() - started:.2f}秒 "
+              f"({len(images)} 枚, 倍率 {work_scale:.2f})")
+    return cv2.Stitcher_OK, registration
+
+
+def warp_registered(registration, scale=1.0):
+    """
+    位置合わせの結果の各画像を、元の画像の scale 倍の解像度で投影します。
+
+    Returns:
+        tuple: (destination, warped)。destination はパノラマ全体の (x, y, 幅, 高さ)、
+        warped は (左上の座標, 投影した画像（露出補正済み）, 継ぎ目で切ったマスク) を1枚ずつ返すジェネレータ。
+        投影した画像は1枚ずつしか作らないので、大きなパノラマでもメモリは画像1枚分で済む。
+    """
+    r = registration
+    warper = cv2.PyRotationWarper(r.projection, r.warped_scale * scale / r.work_scale)
+    height, width = r.images[0].shape[:2]
+    size = (int(round(width * scale)), int(round(height * scale)))
+    corners, sizes = [], []
+    for index in range(len(r.images)):
+        roi = warper.warpRoi(size, r.K(index, scale), r.R(index))
+        corners.append(roi[0:2])
+        sizes.append(roi[2:4])
+    destination = cv2.detail.resultRoi(corners=corners, sizes=sizes)
+
+    def warped():
+        for index, image in enumerate(r.images):
+            if scale != 1.0:
+                image = cv2.resize(image, size, interpolation=cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR)
+            K, R = r.K(index, scale), r.R(index)
+            corner, warped_image = warper.warp(image, K, R, cv2.INTER_LINEAR, cv2.BORDER_REFLECT)
+            mask = np.full(image.shape[:2], 255, np.uint8)
+            _, mask = warper.warp(mask, K, R, cv2.INTER_NEAREST, cv2.BORDER_CONSTANT)
+            r.compensator.apply(index, corners[index], warped_image, mask)
+            seam = cv2.resize(cv2.dilate(r.seam_masks[index], None), (mask.shape[1], mask.shape[0]),
+                              0, 0, cv2.INTER_LINEAR_EXACT)
+            yield corners[index], warped_image, cv2.bitwise_and(seam, mask)
+
+    return destination, warped()
+
+
+def compose_panorama(registration, scale=1.0, blend="multiband", blend_strength=5.0):
+    """
+    位置合わせの結果から、元の画像の scale 倍の解像度でパノラマを作ります（投影とブレンドだけを行う）。
+
+    Args:
+        registration (Registration): register_features の結果。
+        scale (float): 出力の解像度（元の画像に対する倍率）。小さくすればすぐにプレビューが得られる。
+        blend (str): ブレンド方法（BLENDS のいずれか）。
+        blend_strength (float): ブレンドの幅（パノラマの大きさに対する%）。
+    """
+    if blend not in BLENDS:
+        raise ValueError(f"不明なブレンド方法です: {blend}（{', '.join(BLENDS)} のいずれか）")
+    destination, warped = warp_registered(registration, scale)
+    blend_width = np.sqrt(destination[2] * destination[3]) * blend_strength / 100
+    if blend == "none" or blend_width < 1:
+        blender = cv2.detail.Blender_createDefault(cv2.detail.Blender_NO)
+    elif blend == "multiband":
+        blender = cv2.detail.MultiBandBlender()
+        blender.setNumBands(int(np.log(blend_width) / np.log(2.0) - 1.0))
+    else:
+        blender = cv2.detail.FeatherBlender()
+        blender.setSharpness(1.0 / blend_width)
+    blender.prepare(destination)
+    for corner, image, mask in warped:
+        blender.feed(cv2.UMat(image.astype(np.int16)), mask, corner)
+    result, _ = blender.blend(None, None)
+    return np.clip(result, 0, 255).astype(np.uint8)
+
+
+def stitch_features(images, cache_dir=None, cache=None, pairs="all", loop=True, projection="spherical",
+                    blend="multiband", blend_strength=5.0, exposure=True, wave_correct=True,
+                    max_features=500, match_conf=0.3, conf_thresh=1.0, verbose=False):
+    """
+    特徴点の照合でパノラマを合成します（cv2.Stitcher と同じ手順）。
+
+    特徴点と照合結果はキャッシュし、同じ画像なら投影やブレンドの設定を変えても再利用します。
+
+    Args:
+        images (list): 撮影順の画像。真っ黒な画像や None は飛ばす。
+        cache_dir (str): 特徴点と照合結果を保存するフォルダ。
+        cache (FeatureCache): 共有するキャッシュ（cache_dir より優先）。
+        pairs (str): 照合する組の選び方。"all" または "sequential"（match_pairs を参照）。
+        loop (bool): pairs="sequential" で最後と最初の画像も照合するかどうか（360度撮った場合）。
+        projection (str): 投影方法（PROJECTIONS のいずれか）。
+        blend (str): ブレンド方法（BLENDS のいずれか）。
+        blend_strength (float): ブレンドの幅（パノラマの大きさに対する%）。
+        exposure (bool): 画像ごとの明るさの違いを補正するかどうか。
+        wave_correct (bool): 水平方向のうねりを補正するかどうか。
+        max_features (int): 1枚あたりの特徴点の最大数（ORB）。
+        match_conf (float): 照合の信頼度のしきい値。
+        conf_thresh (float): 画像同士がつながっているとみなす信頼度のしきい値。
+    Returns:
+        tuple: (status, panorama)。status は cv2.Stitcher と同じ値。
+    """
+    if blend not in BLENDS:
+        raise ValueError(f"不明なブレンド方法です: {blend}（{', '.join(BLENDS)} のいずれか）")
+    started = time.perf_counter()
+    status, registration = register_features(
+        images, cache_dir=cache_dir, cache=cache, pairs=pairs, loop=loop, projection=projection,
+        exposure=exposure, wave_correct=wave_correct, max_features=max_features, match_conf=match_conf,
+        conf_thresh=conf_thresh, verbose=verbose)
+    if status != cv2.Stitcher_OK:
+        return status, None
+    panorama = compose_panorama(registration, 1.0, blend, blend_strength)
+    if verbose:
+        print(f"[FEATURES] 全体 {time.perf_counter() - started:.2f}秒 ({len(registration.images)} 枚, {projection}, {blend})")
+    return cv2.Stitcher_OK, panorama
@@ -0,0 +1,115 @@
+"""
+多重解像度のパノラマ合成: 1/4 の解像度で位置合わせと継ぎ目を求め、元の解像度では投影とブレンドだけを行う。
+
+cv2.Stitcher は特徴点の検出から継ぎ目まで 0.6 メガピクセル（Tello の映像ではほぼ元の大きさ）で
+処理します。stitch_multires は縮小画像で register_features を行い、まず同じ縮小率でプレビューを作って
+preview(panorama) を呼び、その後に同じ位置合わせのまま元の解像度のパノラマを作ります。
+
+    def show(preview):
+        cv2.imshow("preview", preview)
+        cv2.waitKey(1)
+
+    status, panorama = stitch_images(images, mode="multires", preview=show)
+
+cv2.Stitcher との時間とメモリの比較（プレビューまでの時間も出す。全ての合成方法の比較は benchmark を参照）:
+
+    python -m tellolib.panorama.multires 0619/mitome/panorama/4m 0619/mitome/panorama/5m
+"""
+import argparse
+import time
+
+import cv2
+
+from .features import compose_panorama, register_features
+
+
+def stitch_multires(images, scale=0.25, preview=None, pairs="sequential", blend="multiband",
+                    blend_strength=5.0, retry_scales=(0.5,), verbose=False, **options):
+    """
+    縮小画像で位置合わせをして、プレビューと元の解像度のパノラマを作ります。
+
+    Args:
+        images (list): 撮影順の画像。
+        scale (float): 位置合わせ・継ぎ目・プレビューの解像度（元の画像に対する倍率）。
+        retry_scales (tuple): scale で位置合わせに失敗したときに順に試す、より大きな解像度。
+        preview (callable): プレビューのパノラマができたときに呼ぶ関数 preview(panorama)。
+        pairs (str): 照合する組の選び方（既定は撮影順に隣り合う組だけ）。
+        blend (str): ブレンド方法。
+        blend_strength (float): ブレンドの幅（パノラマの大きさに対する%）。
+        **options: register_features に渡す追加の引数（cache_dir, projection など）。
+    Returns:
+        tuple: (status, panorama)。status は cv2.Stitcher と同じ値。
+    """
+    started = time.perf_counter()
+    for work_scale in (scale,) + tuple(retry_scales):
+        status, registration = register_features(images, pairs=pairs, work_scale=work_scale, seam_scale=work_scale,
+                                                 verbose=verbose, **options)
+        if status == cv2.Stitcher_OK:
+            break
+        if verbose:
+            print(f"[MULTIRES] 倍率 {work_scale:.2f} での位置合わせに失敗しました（{status}）")
+    if status != cv2.Stitcher_OK:
+        return status, None
+    if preview is not None:
+        preview(compose_panorama(registration, scale, blend, blend_strength))
+        if verbose:
+            print(f"[MULTIRES] プレビュー {time.perf_counter() - started:.2f}秒")
+    panorama = compose_panorama(registration, 1.0, blend, blend_strength)
+    if verbose:
+        print(f"[MULTIRES] 元の解像度 {time.perf_counter() - started:.2f}秒 ({len(registration.images)} 枚)")
+    return cv2.Stitcher_OK, panorama
+
+
+# --- ベンチマーク ---
+
+def _measure(folder, method):
+    # 別プロセスで1回だけ合成し、時間とメモリの最大値の増分を返す
+    from .batch import list_images
+    from .benchmark import peak_rss
+    images = [cv2.imread(path) for path in list_images(folder)]
+    images = [image for image in images if image is not None]
+    before = peak_rss()
+    preview_time = [None]
+    started = time.perf_counter()
+    if method == "opencv":
+        stitcher = cv2.Stitcher_create()
+        status, panorama = stitcher.stitch(images)
+    else:
+        def preview(_):
+            preview_time[0] = time.perf_counter() - started
+        status, panorama = stitch_multires(images, preview=preview)
+    elapsed = time.perf_counter() - started
+    after = peak_rss()
+    shape = None if panorama is None else panorama.shape[:2]
+    memory = None if before is None or after is None else after - before
+    return status, elapsed, preview_time[0], memory, shape
+
+
+def benchmark(folder, method):
+    """
+    folder の画像を method（"opencv" または "multires"）で合成し、
+    (status, 時間, プレビューまでの時間, メモリの増分, 出力の (高さ, 幅)) を返します。
+    メモリを正しく測るため、1回ごとに新しいプロセスで実行します。
+    """
+    from .benchmark import run_in_process
+    return run_in_process(_measure, folder, method)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="cv2.Stitcher と多重解像度の合成の時間とメモリを比べます")
+    parser.add_argument("folders", nargs="+", help="1つのパノラマになる画像のフォルダ")
+    args = parser.parse_args()
+
+    print(f"{'フォルダ':<28} {'方法':<9} {'結果':<4} {'プレビュー':>8} {'全体':>7} {'メモリ':>8}  出力")
+    for folder in args.folders:
+        for method in ("opencv", "multires"):
+            status, elapsed, preview, memory, shape = benchmark(folder, method)
+            result = "成功" if status == cv2.Stitcher_OK else f"失敗{status}"
+            preview = "-" if preview is None else f"{preview:.2f}秒"
+            memory = "-" if memory is None else f"{memory / 2 ** 20:.0f}MB"
+            size = "-" if shape is None else f"{shape[1]}x{shape[0]}"
+            print(f"{folder:<30} {method:<9} {result:<4} {preview:>8} {elapsed:>6.2f}秒 {memory:>8}  {size}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+パノラマ合成の共通の入口。
+
+各スクリプトは cv2.Stitcher.stitch を直接呼んでいましたが、stitch_images(images, mode=...)
+を使うと同じ戻り値 (status, panorama) のまま合成方法を切り替えられます。
+
+- "opencv": cv2.Stitcher（従来どおり、特徴点で全ての組を照合）
+- "yaw": 機体の回転角度を前提にした円筒投影（stitch_cylindrical）。12枚で1秒未満
+- "stream": StreamingStitcher に1枚ずつ渡す（撮影中の合成と同じ結果）
+- "features": cv2.Stitcher と同じ手順で、特徴点と照合結果をキャッシュする（stitch_features）
+- "sequential": "features" のうち、撮影順に隣り合う画像（と最後と最初）だけを照合する。枚数に比例して速い
+- "multires": 1/4 の解像度で位置合わせと継ぎ目を求め、元の解像度では投影とブレンドだけを行う（stitch_multires）
+"""
+import functools
+
+import cv2
+
+from .cylindrical import stitch_cylindrical
+from .features import stitch_features
+from .multires import stitch_multires
+from .stream import StreamingStitcher
+
+STATUS_MESSAGES = {
+    cv2.Stitcher_OK: "成功しました。",
+    cv2.Stitcher_ERR_NEED_MORE_IMGS: "より多くの画像が必要です。",
+    cv2.Stitcher_ERR_HOMOGRAPHY_EST_FAIL: "ホモグラフィーの推定に失敗しました。画像間の特徴点が不足している可能性があります。",
+    cv2.Stitcher_ERR_CAMERA_PARAMS_ADJUST_FAIL: "カメラパラメータの調整に失敗しました。",
+}
+
+
+def describe_status(status):
+    return STATUS_MESSAGES.get(status, f"不明なエラーです。ステータスコード: {status}")
+
+
+def _stitch_opencv(images):
+    stitcher = cv2.Stitcher_create() if hasattr(cv2, 'Stitcher_create') else cv2.createStitcher()
+    return stitcher.stitch(images)
+
+
+def _stitch_stream(images, step_deg=None, yaws_deg=None, full_circle=True):
+    # 撮れなかった向きを詰めた images では 360 / 枚数 が回転角度と合わないので、yaws_deg か step_deg を渡すこと
+    if step_deg is None and yaws_deg is None:
+        step_deg = 360.0 / max(len(images), 1)
+    stitcher = StreamingStitcher(expected_step_deg=step_deg, verbose=False)
+    for i, image in enumerate(images):
+        stitcher.add(image, yaw_deg=None if yaws_deg is None else yaws_deg[i])
+    if not stitcher.reliable():
+        return cv2.Stitcher_ERR_NEED_MORE_IMGS, None
+    return cv2.Stitcher_OK, stitcher.panorama(full_circle=full_circle)
+
+
+MODES = {
+    "opencv": _stitch_opencv,
+    "yaw": stitch_cylindrical,
+    "stream": _stitch_stream,
+    "features": stitch_features,
+    "sequential": functools.partial(stitch_features, pairs="sequential"),
+    "multires": stitch_multires,
+}
+
+
+def stitch_images(images, mode="opencv", **options):
+    """
+    画像のリストからパノラマを合成します。
+
+    Args:
+        images (list): 撮影順の画像のリスト。
+        mode (str): 合成方法（MODES のキー）。
+        **options: 合成方法ごとの追加の引数（"yaw" と "stream" の yaws_deg, step_deg など）。
+            "yaw" と "stream" はどちらも省略すると 360 / 枚数 ずつ回転したとみなすので、
+            撮れなかった画像を飛ばした場合は各画像の yaws_deg を渡してください。
+    Returns:
+        tuple: (status, panorama)。status は cv2.Stitcher と同じ値。
+    """
+    if mode not in MODES:
+        raise ValueError(f"不明な合成方法です: {mode}（{', '.join(MODES)} のいずれか）")
+    return MODES[mode](images, **options)
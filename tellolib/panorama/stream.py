@@ -0,0 +1,238 @@
+"""
+撮影しながら1枚ずつ合成していくパノラマスティッチャー。
+
+これまでのスクリプトは12枚を撮り終えて着陸してから cv2.Stitcher でまとめて合成していましたが、
+StreamingStitcher は rotate_clockwise が終わるたびに add(frame) で1枚ずつ受け取り、
+直前の1枚とだけ位置合わせをしてキャンバスに重ねていきます。
+保持するのは直前の1枚の特徴点とキャンバスだけなので、最後の1枚を追加した時点で
+panorama() を呼べばすぐに結果が得られます。
+"""
+import time
+
+import cv2
+import numpy as np
+
+from .cylindrical import TELLO_FOCAL_RATIO, feather_weights, warp_cylindrical
+
+# 真っ黒なフレーム（ストリーム開始直後など）とみなす輝度の標準偏差
+BLANK_STD = 2.0
+
+
+def is_blank(frame):
+    return frame is None or float(frame.std()) < BLANK_STD
+
+
+class StreamingStitcher:
+    """
+    回転しながら撮った画像を逐次合成します。
+
+    Args:
+        focal_ratio (float): 焦点距離と画像の幅の比。
+        work_width (int): 位置合わせ（特徴点の検出）を行う画像の幅。小さいほど速い。
+        max_features (int): 1枚あたりの特徴点の最大数。
+        expected_step_deg (float): 1枚ごとの回転角度（分かっていれば）。
+            位置合わせに失敗したとき（結果が大きく外れたときも含む）に限り、この値で置く。
+            この値で置いたフレームは frames_prior に数え、frames_added には数えない。
+        min_inliers (int): 位置合わせを信用する最小の一致点数。
+        verbose (bool): ログを出すかどうか。
+    """
+
+    def __init__(self, focal_ratio=TELLO_FOCAL_RATIO, work_width=480, max_features=1500,
+                 expected_step_deg=None, min_inliers=15, verbose=True):
+        self.focal_ratio = focal_ratio
+        self.work_width = work_width
+        self.expected_step_deg = expected_step_deg
+        self.min_inliers = min_inliers
+        self.verbose = verbose
+        self._orb = cv2.ORB_create(max_features)
+        self._matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+
+        self.frame_size = None   # (幅, 高さ)。最初の有効なフレームに合わせる
+        self.focal = None
+        self._work_scale = 1.0
+        self._previous = None    # 直前のフレームの (特徴点の座標, 特徴量)
+        self._previous_yaw = None  # 直前のフレームの向き（add に yaw_deg を渡した場合）
+        self._position = None    # 直前のフレームのキャンバス上の位置（左上, 実数）
+        self._origin = np.zeros(2)
+        self._sum = None         # 重み付きの画素値の合計
+        self._weight = None      # 重みの合計
+        # 各フレームの記録: (番号, 状態, 位置, 一致点数, 処理時間[秒])
+        self.log = []
+        self._count = 0
+
+    # --- 入力 ---
+
+    def add(self, frame, yaw_deg=None):
+        """
+        フレームを1枚追加します。
+
+        Args:
+            frame (numpy.ndarray): 追加するフレーム。
+            yaw_deg (float): このフレームを撮ったときの向き（度、時計回りが正）。
+                渡すと直前に置いたフレームとの向きの差を予想の角度にする（撮れなかった向きがあっても合う）。
+                省略時は expected_step_deg を使う。
+        Returns:
+            bool: パノラマに追加できたら True（真っ黒なフレームや位置合わせの失敗は False）。
+        """
+        start = time.perf_counter()
+        index = self._count
+        self._count += 1
+        if is_blank(frame):
+            self._record(index, "blank", None, 0, start)
+            return False
+
+        if self.frame_size is None:
+            height, width = frame.shape[:2]
+            self.frame_size = (width, height)
+            self.focal = self.focal_ratio * width
+            self._work_scale = min(1.0, self.work_width / width)
+        elif (frame.shape[1], frame.shape[0]) != self.frame_size:
+            frame = cv2.resize(frame, self.frame_size, interpolation=cv2.INTER_AREA)
+
+        warped, _ = warp_cylindrical(frame, self.focal)
+        points, descriptors = self._features(warped)
+
+        if self._previous is None:
+            shift, inliers, status = np.zeros(2), 0, "first"
+        else:
+            shift, inliers = self._register(points, descriptors)
+            status = "matched"
+            expected = self._expected_shift(yaw_deg)
+            if shift is None or (expected is not None and abs(shift[0] - expected) > 0.5 * abs(expected)):
+                if expected is None:
+                    self._record(index, "failed", None, inliers, start)
+                    return False
+                shift, status = np.array([expected, 0.0]), "prior"
+
+        position = np.zeros(2) if self._position is None else self._position + shift
+        self._blend(warped, position)
+        self._previous = (points, descriptors)
+        self._previous_yaw = yaw_deg
+        self._position = position
+        self._record(index, status, position, inliers, start)
+        return True
+
+    def _features(self, warped):
+        gray = cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY) if warped.ndim == 3 else warped
+        if self._work_scale < 1.0:
+            gray = cv2.resize(gray, None, fx=self._work_scale, fy=self._work_scale, interpolation=cv2.INTER_AREA)
+        keypoints, descriptors = self._orb.detectAndCompute(gray, None)
+        points = np.float32([kp.pt for kp in keypoints]) / self._work_scale if keypoints else np.zeros((0, 2), np.float32)
+        return points, descriptors
+
+    def _register(self, points, descriptors):
+        # 直前のフレームに対する平行移動量（円筒面上, 元の解像度）
+        prev_points, prev_descriptors = self._previous
+        if descriptors is None or prev_descriptors is None or len(points) < 2 or len(prev_points) < 2:
+            return None, 0
+        pairs = self._matcher.knnMatch(prev_descriptors, descriptors, k=2)
+        good = [p[0] for p in pairs if len(p) == 2 and p[0].distance < 0.8 * p[1].distance]
+        if len(good) < self.min_inliers:
+            return None, len(good)
+        src = points[[m.trainIdx for m in good]]
+        dst = prev_points[[m.queryIdx for m in good]]
+        matrix, inliers = cv2.estimateAffinePartial2D(src, dst, method=cv2.RANSAC,
+                                                      ransacReprojThreshold=3.0 / self._work_scale)
+        count = int(inliers.sum()) if inliers is not None else 0
+        if matrix is None or count < self.min_inliers:
+            return None, count
+        scale = float(np.hypot(matrix[0, 0], matrix[1, 0]))
+        if not 0.9 < scale < 1.1:
+            return None, count
+        # 円筒面上では平行移動だけのはずなので、一致点のずれの中央値を使う
+        mask = inliers.ravel().astype(bool)
+        return np.median(dst[mask] - src[mask], axis=0), count
+
+    def _expected_shift(self, yaw_deg=None):
+        if yaw_deg is not None and self._previous_yaw is not None:
+            step = (yaw_deg - self._previous_yaw) % 360.0
+        elif self.expected_step_deg is not None:
+            step = self.expected_step_deg
+        else:
+            return None
+        return self.focal * np.radians(step)
+
+    # --- 合成 ---
+
+    def _blend(self, warped, position):
+        width, height = self.frame_size
+        weights = feather_weights(width, height, self.focal)
+        top_left = np.round(position + self._origin).astype(int)
+        self._ensure_canvas(top_left, width, height)
+        top_left = np.round(position + self._origin).astype(int)
+        x, y = top_left
+        region = (slice(y, y + height), slice(x, x + width))
+        self._sum[region] += warped.astype(np.float32) * weights[..., None]
+        self._weight[region] += weights
+
+    def _ensure_canvas(self, top_left, width, height):
+        # キャンバスに収まらなければ広げる（何度も広げずに済むよう1枚分ずつ余裕を持たせる）
+        if self._sum is None:
+            self._sum = np.zeros((height * 2, width * 2, 3), np.float32)
+            self._weight = np.zeros((height * 2, width * 2), np.float32)
+            self._origin = np.array([width / 2, height / 2])
+            return
+        x, y = top_left
+        canvas_h, canvas_w = self._weight.shape
+        pad_left = width if x < 0 else 0
+        pad_top = height if y < 0 else 0
+        pad_right = width if x + width > canvas_w else 0
+        pad_bottom = height if y + height > canvas_h else 0
+        if pad_left or pad_top or pad_right or pad_bottom:
+            pads = ((pad_top + max(0, -y), pad_bottom), (pad_left + max(0, -x), pad_right))
+            self._sum = np.pad(self._sum, pads + ((0, 0),))
+            self._weight = np.pad(self._weight, pads)
+            self._origin = self._origin + np.array([pads[1][0], pads[0][0]])
+
+    # --- 出力 ---
+
+    def panorama(self, full_circle=False):
+        """
+        その時点までのパノラマを返します。まだ1枚も追加されていなければ None。
+
+        Args:
+            full_circle (bool): 360度分撮れている場合に、1周分の幅で切り出すかどうか。
+        """
+        if self._weight is None:
+            return None
+        covered = self._weight > 0
+        rows = np.flatnonzero(covered.any(axis=1))
+        cols = np.flatnonzero(covered.any(axis=0))
+        top, bottom = rows[0], rows[-1] + 1
+        left, right = cols[0], cols[-1] + 1
+        if full_circle:
+            circumference = int(round(2 * np.pi * self.focal))
+            start = int(round(self._origin[0] + self.frame_size[0] / 2))
+            if right - start >= circumference:
+                left, right = start, start + circumference
+        weight = self._weight[top:bottom, left:right]
+        image = self._sum[top:bottom, left:right] / np.maximum(weight, 1e-6)[..., None]
+        return np.clip(image, 0, 255).astype(np.uint8)
+
+    def _record(self, index, status, position, inliers, start):
+        elapsed = time.perf_counter() - start
+        self.log.append((index, status, None if position is None else tuple(np.round(position, 1)),
+                         inliers, elapsed))
+        if self.verbose:
+            where = "" if position is None else f" 位置 ({position[0]:.0f}, {position[1]:.0f})"
+            print(f"[STITCH] フレーム {index}: {status}{where} 一致点 {inliers} ({elapsed * 1000:.0f} ms)")
+
+    @property
+    def frames_added(self):
+        # 位置合わせで置けたフレームの数（最初の1枚を含む）
+        return sum(1 for entry in self.log if entry[1] in ("first", "matched"))
+
+    @property
+    def frames_prior(self):
+        # 位置合わせに失敗し、expected_step_deg の角度で置いたフレームの数
+        return sum(1 for entry in self.log if entry[1] == "prior")
+
+    def reliable(self, max_prior_ratio=0.25):
+        """
+        パノラマが位置合わせに基づいているかどうかを返します。
+
+        位置合わせで置けたフレームが2枚以上あり、予想の角度で置いたフレームが置いたフレーム全体の
+        max_prior_ratio 以下なら True。False なら cv2.Stitcher などで合成し直してください。
+        """
+        placed = self.frames_added + self.frames_prior
+        return self.frames_added >= 2 and self.frames_prior <= max_prior_ratio * placed
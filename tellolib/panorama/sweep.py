@@ -0,0 +1,160 @@
+"""
+止まらずに回りながら撮るパノラマ撮影: rc で一定の速さで回し続け、映像の中から決まった向きのフレームを選ぶ。
+
+これまでの撮影は 30 度回転しては止まり、落ち着くのを待って1枚撮ることを12回繰り返していたので、
+1つの高さで1分近くホバリングしていました。YawSweep は rc の回転の指令を1回送って回し続け、
+映像の受信機が届けるフレームごとに、その時刻の機首の向きを状態パケットの yaw（と受信時刻）から補間して求めます。
+回り始めの向きから 360 / shots 度ずつの向きに一番近いフレームを1枚ずつ選び、1周したら止まります。
+
+    sweep = YawSweep(receiver, tello.get_current_state, tello.send_rc_control, shots=12)
+    shots = sweep.capture()                 # 向きの順の SweepShot のリスト
+    frames = [shot.frame for shot in shots]
+    yaws = [shot.yaw for shot in shots]     # stitch_images(frames, mode="yaw", yaws_deg=yaws) にそのまま渡せる
+    sweep.print_stats()
+
+フレームの受信時刻は、VideoReceiver なら受信したときの時刻、djitellopy の frame_read（.frame だけを持つ）
+なら新しいフレームに気づいたときの時刻です。カメラから届くまでの遅れは video_delay で差し引きます。
+"""
+import collections
+import time
+
+import numpy as np
+
+# 選んだ1枚。yaw は回り始めからの角度（度）、error は狙った向きとの差（度）、time はフレームの時刻
+SweepShot = collections.namedtuple("SweepShot", ["frame", "yaw", "error", "time"])
+
+
+class YawSweep:
+    """
+    一定の速さで1周回しながら、等間隔の向きのフレームを選びます。
+
+    Args:
+        frames: 映像の受信機。VideoReceiver（wait_for_frame を持つ）か、.frame を持つもの（djitellopy）。
+        state (callable): 最新の状態の辞書を返す関数（tello.get_current_state）。
+        send_rc (callable): rc を送る関数（tello.send_rc_control）。
+        shots (int): 1周で選ぶフレームの数。
+        yaw_rate (int): 回転の rc の指令（1〜100、時計回り）。大きいほど速いが、映像のブレが増える。
+            合成（stitch_images の "yaw" など）は時計回りに並んだ画像を前提にしているので、反時計回りには回さない。
+        video_delay (float): フレームの受信時刻と実際に写した時刻の差[秒]。
+        timeout (float): 1周し終わらなくてもこの秒数で止める。
+        verbose (bool): ログを出すかどうか。
+    """
+
+    def __init__(self, frames, state, send_rc, shots=12, yaw_rate=30, video_delay=0.1, timeout=30.0,
+                 verbose=True):
+        if not 0 < yaw_rate <= 100:
+            raise ValueError(f"yaw_rate は 1〜100（時計回り）にしてください: {yaw_rate}")
+        self.frames = frames
+        self.state = state
+        self.send_rc = send_rc
+        self.shots = shots
+        self.step = 360.0 / shots
+        self.yaw_rate = yaw_rate
+        self.video_delay = video_delay
+        self.timeout = timeout
+        self.verbose = verbose
+        self.elapsed = None
+        self.decoded = 0
+        self._yaw_times = collections.deque(maxlen=256)
+        self._yaws = collections.deque(maxlen=256)
+        self._last_state = None
+        self._last_frame = None
+        self._seq = None
+        self._shots = []
+
+    # --- 入力 ---
+
+    def _read_state(self):
+        # 新しい状態パケットが届いていれば yaw を1周を越えてもつながる値にして記録する
+        state = self.state()
+        if not state or state is self._last_state or "yaw" not in state:
+            return
+        self._last_state = state
+        yaw = float(state["yaw"])
+        if self._yaws:
+            previous = self._yaws[-1]
+            yaw = previous + (yaw - previous + 180.0) % 360.0 - 180.0
+        self._yaw_times.append(time.time())
+        self._yaws.append(yaw)
+
+    def _read_frame(self):
+        # 新しいフレームがあれば (フレーム, 写した時刻) を返す
+        if hasattr(self.frames, "wait_for_frame"):
+            if self._seq is None:
+                self._seq = self.frames.latest()[2]
+            frame, timestamp, seq = self.frames.wait_for_frame(after_seq=self._seq, timeout=0.02)
+            if frame is None or seq == self._seq:
+                return None
+            self._seq = seq
+        else:
+            frame = self.frames.frame
+            if frame is None or frame is self._last_frame:
+                time.sleep(0.01)
+                return None
+            timestamp = time.time()
+        self._last_frame = frame
+        self.decoded += 1
+        return frame, timestamp - self.video_delay
+
+    # --- 撮影 ---
+
+    def capture(self):
+        """
+        1周回って shots 枚のフレームを選び、向きの順の SweepShot のリストを返します。
+        選べなかった向き（映像が途切れたときなど）は含めません。
+        """
+        best = [None] * self.shots          # 向きごとの (差, フレーム, 角度, 時刻)
+        pending = collections.deque()       # yaw の補間ができるようになるのを待つフレーム
+        started = time.time()
+        deadline = started + self.timeout
+        while time.time() < deadline and not self._yaws:
+            self._read_state()
+            time.sleep(0.01)
+        if not self._yaws:
+            raise RuntimeError("状態パケットの yaw を受信できません")
+        origin = self._yaws[-1]
+        last = (self.shots - 1) * self.step
+        if self.verbose:
+            print(f"[SWEEP] 回転しながら {self.shots} 枚を選びます (rc {self.yaw_rate})")
+        self.send_rc(0, 0, 0, self.yaw_rate)
+        try:
+            while time.time() < deadline:
+                shot = self._read_frame()
+                if shot is not None:
+                    pending.append(shot)
+                self._read_state()
+                # 後の状態パケットが届いたフレームは前後の yaw から向きを補間できる
+                while pending and pending[0][1] <= self._yaw_times[-1]:
+                    frame, timestamp = pending.popleft()
+                    angle = float(np.interp(timestamp, self._yaw_times, self._yaws)) - origin
+                    index = int(round(angle / self.step))
+                    if 0 <= index < self.shots:
+                        error = angle - index * self.step
+                        if best[index] is None or abs(error) < abs(best[index][0]):
+                            best[index] = (error, frame, angle, timestamp)
+                # 最後の向きを半ステップ過ぎたら止める
+                if self._yaws[-1] - origin >= last + self.step / 2:
+                    break
+        finally:
+            self.send_rc(0, 0, 0, 0)
+        self.elapsed = time.time() - started
+        self._shots = [SweepShot(frame, angle, error, timestamp)
+                       for error, frame, angle, timestamp in (b for b in best if b is not None)]
+        return self._shots
+
+    # --- 統計 ---
+
+    def summary(self):
+        errors = [abs(shot.error) for shot in self._shots]
+        return {
+            "shots": len(self._shots),
+            "elapsed": self.elapsed or 0.0,
+            "decoded": self.decoded,
+            "mean_error": sum(errors) / len(errors) if errors else 0.0,
+            "max_error": max(errors) if errors else 0.0,
+        }
+
+    def print_stats(self):
+        s = self.summary()
+        print(f"[SWEEP] {s['shots']}/{self.shots} 枚: {s['elapsed']:.1f}秒 (フレーム {s['decoded']} 枚から選択) / "
+              f"向きの差 平均 {s['mean_error']:.1f}度 / 最大 {s['max_error']:.1f}度")
@@ -0,0 +1,321 @@
+"""
+出力のキャンバスをタイルに分けてディスク上に置き、メモリを一定に保ったまま大きなパノラマを合成する。
+
+compose_panorama（cv2.detail の Blender）や composite はパノラマ全体の大きさの配列をメモリに持つので、
+撮影枚数を増やしたり、高さごとのパノラマを縦につないだりすると、出力の大きさに比例してメモリが増えます。
+TiledCanvas はブレンド用の足し込み（色の重み付き和と重みの和）をタイルごとに連続したファイルに置き、
+投影した画像を1枚ずつ、その画像と重なるタイルだけをメモリに割り当てて足し込みます。
+メモリに載るのは入力の画像1枚と、重なるタイルだけです。
+
+    # 0619_gemini.py の高さごとのパノラマを縦に1枚にする（下の高さから順に渡す）
+    stack_panoramas(["H200.jpg", "H300.jpg", "H400.jpg", "H500.jpg"], "mosaic.npy")
+
+    # 位置合わせの結果を元の解像度でタイルに合成する
+    status, registration = register_features(images, pairs="sequential", work_scale=0.25, seam_scale=0.25)
+    compose_tiled(registration, "panorama.npy")
+
+出力を .npy にすると、タイルの行ごとにファイルへ書き出すので最後までメモリは増えません
+（np.load(path, mmap_mode="r") で必要な部分だけ読めます）。.jpg などの画像形式では、
+書き出しのときに完成した画像（uint8）を一度だけメモリに作ります。
+
+コマンドラインからパノラマを縦につなぐ:
+
+    python -m tellolib.panorama.tiled H200.jpg H300.jpg H400.jpg H500.jpg --out mosaic.jpg
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from .features import warp_registered
+
+# タイルの一辺[ピクセル]。足し込み用のタイル1枚は TILE_SIZE**2 * 16 バイト（512 なら 4MB）
+TILE_SIZE = 512
+# 縦につなぐときの位置合わせに使う縮小画像の幅と、採用する位相相関の応答の下限
+MOSAIC_WORK_WIDTH = 480
+MOSAIC_MIN_RESPONSE = 0.05
+
+
+class TiledCanvas:
+    """
+    ディスク上のタイルに重み付きで画像を足し込むキャンバス。
+
+    足し込み用のファイルは (タイルの行, タイルの列, TILE, TILE, 4) の float32（B, G, R の重み付き和と重みの和）で、
+    1枚のタイルがファイル上で連続しているので、画像と重なるタイルだけを割り当てて読み書きできます。
+    一度も足し込まれなかったタイルはディスクも使いません（疎なファイル）。
+
+    Args:
+        width (int): キャンバスの幅。
+        height (int): キャンバスの高さ。
+        origin (tuple): キャンバスの左上の座標 (x, y)。add() に渡す座標はこれを基準にする。
+        tile (int): タイルの一辺[ピクセル]。
+        workdir (str): 足し込み用のファイルを置くフォルダ。省略時は一時フォルダ。
+        verbose (bool): ログを出すかどうか。
+    """
+
+    def __init__(self, width, height, origin=(0, 0), tile=TILE_SIZE, workdir=None, verbose=False):
+        self.width = int(width)
+        self.height = int(height)
+        self.origin = (int(origin[0]), int(origin[1]))
+        self.tile = int(tile)
+        self.verbose = verbose
+        self.rows = -(-self.height // self.tile)
+        self.cols = -(-self.width // self.tile)
+        self._tile_bytes = self.tile * self.tile * 4 * 4
+        fd, self.path = tempfile.mkstemp(prefix="tiles-", suffix=".f32", dir=workdir)
+        with os.fdopen(fd, "wb") as f:
+            f.truncate(self.rows * self.cols * self._tile_bytes)
+        self.touched = set()  # 足し込んだことのあるタイル (行, 列)
+        self.images = 0
+
+    def _tile(self, row, col, mode="r+"):
+        # 1枚のタイルだけを割り当てる。戻り値を捨てるとメモリからも外れる
+        offset = (row * self.cols + col) * self._tile_bytes
+        return np.memmap(self.path, np.float32, mode, offset, (self.tile, self.tile, 4))
+
+    def add(self, image, corner, weights):
+        """
+        画像を重み付きでキャンバスに足し込みます。
+
+        Args:
+            image (numpy.ndarray): BGR の画像。
+            corner (tuple): 画像の左上の座標 (x, y)（origin と同じ座標系）。
+            weights (numpy.ndarray): 画像と同じ大きさの重み（float32）。0 の画素は使わない。
+        """
+        x0, y0 = corner[0] - self.origin[0], corner[1] - self.origin[1]
+        h, w = image.shape[:2]
+        # キャンバスからはみ出す部分は切り捨てる
+        left, top = max(x0, 0), max(y0, 0)
+        right, bottom = min(x0 + w, self.width), min(y0 + h, self.height)
+        if right <= left or bottom <= top:
+            return
+        for row in range(top // self.tile, (bottom - 1) // self.tile + 1):
+            for col in range(left // self.tile, (right - 1) // self.tile + 1):
+                tx, ty = col * self.tile, row * self.tile
+                ix0, iy0 = max(left, tx), max(top, ty)
+                ix1, iy1 = min(right, tx + self.tile), min(bottom, ty + self.tile)
+                src = (slice(iy0 - y0, iy1 - y0), slice(ix0 - x0, ix1 - x0))
+                weight = weights[src]
+                if not weight.any():
+                    continue
+                accumulator = self._tile(row, col)
+                dst = (slice(iy0 - ty, iy1 - ty), slice(ix0 - tx, ix1 - tx))
+                accumulator[dst + (slice(0, 3),)] += image[src].astype(np.float32) * weight[..., None]
+                accumulator[dst + (3,)] += weight
+                accumulator.flush()
+                del accumulator
+                self.touched.add((row, col))
+        self.images += 1
+
+    def strips(self):
+        """
+        ブレンドの結果を、タイル1行分ずつ (y, 画像の帯) で返すジェネレータ（上から順に）。
+        """
+        for row in range(self.rows):
+            top = row * self.tile
+            height = min(self.tile, self.height - top)
+            strip = np.zeros((height, self.width, 3), np.uint8)
+            for col in range(self.cols):
+                if (row, col) not in self.touched:
+                    continue
+                left = col * self.tile
+                width = min(self.tile, self.width - left)
+                accumulator = self._tile(row, col, "r")[:height, :width]
+                total = accumulator[..., 3:]
+                strip[:, left:left + width] = np.clip(
+                    accumulator[..., :3] / np.maximum(total, 1e-6), 0, 255).astype(np.uint8)
+                del accumulator, total
+            yield top, strip
+
+    def save(self, path, params=None):
+        """
+        結果を path に保存します。.npy ならタイルの行ごとに書き出し、それ以外は cv2.imwrite で保存します。
+
+        Returns:
+            tuple: 保存した画像の (高さ, 幅, 3)。
+        """
+        started = time.perf_counter()
+        shape = (self.height, self.width, 3)
+        if path.lower().endswith(".npy"):
+            with open(path, "wb") as f:
+                np.lib.format.write_array_header_1_0(
+                    f, {"descr": np.lib.format.dtype_to_descr(np.dtype(np.uint8)), "fortran_order": False, "shape": shape})
+                for _, strip in self.strips():
+                    f.write(strip.tobytes())
+        else:
+            if not cv2.imwrite(path, self.to_array(), params or []):
+                raise IOError(f"画像を保存できませんでした: {path}")
+        if self.verbose:
+            print(f"[TILED] {self.width}x{self.height} を保存しました ({time.perf_counter() - started:.2f}秒) -> {path}")
+        return shape
+
+    def to_array(self):
+        """
+        結果を1枚の画像（numpy.ndarray）として返します（パノラマ全体の uint8 の配列を作る）。
+        """
+        result = np.empty((self.height, self.width, 3), np.uint8)
+        for top, strip in self.strips():
+            result[top:top + len(strip)] = strip
+        return result
+
+    def close(self):
+        """
+        足し込み用のファイルを削除します。
+        """
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def feather(mask, width):
+    """
+    マスクの縁から width ピクセルかけて 0 から 1 に上がる重みを返します（マスクの外は 0）。
+    """
+    weights = cv2.distanceTransform(mask, cv2.DIST_L2, 3)
+    return np.minimum(weights / max(float(width), 1.0), 1.0).astype(np.float32)
+
+
+def compose_tiled(registration, output_path, scale=1.0, blend_strength=5.0, tile=TILE_SIZE, workdir=None,
+                  verbose=False):
+    """
+    位置合わせの結果から、タイルに分けたキャンバスでパノラマを作って保存します（フェザーブレンド）。
+
+    compose_panorama と同じ投影・露出補正・継ぎ目を使いますが、パノラマ全体をメモリに持ちません。
+
+    Args:
+        registration (Registration): register_features の結果。
+        output_path (str): 保存先（.npy ならメモリを増やさずに書き出す）。
+        scale (float): 出力の解像度（元の画像に対する倍率）。
+        blend_strength (float): ブレンドの幅（パノラマの大きさに対する%）。
+        tile (int): タイルの一辺[ピクセル]。
+        workdir (str): 足し込み用のファイルを置くフォルダ。
+    Returns:
+        tuple: 保存した画像の (高さ, 幅, 3)。
+    """
+    started = time.perf_counter()
+    destination, warped = warp_registered(registration, scale)
+    x, y, width, height = destination
+    blend_width = np.sqrt(width * height) * blend_strength / 100
+    with TiledCanvas(width, height, (x, y), tile, workdir, verbose) as canvas:
+        for corner, image, mask in warped:
+            canvas.add(image, corner, feather(mask, blend_width))
+        shape = canvas.save(output_path)
+        if verbose:
+            print(f"[TILED] {canvas.images} 枚 / タイル {len(canvas.touched)}/{canvas.rows * canvas.cols} 枚 / "
+                  f"{time.perf_counter() - started:.2f}秒")
+    return shape
+
+
+def vertical_offset(lower, upper):
+    """
+    下の高さと上の高さのパノラマ（同じ幅の縮小グレースケール画像）の縦のずれを位相相関で求めます。
+
+    機体が上がると景色は画面の下へ動くので、上の高さのパノラマは下の高さのものより dy だけ上に置けば重なります。
+
+    Returns:
+        float: dy[ピクセル]。重なりが見つからなければ None。
+    """
+    height = max(lower.shape[0], upper.shape[0])
+    pad = [np.pad(np.float32(small), ((0, height - small.shape[0]), (0, 0)), mode="edge") for small in (lower, upper)]
+    window = cv2.createHanningWindow(pad[0].shape[::-1], cv2.CV_32F)
+    (_, dy), response = cv2.phaseCorrelate(pad[0], pad[1], window)
+    if response < MOSAIC_MIN_RESPONSE or dy <= 0:
+        return None
+    return float(dy)
+
+
+def stack_panoramas(paths, output_path, width=None, offsets=None, overlap=0.0, blend_height=32, tile=TILE_SIZE,
+                    workdir=None, verbose=True):
+    """
+    高さごとの360度パノラマを縦に1枚につなぎます（上の高さほど上に置く）。
+
+    画像は1枚ずつ読み込むので、メモリは一番大きなパノラマ1枚とタイル数枚分で済みます。
+
+    Args:
+        paths (list): パノラマの画像のパス（低い高さから順に）。
+        output_path (str): 保存先（.npy ならメモリを増やさずに書き出す）。
+        width (int): 出力の幅。省略時は一番狭いパノラマの幅（全て同じ幅に拡大縮小する）。
+        offsets (list): 隣り合うパノラマの縦のずれ[出力のピクセル]（len(paths) - 1 個）。
+            省略時は位相相関で求め、求まらない組は overlap で決める。
+        overlap (float): ずれが求まらないときの重なり（上の画像の高さに対する比。0 なら重ねずに並べる）。
+        blend_height (int): 重なりをなめらかにつなぐ幅[ピクセル]。
+        tile (int): タイルの一辺[ピクセル]。
+        workdir (str): 足し込み用のファイルを置くフォルダ。
+    Returns:
+        tuple: 保存した画像の (高さ, 幅, 3)。
+    """
+    if len(paths) < 1:
+        raise ValueError("パノラマが1枚もありません")
+    started = time.perf_counter()
+
+    # 1回目: 大きさと位置合わせ用の縮小画像だけを集める
+    sizes, smalls = [], []
+    for path in paths:
+        image = cv2.imread(path)
+        if image is None:
+            raise IOError(f"画像を読み込めませんでした: {path}")
+        sizes.append(image.shape[1::-1])
+        if offsets is None:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            small_h = max(1, int(round(image.shape[0] * MOSAIC_WORK_WIDTH / float(image.shape[1]))))
+            smalls.append(cv2.resize(gray, (MOSAIC_WORK_WIDTH, small_h), interpolation=cv2.INTER_AREA))
+        del image
+    width = int(width or min(w for w, _ in sizes))
+    heights = [int(round(h * width / float(w))) for w, h in sizes]
+
+    # 上の高さのパノラマの上端の位置（下の高さのものの上端を基準に上向きに積む）
+    if offsets is None:
+        offsets = []
+        for i in range(1, len(paths)):
+            dy = vertical_offset(smalls[i - 1], smalls[i])
+            if dy is not None and dy < heights[i]:
+                offsets.append(dy * width / float(MOSAIC_WORK_WIDTH))
+            else:
+                offsets.append(heights[i] * (1.0 - overlap))
+                if verbose:
+                    print(f"[TILED] {os.path.basename(paths[i])}: 重なりが見つからないので {overlap:.0%} 重ねて並べます")
+    tops = [0.0]
+    for dy in offsets:
+        tops.append(tops[-1] - dy)
+    tops = [int(round(t - min(tops))) for t in tops]
+    height = max(top + h for top, h in zip(tops, heights))
+
+    # 2回目: 1枚ずつ読み込んでタイルに足し込む
+    with TiledCanvas(width, height, tile=tile, workdir=workdir, verbose=verbose) as canvas:
+        for path, top, h in zip(paths, tops, heights):
+            image = cv2.resize(cv2.imread(path), (width, h), interpolation=cv2.INTER_AREA)
+            # 上下の端だけをなめらかにする（左右は360度でつながっている）
+            ramp = np.minimum(np.minimum(np.arange(h), np.arange(h)[::-1]) + 1.0, blend_height) / blend_height
+            weights = np.repeat(np.float32(ramp)[:, None], width, axis=1)
+            canvas.add(image, (0, top), weights)
+            del image, weights
+            if verbose:
+                print(f"[TILED] {os.path.basename(path)}: {width}x{h} を y={top} に重ねました")
+        shape = canvas.save(output_path)
+    if verbose:
+        print(f"[TILED] {len(paths)} 枚を縦につなぎました: {width}x{height} ({time.perf_counter() - started:.2f}秒)")
+    return shape
+
+
+def main():
+    parser = argparse.ArgumentParser(description="高さごとのパノラマを縦に1枚につなぎます（メモリを一定に保つ）")
+    parser.add_argument("panoramas", nargs="+", help="パノラマの画像（低い高さから順に）")
+    parser.add_argument("--out", default="mosaic.npy", help="保存先（.npy ならメモリを増やさずに書き出す）")
+    parser.add_argument("--width", type=int, default=None, help="出力の幅（省略時は一番狭いパノラマの幅）")
+    parser.add_argument("--overlap", type=float, default=0.0, help="ずれが求まらないときの重なり（0〜1）")
+    parser.add_argument("--tile", type=int, default=TILE_SIZE, help="タイルの一辺[ピクセル]")
+    args = parser.parse_args()
+    stack_panoramas(args.panoramas, args.out, width=args.width, overlap=args.overlap, tile=args.tile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,465 @@
+"""
+文字や図形の経路を、Tello のコマンド列に変換する経路コンパイラ。
+
+HEL.py の draw_h などは「回転してから前進」を1画ずつ書いているため、
+cw 90 / ccw 90 の打ち消し合う回転が多く、回転のたびに加減速と応答待ちが入ります。
+ここでは経路を離陸地点を原点とした座標（x: 前, y: 左, z: 上, 単位 cm）の折れ線として扱い、
+
+- 機首の向きを変えずに go x y z speed（円弧は curve）で直接移動する
+- 同じ向きに続く線分を1つにまとめる
+- 移動の合間の回転は最後に1回だけ（向きを戻す必要があるときのみ）行う
+
+ことでコマンド数と飛行時間を減らします。
+
+    python -m tellolib.planner 0612/kitano/HEL.py
+
+のようにスクリプトを渡すと、中のコマンドを読み取って最適化前後の見積もり時間を表示します。
+"""
+import argparse
+import ast
+import math
+import re
+
+from .protocol import (COMMAND_OVERHEAD_S, DEFAULT_SPEED_CM_S, DEFAULT_YAW_RATE_DEG_S, MOVE_COMMANDS,
+                       ROTATE_COMMANDS, command_type)
+
+GO_MIN_CM = 20        # go は x, y, z が全て ±20 未満だと受け付けられない
+GO_MAX_CM = 500       # go の各軸の上限
+CURVE_MIN_RADIUS_CM = 50
+CURVE_MAX_RADIUS_CM = 1000
+CURVE_MAX_SPEED = 60
+TAKEOFF_LAND_S = 5.0
+
+# 機首の向きを基準にした各移動コマンドの方向（前方から反時計回りの角度）
+DIRECTION_DEG = {"forward": 0, "left": 90, "back": 180, "right": -90}
+
+
+# --- 幾何 ---
+
+def _sub(a, b):
+    return tuple(x - y for x, y in zip(a, b))
+
+
+def _norm(v):
+    return math.sqrt(sum(x * x for x in v))
+
+
+def arc_geometry(p0, p1, p2):
+    """
+    p0 から p1 を通って p2 へ至る円弧の (半径, 弧長) を返します。3点が一直線上なら None。
+    """
+    a = math.dist(p1, p2)
+    b = math.dist(p0, p2)
+    c = math.dist(p0, p1)
+    s = (a + b + c) / 2
+    area = math.sqrt(max(s * (s - a) * (s - b) * (s - c), 0.0))
+    if area < 1e-6:
+        return None
+    radius = a * b * c / (4 * area)
+    angle = 2 * math.asin(min(1.0, b / (2 * radius)))
+    # p1 が短い方の弧に乗っていなければ長い方の弧を通る
+    if c * c + a * a < b * b:
+        angle = 2 * math.pi - angle
+    return radius, radius * angle
+
+
+# --- 経路 ---
+#
+# 経路は ("line", 終点) と ("arc", 経由点, 終点) のタプルのリストで表します。
+# 座標は全て離陸地点（または経路の開始点）を原点とした絶対座標です。
+
+def polyline(points):
+    """
+    点のリストを経路に変換します。points[0] が開始点です。
+    """
+    return [("line", tuple(float(c) for c in p)) for p in points[1:]]
+
+
+def trace(commands, yaw=0.0):
+    """
+    移動・回転コマンドの列を実行したときに通る経路を求めます。
+
+    Args:
+        commands (list): "forward 40", "cw 90", "go 50 0 0 40", "curve ..." などのコマンド列。
+        yaw (float): 開始時の機首の向き（度、反時計回りが正）。
+    Returns:
+        tuple: (経路, 終了時の機首の向き)
+    """
+    pos = (0.0, 0.0, 0.0)
+    path = []
+    for command in commands:
+        name = command_type(command)
+        args = [float(a) for a in command.split()[1:]]
+        if name in ROTATE_COMMANDS:
+            yaw += -args[0] if name == "cw" else args[0]
+            continue
+        if name in ("up", "down"):
+            end = (pos[0], pos[1], pos[2] + (args[0] if name == "up" else -args[0]))
+            path.append(("line", end))
+        elif name in DIRECTION_DEG:
+            rad = math.radians(yaw + DIRECTION_DEG[name])
+            end = (pos[0] + args[0] * math.cos(rad), pos[1] + args[0] * math.sin(rad), pos[2])
+            path.append(("line", end))
+        elif name == "go":
+            end = _add(pos, _rotate(args[0:3], yaw))
+            path.append(("line", end))
+        elif name == "curve":
+            via = _add(pos, _rotate(args[0:3], yaw))
+            end = _add(pos, _rotate(args[3:6], yaw))
+            path.append(("arc", via, end))
+        else:
+            raise ValueError(f"経路に変換できないコマンドです: {command}")
+        pos = end
+    return path, yaw
+
+
+def _rotate(v, yaw):
+    rad = math.radians(yaw)
+    return (v[0] * math.cos(rad) - v[1] * math.sin(rad), v[0] * math.sin(rad) + v[1] * math.cos(rad), v[2])
+
+
+def _add(a, b):
+    return tuple(x + y for x, y in zip(a, b))
+
+
+def simplify(path, start=(0.0, 0.0, 0.0), drop_spikes=False, tolerance=0.5):
+    """
+    長さ0の線分を除き、同じ向きに続く線分を1本にまとめます。
+
+    行って戻る線分（forward 40; back 40）は E の横棒のように描画の一部なので残しますが、
+    drop_spikes=True なら「行って戻るだけ」の往復を取り除きます（ペンを上げた移動向け）。
+
+    Args:
+        path (list): 経路。
+        start (tuple): 開始点。
+        drop_spikes (bool): 往復して元の点に戻るだけの線分の組を取り除くかどうか。
+        tolerance (float): 一直線とみなす距離の許容値（cm）。
+    Returns:
+        list: 簡略化した経路。
+    """
+    result = []
+    points = [tuple(start)]
+    for segment in path:
+        end = segment[-1]
+        if segment[0] == "line" and result and result[-1][0] == "line":
+            prev_start = points[-2]
+            prev_end = points[-1]
+            d1 = _sub(prev_end, prev_start)
+            d2 = _sub(end, prev_end)
+            if _norm(d2) < tolerance:
+                continue
+            cross = _norm((d1[1] * d2[2] - d1[2] * d2[1], d1[2] * d2[0] - d1[0] * d2[2],
+                           d1[0] * d2[1] - d1[1] * d2[0]))
+            dot = sum(x * y for x, y in zip(d1, d2))
+            collinear = cross / max(_norm(d1), 1e-9) < tolerance
+            if collinear and dot > 0:
+                result[-1] = ("line", end)
+                points[-1] = end
+                continue
+            if drop_spikes and math.dist(end, prev_start) < tolerance:
+                result.pop()
+                points.pop()
+                continue
+        elif segment[0] == "line" and math.dist(end, points[-1]) < tolerance:
+            continue
+        result.append(segment)
+        points.append(end)
+    return result
+
+
+def compile_path(path, start=(0.0, 0.0, 0.0), speed=DEFAULT_SPEED_CM_S):
+    """
+    経路を go / curve のコマンド列に変換します（機首の向きは変えない）。
+
+    座標は丸めた絶対位置の差分で出力するので、丸め誤差は蓄積しません。
+    Tello は x, y, z が全て 20cm 未満の go を受け付けないので、短すぎる線分はその場では動かず、
+    実際にいる位置から次の点へ直接向かう線分にまとめます（角が少し欠けるが、位置のずれは残らない）。
+    半径が範囲外の円弧は経由点を通る2本の線分で代用します。
+
+    Args:
+        path (list): 経路（開始点を原点とした絶対座標）。
+        start (tuple): 開始点。
+        speed (int): 移動速度（cm/s）。
+    Returns:
+        list: コマンド文字列のリスト。
+    Raises:
+        ValueError: 経路の最後に、まとめる先のない 20cm 未満の移動が残ったとき。
+    """
+    commands = []
+    current = tuple(int(round(c)) for c in start)
+    for segment in path:
+        if segment[0] == "arc":
+            via = tuple(int(round(c)) for c in segment[1])
+            end = tuple(int(round(c)) for c in segment[2])
+            geometry = arc_geometry(current, via, end)
+            if geometry and CURVE_MIN_RADIUS_CM <= geometry[0] <= CURVE_MAX_RADIUS_CM:
+                d1 = _sub(via, current)
+                d2 = _sub(end, current)
+                curve_speed = min(speed, CURVE_MAX_SPEED)
+                commands.append("curve {} {} {} {} {} {} {}".format(*d1, *d2, curve_speed))
+                current = end
+                continue
+            targets = [via, end]
+        else:
+            targets = [tuple(int(round(c)) for c in segment[1])]
+
+        for target in targets:
+            delta = _sub(target, current)
+            if max(abs(d) for d in delta) < GO_MIN_CM:
+                continue  # 動かずに、次の点へ向かう移動にまとめる
+            commands.extend(_line_commands(delta, speed))
+            current = target
+    if path:
+        rest = _sub(tuple(int(round(c)) for c in path[-1][-1]), current)
+        if any(rest):
+            raise ValueError(f"経路の最後の移動 {rest} は go で動けない短さです（どの軸も {GO_MIN_CM}cm 未満）")
+    return commands
+
+
+def _line_commands(delta, speed):
+    # 各軸の上限を超える場合は分割する（分割しても最も長い軸は GO_MIN_CM 以上のまま）
+    pieces = max(1, math.ceil(max(abs(d) for d in delta) / GO_MAX_CM))
+    commands = []
+    done = (0, 0, 0)
+    for i in range(1, pieces + 1):
+        target = tuple(int(round(d * i / pieces)) for d in delta)
+        commands.append("go {} {} {} {}".format(*_sub(target, done), speed))
+        done = target
+    return commands
+
+
+def _rotation(angle):
+    # 反時計回りを正とした角度を、小さい方の回転コマンドにする
+    angle = (angle + 180) % 360 - 180
+    if angle > 0:
+        return [f"ccw {angle}"]
+    if angle < 0:
+        return [f"cw {-angle}"]
+    return []
+
+
+def optimize_commands(commands, speed=DEFAULT_SPEED_CM_S, keep_heading=True, drop_spikes=False):
+    """
+    コマンド列のうち、連続する移動・回転の部分を go / curve に置き換えます。
+
+    takeoff や streamon などの移動以外のコマンドはそのままの位置に残します。
+
+    Args:
+        commands (list): 元のコマンド列。
+        speed (int): go / curve の速度（cm/s）。
+        keep_heading (bool): 移動部分の終わりで元のコマンド列と同じ向きになるよう回転を足すかどうか
+            （直後が land の場合は足さない）。
+        drop_spikes (bool): simplify の drop_spikes を参照。
+    Returns:
+        list: 最適化したコマンド列。
+    """
+    result = []
+    block = []
+
+    def flush(restore_heading):
+        if not block:
+            return
+        path, yaw = trace(block)
+        result.extend(compile_path(simplify(path, drop_spikes=drop_spikes), speed=speed))
+        if restore_heading:
+            result.extend(_rotation(int(round(yaw))))
+        block.clear()
+
+    for command in commands:
+        name = command_type(command)
+        if name in MOVE_COMMANDS or name in ROTATE_COMMANDS or name in ("go", "curve"):
+            block.append(command)
+        else:
+            # 着陸の直前なら向きを戻す必要はない
+            flush(keep_heading and name != "land")
+            result.append(command)
+    flush(keep_heading)
+    return result
+
+
+# --- 所要時間の見積もり ---
+
+def estimate_command_time(command, speed=DEFAULT_SPEED_CM_S, yaw_rate=DEFAULT_YAW_RATE_DEG_S,
+                          overhead=COMMAND_OVERHEAD_S):
+    """
+    1コマンドの所要時間（秒）を見積もります。
+    """
+    name = command_type(command)
+    args = [float(a) for a in re.findall(r"-?\d+(?:\.\d+)?", command)]
+    if name in ("takeoff", "land"):
+        return TAKEOFF_LAND_S
+    if name in MOVE_COMMANDS:
+        return args[0] / speed + overhead
+    if name in ROTATE_COMMANDS:
+        return args[0] / yaw_rate + overhead
+    if name == "go":
+        return _norm(args[0:3]) / args[3] + overhead
+    if name == "curve":
+        geometry = arc_geometry((0, 0, 0), tuple(args[0:3]), tuple(args[3:6]))
+        length = geometry[1] if geometry else _norm(args[3:6])
+        return length / args[6] + overhead
+    if name == "rc":
+        return 0.0
+    return overhead
+
+
+def estimate_time(commands, speed=DEFAULT_SPEED_CM_S, yaw_rate=DEFAULT_YAW_RATE_DEG_S,
+                  overhead=COMMAND_OVERHEAD_S):
+    """
+    コマンド列全体の所要時間（秒）を見積もります。
+    """
+    return sum(estimate_command_time(c, speed, yaw_rate, overhead) for c in commands)
+
+
+def print_report(before, after, speed=DEFAULT_SPEED_CM_S):
+    t_before = estimate_time(before, speed)
+    t_after = estimate_time(after, speed)
+    rotations = sum(command_type(c) in ROTATE_COMMANDS for c in before)
+    print(f"[PLAN] 最適化前: {len(before):3d} コマンド (回転 {rotations}) 見積もり {t_before:6.1f} 秒")
+    print(f"[PLAN] 最適化後: {len(after):3d} コマンド 見積もり {t_after:6.1f} 秒"
+          f" ({(1 - t_after / t_before) * 100 if t_before else 0:.0f}% 短縮)")
+
+
+# --- スクリプトからのコマンド抽出 ---
+
+_DJITELLOPY_METHODS = {
+    "move_up": "up", "move_down": "down", "move_left": "left", "move_right": "right",
+    "move_forward": "forward", "move_back": "back", "rotate_clockwise": "cw",
+    "rotate_counter_clockwise": "ccw", "go_xyz_speed": "go", "curve_xyz_speed": "curve",
+    "takeoff": "takeoff", "land": "land", "streamon": "streamon", "streamoff": "streamoff",
+}
+
+
+def extract_commands(source):
+    """
+    スクリプトのソースから、送信しているコマンドを出現順に取り出します。
+
+    send_command("...") / tello.send("...") の文字列と、djitellopy のメソッド呼び出し
+    （tello.move_forward(50) など）に対応します。引数や f 文字列の中身が数値を代入した変数
+    （side_length = 100 など）なら値を展開し、それ以外の式を含む呼び出しは読み飛ばします。
+    コマンドの文字列のリストを代入した変数（HEL.py の DRAW_H や、それらを + でつないだ commands）を
+    for 文で回して送っている場合は、リストの中身を順に展開します。
+    except 節の中の呼び出し（エラー時の着陸など）は含めません。
+    """
+    tree = ast.parse(source)
+    constants = {}
+
+    def value(node):
+        if isinstance(node, ast.Constant):
+            return node.value
+        if isinstance(node, ast.Name) and node.id in constants:
+            return constants[node.id]
+        if isinstance(node, (ast.List, ast.Tuple)):
+            items = [value(e) for e in node.elts]
+            return None if any(i is None for i in items) else items
+        if isinstance(node, ast.BinOp):
+            left, right = value(node.left), value(node.right)
+            if isinstance(left, list) and isinstance(right, list) and isinstance(node.op, ast.Add):
+                return left + right
+            if isinstance(left, (int, float)) and isinstance(right, (int, float)):
+                ops = {ast.Add: left + right, ast.Sub: left - right, ast.Mult: left * right}
+                return ops.get(type(node.op))
+        if isinstance(node, ast.JoinedStr):
+            parts = []
+            for part in node.values:
+                inner = value(part.value) if isinstance(part, ast.FormattedValue) else part.value
+                if inner is None:
+                    return None
+                parts.append(str(inner))
+            return "".join(parts)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            inner = value(node.operand)
+            return -inner if isinstance(inner, (int, float)) else None
+        return None
+
+    # 数値とコマンドのリストを代入した変数（ast.walk は浅い順なので、モジュールの定数が先に決まる）。
+    # 値の分からない式で代入し直す変数（commands = optimized など）は最初の値のままにする
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign):
+            assigned = value(node.value)
+            if isinstance(assigned, (int, float)) or \
+                    (isinstance(assigned, list) and all(isinstance(i, str) for i in assigned)):
+                for target in node.targets:
+                    if isinstance(target, ast.Name):
+                        constants.setdefault(target.id, assigned)
+
+    # for command in commands: send(command) の呼び出しごとに、送る文字列のリスト
+    loops = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.For) and isinstance(node.target, ast.Name):
+            items = value(node.iter)
+            if not isinstance(items, list):
+                continue
+            for child in ast.walk(node):
+                if isinstance(child, ast.Call) and child.args and isinstance(child.args[0], ast.Name) \
+                        and child.args[0].id == node.target.id:
+                    loops[id(child)] = items
+
+    commands = []
+    for node in _walk_in_order(tree):
+        if not isinstance(node, ast.Call) or not isinstance(node.func, (ast.Attribute, ast.Name)):
+            continue
+        name = node.func.attr if isinstance(node.func, ast.Attribute) else node.func.id
+        if name in ("send_command", "send") and id(node) in loops:
+            commands.extend(loops[id(node)])
+            continue
+        args = [value(a) for a in node.args]
+        if name in ("send_command", "send") and args and isinstance(args[0], str):
+            commands.append(args[0])
+        elif name in _DJITELLOPY_METHODS and all(isinstance(a, (int, float)) for a in args):
+            commands.append(" ".join([_DJITELLOPY_METHODS[name]] + [str(int(a)) for a in args]))
+    return commands
+
+
+def _walk_in_order(tree):
+    # 関数定義は呼び出された位置で展開する（HEL.py の draw_h() など）
+    functions = {node.name: node for node in ast.walk(tree)
+                 if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))}
+    entry = functions.get("main")
+    body = entry.body if entry is not None else [n for n in tree.body
+                                                 if not isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+
+    def visit(nodes, depth):
+        for node in nodes:
+            for child in _iter_calls(node):
+                yield child
+                callee = child.func.id if isinstance(child.func, ast.Name) else None
+                if callee in functions and depth < 10:
+                    yield from visit(functions[callee].body, depth + 1)
+
+    yield from visit(body, 0)
+
+
+def _iter_calls(node):
+    # ソース上の出現順に Call ノードを返す（except 節は除く）
+    calls = []
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, ast.ExceptHandler):
+            continue
+        if isinstance(current, ast.Call):
+            calls.append(current)
+        stack.extend(ast.iter_child_nodes(current))
+    return sorted(calls, key=lambda n: (n.lineno, n.col_offset))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="飛行スクリプトのコマンド列を最適化して見積もり時間を比較します")
+    parser.add_argument("script", help="HEL.py などの飛行スクリプト")
+    parser.add_argument("--speed", type=int, default=DEFAULT_SPEED_CM_S)
+    parser.add_argument("--drop-spikes", action="store_true", help="行って戻るだけの往復を取り除く")
+    parser.add_argument("--show", action="store_true", help="最適化後のコマンド列を表示する")
+    args = parser.parse_args()
+
+    with open(args.script, encoding="utf-8") as f:
+        before = extract_commands(f.read())
+    after = optimize_commands(before, speed=args.speed, drop_spikes=args.drop_spikes)
+    print_report(before, after, args.speed)
+    if args.show:
+        for command in after:
+            print(f"  {command}")
+
+
+if __name__ == "__main__":
+    main()
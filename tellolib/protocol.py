@@ -0,0 +1,96 @@
+"""
+Tello SDK のテキストプロトコルに関する定数と小さなヘルパー。
+"""
+import os
+import re
+
+# 環境変数 TELLO_IP で接続先を切り替えられる（例: シミュレータなら 127.0.0.1）
+TELLO_IP = os.environ.get("TELLO_IP", '192.168.10.1')
+TELLO_PORT = 8889        # コマンドの送受信
+TELLO_STATE_PORT = 8890  # 状態（テレメトリ）の受信
+TELLO_VIDEO_PORT = 11111 # 映像ストリームの受信
+
+# Tello がコマンドを実行する最低速度（cm/s）。移動コマンドのタイムアウト計算に使う
+MIN_SPEED_CM_S = 10
+# 所要時間の見積もりとシミュレータで使う標準の移動速度（cm/s）と回転速度（度/s）
+DEFAULT_SPEED_CM_S = 50
+DEFAULT_YAW_RATE_DEG_S = 90
+# 移動1回ごとの加減速と応答にかかる時間（秒）
+COMMAND_OVERHEAD_S = 0.5
+# 満充電からの飛行時間（秒）。電池の消費の見積もりとシミュレータで使う
+BATTERY_FLIGHT_TIME_S = 900
+# 離陸した直後の高さ（cm）
+TAKEOFF_HEIGHT_CM = 80
+
+# 同じコマンドを何度送っても結果が変わらないもの（再送しても安全）
+IDEMPOTENT_COMMANDS = {"command", "streamon", "streamoff", "speed", "wifi", "mon", "moff", "ap", "port"}
+MOVE_COMMANDS = {"up", "down", "left", "right", "forward", "back"}
+ROTATE_COMMANDS = {"cw", "ccw"}
+
+
+def command_type(command):
+    """
+    コマンド文字列から種類（先頭の単語）を返します。例: "forward 40" -> "forward"
+    """
+    return command.split()[0] if command.strip() else ""
+
+
+def command_policy(command):
+    """
+    コマンドに応じたタイムアウト（秒）と再送回数を返します。
+
+    移動系コマンドは応答がないまま再送すると二重に動いてしまうため再送しません。
+    問い合わせ（"battery?" など）と設定系コマンドは何度送っても安全なので再送します。
+
+    Args:
+        command (str): Tello に送るコマンド文字列。
+    Returns:
+        tuple: (timeout_sec, retries)。timeout_sec が None のコマンドは応答を待ちません。
+    """
+    name = command_type(command)
+    args = [int(a) for a in re.findall(r"-?\d+", command)]
+
+    if name == "rc":
+        return None, 0  # rc には応答が返らない
+    if name.endswith("?") or name in IDEMPOTENT_COMMANDS:
+        return 3.0, 3
+    if name == "emergency":
+        return 1.0, 3
+    if name in ("takeoff", "land"):
+        return 20.0, 0
+    if name in MOVE_COMMANDS:
+        distance = args[0] if args else 500
+        return 5.0 + distance / MIN_SPEED_CM_S, 0
+    if name in ROTATE_COMMANDS:
+        return 10.0, 0
+    if name in ("go", "curve"):
+        speed = max(args[-1], MIN_SPEED_CM_S) if args else MIN_SPEED_CM_S
+        distance = sum(abs(a) for a in args[:-1]) or 500
+        return 5.0 + distance / speed, 0
+    return 10.0, 0
+
+
+def parse_state(packet):
+    """
+    状態パケット "pitch:0;roll:0;yaw:-3;...;agz:-1001.00;" を辞書に変換します。
+
+    Args:
+        packet (bytes | str): UDP 8890 番ポートで受信したデータ。
+    Returns:
+        dict: {"pitch": 0, "roll": 0, "yaw": -3, ..., "agz": -1001.0}
+    """
+    if isinstance(packet, bytes):
+        packet = packet.decode('ascii', 'replace')
+    state = {}
+    for field in packet.strip().split(';'):
+        key, sep, value = field.partition(':')
+        if not sep:
+            continue
+        try:
+            state[key] = int(value)
+        except ValueError:
+            try:
+                state[key] = float(value)
+            except ValueError:
+                state[key] = value
+    return state
@@ -0,0 +1,155 @@
+"""
+撮影候補のフレームを鮮明さ・露出・直前の撮影との重なりで採点し、一番良い1枚を選ぶ。
+
+パノラマの各方向で frame_read.frame を1枚だけ撮ると、ブレた画像や回転前と同じ画像が
+そのまま合成に入り、特徴点の一致に失敗する原因になります。FrameSelector は直近の N 枚を
+縮小したグレースケール画像でまとめて採点して、合成に向いた1枚を返します。
+
+    selector = FrameSelector(n=5)
+    best = selector.select(candidates)   # candidates は直近のフレームのリスト
+    selector.print_stats()
+
+SettleTrigger(selector=...) に渡すと、落ち着くのを待つ間に届いたフレームから自動で選びます。
+OpenCV と NumPy が必要です。
+"""
+import collections
+import time
+
+import cv2
+import numpy as np
+
+FrameScore = collections.namedtuple("FrameScore", ["sharpness", "exposure", "overlap", "shift", "score"])
+
+# 白飛び・黒つぶれとみなす輝度
+DARK_LEVEL = 8
+BRIGHT_LEVEL = 247
+# 移動がほとんどなく、位相相関の応答がこれより強ければ同じ画像とみなす
+DUPLICATE_RESPONSE = 0.3
+
+
+def sharpness(stack):
+    """
+    縮小画像の束（枚数, 高さ, 幅）の各画像のラプラシアンの分散を返します（大きいほど鮮明）。
+    """
+    stack = stack.astype(np.float32)
+    laplacian = (4.0 * stack[:, 1:-1, 1:-1] - stack[:, :-2, 1:-1] - stack[:, 2:, 1:-1]
+                 - stack[:, 1:-1, :-2] - stack[:, 1:-1, 2:])
+    return laplacian.reshape(len(stack), -1).var(axis=1)
+
+
+def exposure(stack):
+    """
+    各画像の露出の良さを 0〜1 で返します（平均輝度が中間に近く、白飛び・黒つぶれが少ないほど高い）。
+    """
+    flat = stack.reshape(len(stack), -1)
+    mean = flat.mean(axis=1)
+    clipped = ((flat <= DARK_LEVEL) | (flat >= BRIGHT_LEVEL)).mean(axis=1)
+    return np.clip(1.0 - np.abs(mean - 128.0) / 128.0 - clipped, 0.0, 1.0)
+
+
+class FrameSelector:
+    """
+    候補のフレームから合成に使う1枚を選びます。
+
+    Args:
+        n (int): 1つの方向で比べる候補の数（SettleTrigger はこの数だけ直近のフレームを残す）。
+        work_width (int): 採点に使う縮小画像の幅。
+        min_shift (float): 直前に選んだ画像からの移動量がこれ未満（画像の幅に対する比）で
+            相関も強ければ、回転前と同じ画像とみなして選ばない。
+        min_overlap (float): 直前に選んだ画像との位相相関の応答がこれ未満なら重なりが少ないとみなし、点数を半分にする。
+        verbose (bool): ログを出すかどうか。
+    """
+
+    def __init__(self, n=5, work_width=240, min_shift=0.02, min_overlap=0.02, verbose=True):
+        self.n = n
+        self.work_width = work_width
+        self.min_shift = min_shift
+        self.min_overlap = min_overlap
+        self.verbose = verbose
+        self.records = []  # 選ぶたびの (選んだ FrameScore, 候補の数, 処理時間[秒])
+        self._previous = None
+        self._window = None
+
+    def reset(self):
+        """
+        直前に選んだ画像を忘れます（高さを変えて撮り直すときなど）。
+        """
+        self._previous = None
+
+    def _smalls(self, frames):
+        h, w = frames[0].shape[:2]
+        size = (self.work_width, max(1, int(round(h * self.work_width / float(w)))))
+        smalls = []
+        for frame in frames:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+            smalls.append(cv2.resize(gray, size, interpolation=cv2.INTER_AREA))
+        return np.stack(smalls)
+
+    def _overlap(self, small):
+        # 直前に選んだ画像との重なり（位相相関の応答）、移動量（幅に対する比）、点数にかける係数
+        if self._previous is None:
+            return 1.0, None, 1.0
+        if self._window is None or self._window.shape != small.shape:
+            self._window = cv2.createHanningWindow(small.shape[::-1], cv2.CV_32F)
+        (dx, dy), response = cv2.phaseCorrelate(self._previous, np.float32(small), self._window)
+        shift = float(np.hypot(dx, dy)) / small.shape[1]
+        if shift < self.min_shift and response > DUPLICATE_RESPONSE:
+            return float(response), shift, 0.0  # 回転前と同じ画像
+        if response < self.min_overlap:
+            return float(response), shift, 0.5
+        return float(response), shift, 1.0
+
+    def score(self, frames):
+        """
+        各フレームの FrameScore のリストを返します。
+        """
+        frames = [f for f in frames if f is not None]
+        return self._score(frames)[0] if frames else []
+
+    def _score(self, frames):
+        # 大きさの違うフレームは採点しない（ストリーム開始直後の小さな画像など）
+        shape = frames[-1].shape
+        smalls = self._smalls([f if f.shape == shape else cv2.resize(f, (shape[1], shape[0])) for f in frames])
+        sharp = sharpness(smalls)
+        expo = exposure(smalls)
+        best_sharp = float(sharp.max()) or 1.0
+        scores = []
+        for i, small in enumerate(smalls):
+            overlap, shift, factor = self._overlap(small)
+            total = (sharp[i] / best_sharp) * (0.5 + 0.5 * expo[i]) * factor
+            scores.append(FrameScore(float(sharp[i]), float(expo[i]), overlap, shift, float(total)))
+        return scores, smalls
+
+    def select(self, frames):
+        """
+        候補から一番点数の高いフレームを返し、次の方向との比較のために覚えておきます。
+
+        全ての候補が直前の画像と同じときは、最も鮮明なものを返します。
+        """
+        frames = [f for f in frames if f is not None]
+        if not frames:
+            return None
+        started = time.perf_counter()
+        scores, smalls = self._score(frames)
+        if max(s.score for s in scores) > 0:
+            best = max(range(len(frames)), key=lambda i: scores[i].score)
+        else:
+            best = max(range(len(frames)), key=lambda i: scores[i].sharpness)
+        self._previous = np.float32(smalls[best])
+        elapsed = time.perf_counter() - started
+        self.records.append((scores[best], len(frames), elapsed))
+        if self.verbose:
+            s = scores[best]
+            shift = "-" if s.shift is None else f"{s.shift * 100:.0f}%"
+            print(f"[SELECT] {len(frames)} 枚中 {best + 1} 枚目: 鮮明さ {s.sharpness:.0f} 露出 {s.exposure:.2f} "
+                  f"重なり {s.overlap:.2f} 移動 {shift} ({elapsed * 1000:.1f}ms)")
+        return frames[best]
+
+    def print_stats(self):
+        if not self.records:
+            return
+        times = [r[2] for r in self.records]
+        frames = sum(r[1] for r in self.records)
+        duplicates = sum(1 for r in self.records if r[0].score == 0)
+        print(f"[SELECT] {len(self.records)} 方向: 候補 {frames} 枚 / 1枚あたり {sum(times) / frames * 1000:.1f}ms / "
+              f"回転前と同じ画像しかなかった方向 {duplicates}")
@@ -0,0 +1,357 @@
+"""
+電池の残量と所要時間を見積もって、高さごとの撮影の順番と、どこまで飛ぶかを決めるスケジューラ。
+
+0619_gemini.py はこれまで高さのリスト [200, 300, 400, 500] を決まった順に飛び、離陸前に電池が 20% 以上かを
+見るだけでした。ここでは高さごとの撮影（上昇・下降と1周分の撮影）を1組として、
+
+- コマンドの種類ごとの所要時間、撮影前に落ち着くまでの時間、飛行1秒あたりの電池の消費を、
+  これまでの飛行の記録（EnergyModel）から見積もる
+- 上昇・下降と着陸の時間が最も短くなる順番（今の高さから近い端へ向かい、折り返す掃引）に並べる
+- 電池の残量から予備を引いた分に収まる組だけを選び、組の途中で電池が尽きないようにする
+- 組を撮り終えるごとに進み具合をファイルに書き、足りなくなったら着陸して次の飛行で続きから撮る
+
+ようにします。記録は JSON のファイルに飛行のたびに足していきます。
+
+    python -m tellolib.scheduler --heights 200 300 400 500 --battery 45   # 順番と見積もりだけを表示
+"""
+import argparse
+import collections
+import json
+import os
+import re
+import time
+
+from .planner import TAKEOFF_LAND_S
+from .protocol import (BATTERY_FLIGHT_TIME_S, COMMAND_OVERHEAD_S, DEFAULT_SPEED_CM_S, DEFAULT_YAW_RATE_DEG_S,
+                       MOVE_COMMANDS, ROTATE_COMMANDS, TAKEOFF_HEIGHT_CM, command_type)
+
+MIN_MOVE_CM = 20          # up / down が受け付ける最小の距離
+SETTLE_PRIOR_S = 2.0      # 記録がないときの、回転してから撮影できるまでの時間（SettleTrigger のタイムアウト）
+MIN_FLIGHT_S = 60         # 電池の消費を記録から求めるのに必要な飛行時間（残量は 1% 刻みなので短いと測れない）
+
+# 1組の撮影。height は地上からの高さ（cm）、priority が小さい組から電池が足りないときに外す
+CaptureSet = collections.namedtuple("CaptureSet", ["label", "height", "shots", "step_deg", "priority", "output"],
+                                    defaults=(12, 30, 0, None))
+# 計画。sets は飛ぶ順、skipped は電池に収まらず外した組、time は着陸までの秒数、battery は消費する%
+Schedule = collections.namedtuple("Schedule", ["sets", "skipped", "time", "battery"])
+
+
+def _amount(command):
+    # 移動距離・回転角など、所要時間に比例する量（引数のないコマンドは 0）
+    args = [float(a) for a in re.findall(r"-?\d+(?:\.\d+)?", command)]
+    return abs(args[0]) if args else 0.0
+
+
+def _prior(name):
+    # 記録がないときの (固定の時間, 量あたりの時間)。planner.estimate_command_time と同じ値
+    if name in ("takeoff", "land"):
+        return TAKEOFF_LAND_S, 0.0
+    if name in MOVE_COMMANDS:
+        return COMMAND_OVERHEAD_S, 1.0 / DEFAULT_SPEED_CM_S
+    if name in ROTATE_COMMANDS:
+        return COMMAND_OVERHEAD_S, 1.0 / DEFAULT_YAW_RATE_DEG_S
+    return COMMAND_OVERHEAD_S, 0.0
+
+
+class EnergyModel:
+    """
+    これまでの飛行の記録から、コマンドと撮影の所要時間と電池の消費を見積もります。
+
+    コマンドの種類ごとに「所要時間 = 固定の時間 + 量 × 量あたりの時間」を最小二乗で当てはめ、
+    記録が少ないうちは planner と同じ既定の値を使います。記録は合計だけを持つので、ファイルは大きくなりません。
+
+    Args:
+        path (str): 記録を保存する JSON のファイル。
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.commands = {}           # 種類 -> [回数, Σ量, Σ時間, Σ量², Σ量×時間]
+        self.settle = [0, 0.0]       # 回数, Σ落ち着くまでの時間
+        self.flights = [0, 0.0, 0.0]  # 回数, Σ飛行時間, Σ消費した%
+        self.sets = [0, 0.0]         # 回数, Σ(実際の時間 / 見積もり)
+
+    @classmethod
+    def load(cls, path):
+        """
+        path の記録を読み込みます（ファイルがなければ記録なしの状態で作る）。
+        """
+        model = cls(path)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            model.commands = data.get("commands", {})
+            model.settle = data.get("settle", model.settle)
+            model.flights = data.get("flights", model.flights)
+            model.sets = data.get("sets", model.sets)
+        return model
+
+    def save(self, path=None):
+        path = path or self.path
+        if path is None:
+            return
+        data = {"commands": self.commands, "settle": self.settle, "flights": self.flights, "sets": self.sets}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+
+    # --- 記録 ---
+
+    def observe_command(self, command, seconds):
+        x = _amount(command)
+        sums = self.commands.setdefault(command_type(command), [0, 0.0, 0.0, 0.0, 0.0])
+        for i, value in enumerate((1, x, seconds, x * x, x * seconds)):
+            sums[i] += value
+
+    def observe_log(self, records):
+        """
+        TelloClient.records（CommandLog）の応答が ok だったコマンドの所要時間を記録します。
+        """
+        for record in records:
+            if record.response == "ok":
+                self.observe_command(record.command, record.latency)
+
+    def observe_settle(self, seconds):
+        self.settle[0] += 1
+        self.settle[1] += seconds
+
+    def observe_flight(self, seconds, used_percent):
+        """
+        飛行時間と、その間に減った電池の%を記録します。
+        """
+        self.flights[0] += 1
+        self.flights[1] += seconds
+        self.flights[2] += used_percent
+
+    def observe_set(self, predicted, actual):
+        """
+        1組の撮影の見積もり（補正なし）と実際の時間を記録します。
+        time.sleep での待機など、コマンドの記録に現れない時間はこの比で補正します。
+        """
+        if predicted > 0:
+            self.sets[0] += 1
+            self.sets[1] += actual / predicted
+
+    # --- 見積もり ---
+
+    def command_time(self, command):
+        """
+        1コマンドの所要時間（秒）を見積もります。
+        """
+        name = command_type(command)
+        intercept, slope = _prior(name)
+        x = _amount(command)
+        n, sx, sy, sxx, sxy = self.commands.get(name, (0, 0.0, 0.0, 0.0, 0.0))
+        if n:
+            mean_x, mean_y = sx / n, sy / n
+            variance = sxx / n - mean_x ** 2
+            if n >= 3 and variance > 1.0:
+                fitted = (sxy / n - mean_x * mean_y) / variance
+                if fitted >= 0:
+                    slope = fitted
+            intercept = max(mean_y - slope * mean_x, 0.0)
+        return intercept + slope * x
+
+    @property
+    def settle_time(self):
+        return self.settle[1] / self.settle[0] if self.settle[0] else SETTLE_PRIOR_S
+
+    @property
+    def drain_rate(self):
+        """
+        飛行1秒あたりに減る電池の%。
+        """
+        if self.flights[1] >= MIN_FLIGHT_S and self.flights[2] > 0:
+            return self.flights[2] / self.flights[1]
+        return 100.0 / BATTERY_FLIGHT_TIME_S
+
+    @property
+    def correction(self):
+        return self.sets[1] / self.sets[0] if self.sets[0] else 1.0
+
+    def climb_time(self, from_height, to_height):
+        change = to_height - from_height
+        if abs(change) < MIN_MOVE_CM:
+            return 0.0
+        return self.command_time(f"{'up' if change > 0 else 'down'} {abs(change)}")
+
+    def set_time(self, capture_set, from_height, corrected=True):
+        """
+        from_height から capture_set の高さへ移動して1周撮り終えるまでの時間（秒）を見積もります。
+        """
+        shots = capture_set.shots * self.settle_time
+        shots += (capture_set.shots - 1) * self.command_time(f"cw {capture_set.step_deg}")
+        seconds = self.climb_time(from_height, capture_set.height) + shots
+        return seconds * self.correction if corrected else seconds
+
+    def battery(self, seconds):
+        return seconds * self.drain_rate
+
+
+def load_progress(path):
+    """
+    撮り終えた組のラベルのリストを返します（ファイルがなければ空のリスト）。
+    """
+    if path is None or not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("done", [])
+
+
+def save_progress(path, done, pending):
+    if path is None:
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"done": done, "pending": [s.label for s in pending]}, f, ensure_ascii=False, indent=1)
+
+
+class CaptureScheduler:
+    """
+    高さごとの撮影を、電池に収まる範囲で上昇・下降の少ない順に実行します。
+
+    Args:
+        model (EnergyModel): 所要時間と電池の消費の見積もり。
+        reserve (float): 着陸したときに残しておく電池の%。
+    """
+
+    def __init__(self, model=None, reserve=20, verbose=True):
+        self.model = model or EnergyModel()
+        self.reserve = reserve
+        self.verbose = verbose
+
+    def cost(self, ordered, start_height):
+        """
+        ordered の順に撮影して着陸するまでの時間（秒）を見積もります。
+        """
+        seconds = 0.0
+        height = start_height
+        for capture_set in ordered:
+            seconds += self.model.set_time(capture_set, height)
+            height = capture_set.height
+        return seconds + self.model.command_time("land")
+
+    def order(self, sets, start_height):
+        """
+        撮影の順番を決めます。
+
+        高さは一直線上に並ぶので、最短の順番は「今の高さから片方の端まで進み、折り返してもう片方の端まで進む」
+        掃引のどれかになります。上昇と下降で速さが違うので、両方の向きの掃引を見積もって短い方を選びます。
+        """
+        ascending = sorted(sets, key=lambda s: s.height)
+        below = [s for s in ascending if s.height < start_height]
+        above = [s for s in ascending if s.height >= start_height]
+        candidates = [above + below[::-1], below[::-1] + above, ascending, ascending[::-1]]
+        return min(candidates, key=lambda ordered: self.cost(ordered, start_height))
+
+    def plan(self, sets, battery, start_height=TAKEOFF_HEIGHT_CM, takeoff=False):
+        """
+        電池の残量 battery（%）で撮れる組と順番を決めて Schedule を返します。
+
+        全ての組が収まらないときは、priority が小さく、今の高さから遠い組から外していきます。
+        takeoff なら離陸の時間も含めて見積もります（離陸前の確認用）。
+        """
+        budget = battery - self.reserve
+        extra = self.model.command_time("takeoff") if takeoff else 0.0
+        chosen = list(sets)
+        skipped = []
+        while True:
+            ordered = self.order(chosen, start_height)
+            seconds = self.cost(ordered, start_height) + extra if ordered else 0.0
+            if not ordered or self.model.battery(seconds) <= budget:
+                break
+            drop = min(chosen, key=lambda s: (s.priority, -abs(s.height - start_height)))
+            chosen.remove(drop)
+            skipped.append(drop)
+        return Schedule(ordered, skipped, seconds, self.model.battery(seconds))
+
+    def print_plan(self, schedule, battery):
+        order = " -> ".join(s.label for s in schedule.sets) or "なし"
+        print(f"[SCHED] 順番: {order} / 見積もり {schedule.time:.0f}秒 / 電池 {schedule.battery:.1f}% "
+              f"(残り {battery:.0f}%, 予備 {self.reserve}%)")
+        if schedule.skipped:
+            print(f"[SCHED] 電池に収まらないので後回し: {', '.join(s.label for s in schedule.skipped)}")
+
+    def pending(self, sets, progress_path):
+        """
+        前回までに撮り終えた組を除いた sets を返します。
+        """
+        done = load_progress(progress_path)
+        if done and self.verbose:
+            print(f"[SCHED] 前回までに撮影済み: {', '.join(done)}")
+        return [s for s in sets if s.label not in done]
+
+    def run(self, sets, capture, battery, height, progress_path=None):
+        """
+        離陸した後に呼び、撮影できる組を順に capture(capture_set) で撮影します。
+
+        1組撮るごとに電池の残量 battery() と高さ height() を読み直して残りの計画を立て直し、
+        次の組を撮り終えて着陸するまでの電池が予備を割るなら、その組には手をつけずに戻ります。
+        着陸は呼び出した側で行ってください。
+
+        Args:
+            sets (list): CaptureSet のリスト（撮り終えた組は progress_path から読んで除く）。
+            capture (callable): 1組を撮影する関数。高さへの移動も含む。
+            battery (callable): 電池の残量（%）を返す関数。
+            height (callable): 今の高さ（cm）を返す関数。
+            progress_path (str): 進み具合を保存するファイル。全て撮り終えたら削除する。
+        Returns:
+            tuple: (撮り終えた組のラベルのリスト（前回までの分を含む）, 撮れなかった組のリスト)
+        """
+        done = load_progress(progress_path)
+        pending = [s for s in sets if s.label not in done]
+        started = time.monotonic()
+        start_battery = level = battery()
+        while pending:
+            current = height()
+            schedule = self.plan(pending, level, current)
+            if self.verbose:
+                self.print_plan(schedule, level)
+            if not schedule.sets:
+                if self.verbose:
+                    print(f"[SCHED] 電池が足りないので打ち切ります。残り: {', '.join(s.label for s in pending)}")
+                break
+            capture_set = schedule.sets[0]
+            predicted = self.model.set_time(capture_set, current, corrected=False)
+            set_started = time.monotonic()
+            capture(capture_set)
+            actual = time.monotonic() - set_started
+            self.model.observe_set(predicted, actual)
+            pending.remove(capture_set)
+            done.append(capture_set.label)
+            save_progress(progress_path, done, pending)
+            level = battery()
+            if self.verbose:
+                print(f"[SCHED] {capture_set.label} 完了: {actual:.1f}秒 "
+                      f"(見積もり {predicted * self.model.correction:.1f}秒) / 電池 {level:.0f}%")
+        if not pending and progress_path is not None and os.path.exists(progress_path):
+            os.remove(progress_path)
+        elapsed = time.monotonic() - started
+        if elapsed > 0 and start_battery >= level:
+            self.model.observe_flight(elapsed, start_battery - level)
+        self.model.save()
+        return done, pending
+
+
+def main():
+    parser = argparse.ArgumentParser(description="高さごとの撮影の順番と電池の見積もりを表示します（飛ばさない）")
+    parser.add_argument("--heights", type=int, nargs="+", default=[200, 300, 400, 500], help="撮影する高さ（cm）")
+    parser.add_argument("--battery", type=float, default=100, help="電池の残量（%%）")
+    parser.add_argument("--start", type=int, default=TAKEOFF_HEIGHT_CM, help="開始時の高さ（cm）")
+    parser.add_argument("--flying", action="store_true", help="飛行中から始める（離陸の時間を含めない）")
+    parser.add_argument("--shots", type=int, default=12, help="1周の撮影枚数")
+    parser.add_argument("--reserve", type=float, default=20, help="着陸時に残す電池（%%）")
+    parser.add_argument("--history", help="飛行の記録（EnergyModel の JSON）")
+    parser.add_argument("--progress", help="進み具合のファイル（撮影済みの組を除く）")
+    args = parser.parse_args()
+
+    model = EnergyModel.load(args.history) if args.history else EnergyModel()
+    scheduler = CaptureScheduler(model, reserve=args.reserve)
+    sets = [CaptureSet(f"{h / 100:.1f}m", h, shots=args.shots, step_deg=360 // args.shots) for h in args.heights]
+    sets = scheduler.pending(sets, args.progress)
+    schedule = scheduler.plan(sets, args.battery, args.start, takeoff=not args.flying)
+    scheduler.print_plan(schedule, args.battery)
+    fixed = scheduler.cost(sets, args.start) + (0.0 if args.flying else model.command_time("takeoff"))
+    print(f"[SCHED] 指定の順で全て飛ぶ場合: {fixed:.0f}秒 / 電池 {model.battery(fixed):.1f}%")
+
+
+if __name__ == "__main__":
+    main()
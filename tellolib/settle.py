@@ -0,0 +1,196 @@
+"""
+移動・回転の後に機体と映像が落ち着いたことを検出して撮影するトリガー。
+
+これまでのスクリプトは回転のたびに time.sleep(2) や time.sleep(5) で決め打ちに待っていましたが、
+SettleTrigger は新しいフレームが届くたびに縮小したグレースケール画像どうしの位相相関で
+画面の動きを測り、状態パケットの姿勢（pitch, roll, 速度, yaw の変化）と合わせて
+落ち着いたと判断した時点ですぐにフレームを返します。
+
+    trigger = SettleTrigger(tello.get_frame_read(), attitude=tello.get_current_state)
+    tello.rotate_clockwise(30)
+    frame = trigger.wait()
+    ...
+    trigger.print_stats()
+
+映像の解析には OpenCV と NumPy が必要です。
+"""
+import collections
+import time
+
+import cv2
+import numpy as np
+
+SettleRecord = collections.namedtuple("SettleRecord", ["settle_time", "frames", "motion", "reason"])
+
+
+class SettleTrigger:
+    """
+    画面の動きと姿勢が落ち着いたときのフレームを返します。
+
+    Args:
+        frames: 映像の受信機。VideoReceiver（wait_for_frame を持つ）か、
+            djitellopy の get_frame_read() のように .frame を持つもの。
+        attitude (callable): 最新の状態の辞書を返す関数（tello.get_current_state など）。省略時は映像だけで判断する。
+        work_width (int): 動きを測る画像の幅。小さいほど速い。
+        max_motion (float): 落ち着いたとみなすフレーム間の移動量[元の画像でのピクセル]。
+        stable_frames (int): 動きが max_motion 以下のフレームがこの数だけ続いたら撮影する。
+        max_tilt (float): 落ち着いたとみなす pitch, roll の絶対値の上限[度]。
+        max_speed (float): 落ち着いたとみなす速度 vgx, vgy, vgz の絶対値の上限[dm/s]。
+        max_yaw_change (float): 落ち着いたとみなす状態パケット間の yaw の変化の上限[度]。
+        timeout (float): 落ち着かなくてもこの秒数でその時点のフレームを返す。
+        selector (FrameSelector): 指定すると、待つ間に届いた直近 selector.n 枚から
+            鮮明さ・露出・直前の撮影との重なりで一番良いものを返す。
+        verbose (bool): ログを出すかどうか。
+    """
+
+    def __init__(self, frames, attitude=None, work_width=160, max_motion=2.0, stable_frames=3,
+                 max_tilt=3.0, max_speed=1.0, max_yaw_change=1.0, timeout=3.0, selector=None, verbose=True):
+        self.frames = frames
+        self.attitude = attitude
+        self.work_width = work_width
+        self.max_motion = max_motion
+        self.stable_frames = stable_frames
+        self.max_tilt = max_tilt
+        self.max_speed = max_speed
+        self.max_yaw_change = max_yaw_change
+        self.timeout = timeout
+        self.selector = selector
+        self.verbose = verbose
+        self.records = []
+        self._window = None
+        self._last_yaw = None
+
+    # --- フレームの取得 ---
+
+    def _next_frame(self, previous, newer_than, deadline):
+        # previous より新しいフレームを待つ。VideoReceiver なら通し番号で、そうでなければ配列の入れ替わりで判断する
+        if hasattr(self.frames, "wait_for_frame"):
+            seq = previous[1] if previous is not None else None
+            frame, timestamp, latest = self.frames.wait_for_frame(
+                newer_than=newer_than, after_seq=seq, timeout=max(deadline - time.time(), 0.0))
+            # 時間切れのときは古いフレームが返るので、新しくなければ None
+            if frame is None or latest == seq or timestamp <= newer_than:
+                return None
+            return frame, latest
+        while time.time() < deadline:
+            frame = self.frames.frame
+            if frame is not None and (previous is None or frame is not previous[0]):
+                return frame, None
+            time.sleep(0.005)
+        return None
+
+    # --- 判定 ---
+
+    def _small(self, frame):
+        h, w = frame.shape[:2]
+        scale = self.work_width / float(w)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        small = cv2.resize(gray, (self.work_width, max(1, int(round(h * scale)))), interpolation=cv2.INTER_AREA)
+        small = np.float32(small)
+        if self._window is None or self._window.shape != small.shape:
+            self._window = cv2.createHanningWindow(small.shape[::-1], cv2.CV_32F)
+        return small, scale
+
+    def motion(self, previous_small, current_small, scale):
+        """
+        2枚の縮小画像の間の移動量を元の画像のピクセル単位で返します（位相相関）。
+        """
+        (dx, dy), response = cv2.phaseCorrelate(previous_small, current_small, self._window)
+        if response < 0.05:
+            # 相関がほとんどない（大きく動いた、またはブレている）
+            return float("inf")
+        return float(np.hypot(dx, dy)) / scale
+
+    def attitude_steady(self):
+        """
+        状態パケットから見て機体が静止しているかを返します（attitude がなければ常に True）。
+        """
+        if self.attitude is None:
+            return True
+        state = self.attitude() or {}
+        if not state:
+            return True
+        if abs(state.get("pitch", 0)) > self.max_tilt or abs(state.get("roll", 0)) > self.max_tilt:
+            return False
+        if any(abs(state.get(key, 0)) > self.max_speed for key in ("vgx", "vgy", "vgz")):
+            return False
+        yaw = state.get("yaw")
+        steady = True
+        if yaw is not None and self._last_yaw is not None:
+            change = abs((yaw - self._last_yaw + 180) % 360 - 180)
+            steady = change <= self.max_yaw_change
+        self._last_yaw = yaw
+        return steady
+
+    def wait(self, since=None, timeout=None):
+        """
+        落ち着いたときのフレームを返します。時間切れのときはその時点の最新のフレームを返します。
+
+        Args:
+            since (float): この時刻（time.time()）より後に受信したフレームだけを見る。
+                移動コマンドの応答を受け取った時刻を渡す。省略時は呼び出した時刻。
+            timeout (float): 最大の待ち時間[秒]。省略時はコンストラクタの値。
+        """
+        started = time.time()
+        since = started if since is None else since
+        deadline = started + (self.timeout if timeout is None else timeout)
+        self._last_yaw = None
+        previous = None
+        previous_small = None
+        stable = 0
+        count = 0
+        motion = float("inf")
+        reason = "timeout"
+        candidates = collections.deque(maxlen=self.selector.n if self.selector is not None else 1)
+        while True:
+            item = self._next_frame(previous, since, deadline)
+            if item is None:
+                break
+            count += 1
+            candidates.append(item[0])
+            current_small, scale = self._small(item[0])
+            if previous_small is not None:
+                motion = self.motion(previous_small, current_small, scale)
+                if motion <= self.max_motion and self.attitude_steady():
+                    stable += 1
+                else:
+                    stable = 0
+            previous, previous_small = item, current_small
+            if stable >= self.stable_frames:
+                reason = "settled"
+                break
+            if time.time() >= deadline:
+                break
+
+        settle_time = time.time() - started
+        self.records.append(SettleRecord(settle_time, count, motion, reason))
+        if self.verbose:
+            label = "安定" if reason == "settled" else "時間切れ"
+            print(f"[SETTLE] {label} {settle_time:.2f}秒 ({count}フレーム, 動き {motion:.1f}px)")
+        if previous is None:
+            return self.frames.frame  # 新しいフレームが1枚も届かなかった
+        if self.selector is not None:
+            return self.selector.select(list(candidates))
+        return previous[0]
+
+    # --- 統計 ---
+
+    def summary(self):
+        """
+        撮影ごとの待ち時間の統計を辞書で返します。
+        """
+        times = [r.settle_time for r in self.records]
+        if not times:
+            return {"shots": 0, "mean": 0.0, "max": 0.0, "total": 0.0, "timeouts": 0}
+        return {
+            "shots": len(times),
+            "mean": sum(times) / len(times),
+            "max": max(times),
+            "total": sum(times),
+            "timeouts": sum(1 for r in self.records if r.reason != "settled"),
+        }
+
+    def print_stats(self):
+        s = self.summary()
+        print(f"[SETTLE] {s['shots']} 枚: 待ち時間 平均 {s['mean']:.2f}秒 / 最大 {s['max']:.2f}秒 / "
+              f"合計 {s['total']:.1f}秒 / 時間切れ {s['timeouts']} 枚")
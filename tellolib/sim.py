@@ -0,0 +1,525 @@
+"""
+実機の代わりに Tello SDK のテキストプロトコルを話すローカルシミュレータ。
+
+    python -m tellolib.sim --time-scale 0.1 --frames 0619/mitome/panorama
+
+を起動しておき、スクリプト側を TELLO_IP=127.0.0.1 で実行すると、
+機体なしでコマンドの応答時間・ミッション全体の時間・映像の受信を繰り返し計測できます。
+
+- UDP 8889: コマンドを受け取り、動作時間だけ待ってから "ok" / "error" / 値を返す
+- UDP 8890: 状態パケットをコマンドの送信元へ state_hz で送る
+- UDP 11111: streamon 中は frames のJPEGを機体の向き（yaw）に応じて選んで送る
+  （codec="mjpeg" は1データグラムに1枚のJPEG、codec="h264" は PyAV でエンコードして1460バイトずつ送る）
+
+状態と映像の送信ポートは "port <状態> <映像>" で変えられます。状態と映像は host から送るので、
+127.0.0.11, 127.0.0.12, ... のように別々のアドレスで複数台を起動すると、受信側で送信元の機体を区別できます。
+"""
+import argparse
+import math
+import os
+import re
+import socket
+import threading
+import time
+
+from .planner import arc_geometry
+from .protocol import (BATTERY_FLIGHT_TIME_S, DEFAULT_SPEED_CM_S, DEFAULT_YAW_RATE_DEG_S, TAKEOFF_HEIGHT_CM,
+                       TELLO_PORT, TELLO_STATE_PORT, TELLO_VIDEO_PORT, command_type)
+
+# rc の速度指令に機体の速度が追いつくまでの時定数（秒）。実機と同じく指令を変えてもすぐには止まらない
+RC_RESPONSE_S = 0.3
+MAX_DATAGRAM = 65000
+H264_PACKET_SIZE = 1460
+
+
+def load_frame_sets(frames_dir):
+    """
+    映像として流すJPEGを読み込みます。
+
+    frames_dir 直下にJPEGがあればそれを1組として使い、
+    "2m", "4m" のような名前のサブフォルダがあれば高さ（cm）ごとの組として使います。
+
+    Returns:
+        dict: {高さ(cm) または None: [JPEGのバイト列, ...]}
+    """
+    def read_jpegs(path):
+        names = sorted(f for f in os.listdir(path) if f.lower().endswith(('.jpg', '.jpeg')))
+        frames = []
+        for name in names:
+            with open(os.path.join(path, name), 'rb') as f:
+                jpeg = _fit_datagram(f.read())
+            if jpeg is not None:
+                frames.append(jpeg)
+        return frames
+
+    sets = {}
+    direct = read_jpegs(frames_dir)
+    if direct:
+        sets[None] = direct
+    for name in sorted(os.listdir(frames_dir)):
+        match = re.fullmatch(r"(\d+(?:\.\d+)?)m", name)
+        sub = os.path.join(frames_dir, name)
+        if match and os.path.isdir(sub):
+            frames = read_jpegs(sub)
+            if frames:
+                sets[int(float(match.group(1)) * 100)] = frames
+    return sets
+
+
+class TelloSimulator:
+    """
+    Tello 1台分のシミュレータ。スレッドで動くのでテストやベンチマークから直接起動できます。
+
+    Args:
+        host (str): バインドするアドレス。
+        port (int): コマンドポート。
+        state_port (int): 状態パケットの送信先ポート。
+        video_port (int): 映像の送信先ポート。
+        latency (float): 各コマンドの応答にかかる通信遅延（秒）。
+        time_scale (float): 動作時間の倍率。0.1 なら実機の10倍速で動く。
+        speed (float): 移動速度（cm/s）。"speed x" で変更できる。
+        yaw_rate (float): 回転速度（度/s）。
+        frames_dir (str): 映像として流すJPEGのフォルダ。
+        state_hz (float): 状態パケットの送信頻度。
+        fps (float): 映像のフレームレート。
+        codec (str): "mjpeg" または "h264"。
+    """
+
+    def __init__(self, host='127.0.0.1', port=TELLO_PORT, state_port=TELLO_STATE_PORT,
+                 video_port=TELLO_VIDEO_PORT, latency=0.02, time_scale=1.0, speed=DEFAULT_SPEED_CM_S,
+                 yaw_rate=DEFAULT_YAW_RATE_DEG_S, frames_dir=None, state_hz=10.0, fps=30.0, codec="mjpeg",
+                 battery=100, verbose=True):
+        self.host = host
+        self.port = port
+        self.state_port = state_port
+        self.video_port = video_port
+        self.latency = latency
+        self.time_scale = time_scale
+        self.speed = speed
+        self.yaw_rate = yaw_rate
+        self.state_hz = state_hz
+        self.fps = fps
+        self.codec = codec
+        self.verbose = verbose
+        self.frame_sets = load_frame_sets(frames_dir) if frames_dir else {}
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.settimeout(0.2)
+        self.out = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.out.bind((host, 0))
+
+        # 機体の状態（位置は離陸地点を原点とした cm、yaw は度）
+        self.lock = threading.Lock()
+        self.x = self.y = self.z = 0.0
+        self.yaw = 0.0
+        self.vx = self.vy = self.vz = 0.0
+        self.rc = (0, 0, 0, 0)
+        self.rc_velocity = (0.0, 0.0, 0.0, 0.0)
+        self.battery = float(battery)
+        self.flying = False
+        self.sdk_mode = False
+        self.streaming = False
+        self.client = None
+        self.takeoff_time = None
+
+        # 統計
+        self.commands = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.started = None
+
+        self._running = False
+        self._threads = []
+
+    # --- 起動と停止 ---
+
+    def start(self):
+        self._running = True
+        self.started = time.perf_counter()
+        for target, name in ((self._command_loop, "sim-command"), (self._state_loop, "sim-state"),
+                             (self._video_loop, "sim-video")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.verbose:
+            print(f"[SIM] {self.host}:{self.port} で待ち受け中 (time_scale={self.time_scale})")
+        return self
+
+    def stop(self):
+        self._running = False
+        for thread in self._threads:
+            thread.join(timeout=2.0)
+        self.sock.close()
+        self.out.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        return {"commands": self.commands, "errors": self.errors,
+                "busy_time": self.busy_time, "elapsed": elapsed, "battery": self.battery}
+
+    # --- コマンド処理 ---
+
+    def _command_loop(self):
+        while self._running:
+            try:
+                data, addr = self.sock.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.client = addr[0]
+            command = data.decode('utf-8', 'replace').strip()
+            start = time.perf_counter()
+            response = self.handle(command)
+            if response is None:
+                continue  # rc には応答しない
+            time.sleep(self.latency)
+            self.busy_time += time.perf_counter() - start
+            self.commands += 1
+            if response == "error":
+                self.errors += 1
+            if self.verbose:
+                print(f"[SIM] {command} -> {response}")
+            try:
+                self.sock.sendto(response.encode('utf-8'), addr)
+            except OSError:
+                break
+
+    def handle(self, command):
+        """
+        コマンドを1つ実行して応答を返します（動作時間だけブロックする）。
+        """
+        parts = command.split()
+        if not parts:
+            return "error"
+        name = command_type(command)
+        try:
+            args = [int(float(a)) for a in parts[1:]]
+        except ValueError:
+            return "error"
+
+        if name == "command":
+            self.sdk_mode = True
+            return "ok"
+        if not self.sdk_mode:
+            return "error"
+
+        if name.endswith("?"):
+            return self._query(name)
+        if name == "rc":
+            if len(args) == 4:
+                with self.lock:
+                    self.rc = tuple(max(-100, min(100, a)) for a in args)
+            return None
+        if name == "port":
+            if len(args) != 2 or not all(1025 <= a <= 65535 for a in args):
+                return "error"
+            self.state_port, self.video_port = args
+            return "ok"
+        if name == "streamon":
+            self.streaming = True
+            return "ok"
+        if name == "streamoff":
+            self.streaming = False
+            return "ok"
+        if name == "speed":
+            if len(args) != 1 or not 10 <= args[0] <= 100:
+                return "error"
+            self.speed = float(args[0])
+            return "ok"
+        if name == "emergency":
+            with self.lock:
+                self.flying = False
+                self.z = 0.0
+            return "ok"
+        if name == "takeoff":
+            if self.flying:
+                return "error"
+            self.flying = True
+            self.takeoff_time = time.time()
+            self._animate(0, 0, TAKEOFF_HEIGHT_CM, 0, 3.0)
+            return "ok"
+        if name == "land":
+            if not self.flying:
+                return "error"
+            self._animate(0, 0, -self.z, 0, 3.0)
+            self.flying = False
+            self.rc = (0, 0, 0, 0)
+            self.rc_velocity = (0.0, 0.0, 0.0, 0.0)
+            return "ok"
+
+        if not self.flying:
+            return "error"
+
+        if name in ("up", "down", "left", "right", "forward", "back"):
+            if len(args) != 1 or not 20 <= args[0] <= 500:
+                return "error"
+            d = args[0]
+            forward, right, up = {"forward": (d, 0, 0), "back": (-d, 0, 0), "right": (0, d, 0),
+                                  "left": (0, -d, 0), "up": (0, 0, d), "down": (0, 0, -d)}[name]
+            if self.z + up < 0:
+                return "error"
+            dx, dy = self._body_to_world(forward, right)
+            self._animate(dx, dy, up, 0, d / self.speed)
+            return "ok"
+        if name in ("cw", "ccw"):
+            if len(args) != 1 or not 1 <= args[0] <= 360:
+                return "error"
+            dyaw = args[0] if name == "cw" else -args[0]
+            self._animate(0, 0, 0, dyaw, args[0] / self.yaw_rate)
+            return "ok"
+        if name == "go":
+            if len(args) != 4 or not 10 <= args[3] <= 100:
+                return "error"
+            x, y, z, speed = args
+            distance = math.sqrt(x * x + y * y + z * z)
+            # 実機は x, y, z が全て ±20 未満の go を受け付けない（距離ではなく各軸で判定する）
+            if max(abs(x), abs(y), abs(z)) < 20 or any(abs(v) > 500 for v in (x, y, z)):
+                return "error"
+            # go の x は前、y は左
+            dx, dy = self._body_to_world(x, -y)
+            self._animate(dx, dy, z, 0, distance / speed)
+            return "ok"
+        if name == "curve":
+            if len(args) != 7 or not 10 <= args[6] <= 60:
+                return "error"
+            x1, y1, z1, x2, y2, z2, speed = args
+            p1 = (x1, y1, z1)
+            p2 = (x2, y2, z2)
+            geometry = arc_geometry((0, 0, 0), p1, p2)
+            if geometry is None:
+                return "error"
+            length = geometry[1]
+            dx, dy = self._body_to_world(x2, -y2)
+            self._animate(dx, dy, z2, 0, length / speed)
+            return "ok"
+        if name == "flip":
+            self._animate(0, 0, 0, 0, 1.0)
+            return "ok"
+        return "error"
+
+    def _query(self, name):
+        if name == "battery?":
+            return str(int(self.battery))
+        if name == "speed?":
+            return f"{self.speed:.1f}"
+        if name == "time?":
+            flight = time.time() - self.takeoff_time if self.takeoff_time else 0
+            return f"{int(flight)}s"
+        if name == "height?":
+            return f"{int(round(self.z / 10))}dm"
+        if name == "attitude?":
+            return f"pitch:0;roll:0;yaw:{int(round(self._yaw_wrapped()))};"
+        if name in ("sdk?", "sn?", "wifi?"):
+            return {"sdk?": "30", "sn?": "0TQDSIMULATOR", "wifi?": "90"}[name]
+        return "error"
+
+    def _body_to_world(self, forward, right):
+        rad = math.radians(self.yaw)
+        return (forward * math.cos(rad) - right * math.sin(rad),
+                forward * math.sin(rad) + right * math.cos(rad))
+
+    def _yaw_wrapped(self):
+        return (self.yaw + 180.0) % 360.0 - 180.0
+
+    def _animate(self, dx, dy, dz, dyaw, duration):
+        # 状態パケットに途中経過が出るように小刻みに位置を更新する
+        duration = max(duration * self.time_scale, 0.0)
+        steps = max(1, int(duration / 0.02))
+        with self.lock:
+            if duration > 0:
+                self.vx, self.vy, self.vz = (dx / duration * self.time_scale,
+                                             dy / duration * self.time_scale,
+                                             dz / duration * self.time_scale)
+        for _ in range(steps):
+            with self.lock:
+                self.x += dx / steps
+                self.y += dy / steps
+                self.z += dz / steps
+                self.yaw += dyaw / steps
+            if duration > 0:
+                time.sleep(duration / steps)
+        with self.lock:
+            self.vx = self.vy = self.vz = 0.0
+
+    # --- 状態パケット ---
+
+    def state_packet(self):
+        with self.lock:
+            flight = int(time.time() - self.takeoff_time) if self.takeoff_time else 0
+            return (f"mid:-1;x:0;y:0;z:0;mpry:0,0,0;"
+                    f"pitch:0;roll:0;yaw:{int(round(self._yaw_wrapped()))};"
+                    f"vgx:{int(self.vx)};vgy:{int(self.vy)};vgz:{int(self.vz)};"
+                    f"templ:60;temph:63;tof:{int(self.z) + 10};h:{int(round(self.z))};"
+                    f"bat:{int(self.battery)};baro:{self.z / 100:.2f};time:{flight};"
+                    f"agx:0.00;agy:0.00;agz:-1000.00;\r\n")
+
+    def _state_loop(self):
+        period = 1.0 / self.state_hz
+        last = time.perf_counter()
+        while self._running:
+            time.sleep(period)
+            now = time.perf_counter()
+            dt = now - last
+            last = now
+            with self.lock:
+                if self.flying:
+                    # rc の速度指令を積分する（100 で 100cm/s, 100度/s とみなす）
+                    scale = dt / self.time_scale if self.time_scale > 0 else dt
+                    alpha = min(1.0, scale / RC_RESPONSE_S)
+                    self.rc_velocity = tuple(v + (target - v) * alpha for v, target in zip(self.rc_velocity, self.rc))
+                    lr, fb, ud, yaw = self.rc_velocity
+                    self.yaw += yaw * scale
+                    rad = math.radians(self.yaw)
+                    self.x += (fb * math.cos(rad) - lr * math.sin(rad)) * scale
+                    self.y += (fb * math.sin(rad) + lr * math.cos(rad)) * scale
+                    self.z = max(0.0, self.z + ud * scale)
+                    # 飛行中は約15分で電池が尽きる
+                    self.battery = max(0.0, self.battery - 100.0 / BATTERY_FLIGHT_TIME_S * scale)
+            if self.client is not None and self.sdk_mode:
+                try:
+                    self.out.sendto(self.state_packet().encode('ascii'), (self.client, self.state_port))
+                except OSError:
+                    pass
+
+    # --- 映像 ---
+
+    def current_frame(self):
+        """
+        機体の高さと向きに対応するJPEGを返します。
+        """
+        if not self.frame_sets:
+            return None
+        with self.lock:
+            height = self.z
+            yaw = self.yaw % 360.0
+        keys = [k for k in self.frame_sets if k is not None]
+        if keys:
+            frames = self.frame_sets[min(keys, key=lambda k: abs(k - height))]
+        else:
+            frames = self.frame_sets[None]
+        index = int(round(yaw / (360.0 / len(frames)))) % len(frames)
+        return frames[index]
+
+    def _video_loop(self):
+        period = 1.0 / self.fps
+        encoder = None
+        next_time = time.perf_counter()
+        while self._running:
+            next_time += period
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if not self.streaming or self.client is None:
+                continue
+            jpeg = self.current_frame()
+            if jpeg is None:
+                continue
+            address = (self.client, self.video_port)
+            try:
+                if self.codec == "h264":
+                    if encoder is None:
+                        encoder = _H264Encoder(self.fps)
+                    payload = encoder.encode(jpeg)
+                    for i in range(0, len(payload), H264_PACKET_SIZE):
+                        self.out.sendto(payload[i:i + H264_PACKET_SIZE], address)
+                else:
+                    self.out.sendto(jpeg, address)
+            except OSError:
+                pass
+
+
+class _H264Encoder:
+    """
+    JPEG を H.264 のバイトストリームに変換します（PyAV が必要）。
+    """
+
+    def __init__(self, fps):
+        try:
+            import av
+        except ImportError:
+            raise RuntimeError("codec='h264' には PyAV が必要です: pip install av")
+        import io
+        self._av = av
+        self._io = io
+        self._fps = int(fps)
+        self._codec = None
+        self._pts = 0
+
+    def encode(self, jpeg):
+        av = self._av
+        frame = next(av.open(self._io.BytesIO(jpeg)).decode(video=0))
+        if self._codec is None:
+            self._codec = av.CodecContext.create("libx264", "w")
+            self._codec.width = frame.width - frame.width % 2
+            self._codec.height = frame.height - frame.height % 2
+            self._codec.pix_fmt = "yuv420p"
+            self._codec.framerate = self._fps
+            self._codec.options = {"tune": "zerolatency", "preset": "ultrafast", "g": str(self._fps)}
+        frame = frame.reformat(width=self._codec.width, height=self._codec.height, format="yuv420p")
+        # JPEG から作ったフレームは I ピクチャの指定がついていて、そのままだと全てキーフレームになる
+        frame.pict_type = av.video.frame.PictureType.NONE
+        frame.pts = self._pts
+        self._pts += 1
+        return b"".join(bytes(packet) for packet in self._codec.encode(frame))
+
+
+def _fit_datagram(jpeg):
+    # 1データグラムに収まらないJPEGは画質を下げて再エンコードする
+    if len(jpeg) <= MAX_DATAGRAM:
+        return jpeg
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        print("[SIM] 警告: 大きすぎるJPEGを縮めるには OpenCV が必要です。このフレームは使いません。")
+        return None
+    image = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+    for quality in (80, 60, 40, 20):
+        ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if ok and len(encoded) <= MAX_DATAGRAM:
+            return encoded.tobytes()
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tello SDK シミュレータ")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=TELLO_PORT)
+    parser.add_argument("--latency", type=float, default=0.02, help="コマンド応答の遅延（秒）")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="動作時間の倍率（0.1 で10倍速）")
+    parser.add_argument("--speed", type=float, default=DEFAULT_SPEED_CM_S, help="移動速度（cm/s）")
+    parser.add_argument("--yaw-rate", type=float, default=DEFAULT_YAW_RATE_DEG_S, help="回転速度（度/s）")
+    parser.add_argument("--frames", default=None, help="映像として流すJPEGのフォルダ")
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--codec", choices=["mjpeg", "h264"], default="mjpeg")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+
+    sim = TelloSimulator(host=args.host, port=args.port, latency=args.latency,
+                         time_scale=args.time_scale, speed=args.speed, yaw_rate=args.yaw_rate,
+                         frames_dir=args.frames, fps=args.fps, codec=args.codec,
+                         verbose=not args.quiet)
+    sim.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.stop()
+        stats = sim.stats()
+        print(f"[SIM] コマンド {stats['commands']}回 (error {stats['errors']})  "
+              f"動作時間 {stats['busy_time']:.1f}秒 / 経過 {stats['elapsed']:.1f}秒  "
+              f"バッテリー {stats['battery']:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+UDP 8890 番ポートで Tello の状態パケット（テレメトリ）を受信するバックグラウンドスレッド。
+"""
+import socket
+import threading
+import time
+
+from .protocol import TELLO_STATE_PORT, parse_state
+
+
+class StateListener:
+    """
+    状態パケットを受信し続け、送信元の IP ごとに最新の状態を保持します。
+
+    8890 番ポートはプロセス内で一度しかバインドできないため、
+    通常は get_state_listener() で共有のインスタンスを使います。
+    """
+
+    def __init__(self, port=TELLO_STATE_PORT):
+        self.port = port
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('0.0.0.0', port))
+        self.sock.settimeout(0.5)
+        self.packets = 0
+        self._latest = {}  # ip -> (受信時刻, 状態の辞書)
+        self._callbacks = []
+        self._updated = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="tello-state", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while self._running:
+            try:
+                data, (ip, _) = self.sock.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            now = time.time()
+            state = parse_state(data)
+            with self._updated:
+                self._latest[ip] = (now, state)
+                self.packets += 1
+                self._updated.notify_all()
+            for callback in self._callbacks:
+                callback(ip, now, state)
+
+    def add_callback(self, callback):
+        """
+        パケット受信のたびに callback(ip, timestamp, state) を呼ぶよう登録します。
+        """
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        """
+        add_callback で登録した callback を外します（登録されていなければ何もしない）。
+        """
+        # 受信のスレッドが回している途中のリストは書き換えず、新しいリストに差し替える
+        self._callbacks = [c for c in self._callbacks if c != callback]
+
+    def latest(self, ip=None):
+        """
+        最新の状態を (受信時刻, 状態の辞書) で返します。まだ受信していなければ (None, {})。
+
+        Args:
+            ip (str): 機体の IP アドレス。省略時は最後に受信した機体。
+        """
+        with self._updated:
+            if ip is not None:
+                return self._latest.get(ip, (None, {}))
+            if not self._latest:
+                return None, {}
+            return max(self._latest.values(), key=lambda item: item[0])
+
+    def get(self, key, ip=None, default=None):
+        return self.latest(ip)[1].get(key, default)
+
+    def wait_for_update(self, timeout=1.0):
+        """
+        次の状態パケットが届くまで待ちます。届けば True。
+        """
+        with self._updated:
+            count = self.packets
+            return self._updated.wait_for(lambda: self.packets != count, timeout)
+
+    def close(self):
+        self._running = False
+        self.sock.close()
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def get_state_listener(port=TELLO_STATE_PORT):
+    """
+    プロセス内で共有する StateListener を返します（初回呼び出し時に起動）。
+    """
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = StateListener(port)
+        return _listener
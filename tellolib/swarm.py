@@ -0,0 +1,459 @@
+"""
+複数の Tello を1つのプロセスから同時に飛ばし、1つの仕事を機体に分けて実行するスウォームの実行系。
+
+これまでのスクリプトは 192.168.10.1 の1台だけを操作し、0619_gemini.py の4つの高さのパノラマも
+1回の長い飛行で順に撮っていました。Swarm はステーションモード（ap コマンドで同じルーターにつないだ状態）の
+機体を IP アドレスで区別し、機体ごとに asyncio のコマンドループと映像のポートを持たせて並行に飛ばします。
+
+- 機体ごとの仕事は Mission（mission.py のミッション）で渡す。split_heights は高さを、
+  split_text は文字列（"HEL" なら1文字ずつ）を機体に分けたミッションを作る
+- 全ての機体の接続・電池の確認・映像の準備が済んでから一斉に始める（1台でも失敗したらどの機体も離陸しない）
+- 撮影したフレームは機体ごとに集め、stitch() で PanoramaBatch（高さごとに並列の合成）に渡す
+
+    drones = [SwarmDrone("192.168.0.101", video_port=11111), SwarmDrone("192.168.0.102", video_port=11112)]
+    swarm = Swarm(drones)
+    results = asyncio.run(swarm.run(split_heights([200, 300, 400, 500], len(drones))))
+    swarm.print_results(results)
+    swarm.stitch(results, "swarm_panorama")
+
+    python -m tellolib.swarm panorama --drones 192.168.0.101 192.168.0.102 --heights 200 300 400 500
+    python -m tellolib.swarm text HEL --drones 192.168.0.101 192.168.0.102 192.168.0.103
+    python -m tellolib.swarm panorama --sim 4 --time-scale 0.2     # 4台のシミュレータで試す
+
+映像を機体ごとのポートに送らせるには "port <状態> <映像>" コマンドが必要です（SDK 3.0）。
+使えない機体では映像が同じ 11111 番ポートに混ざるので、撮影は1台だけにしてください。
+状態パケットは全ての機体から 8890 番ポートに届き、送信元の IP アドレスで区別します。
+機体どうしは水平に 2m 以上離して置いてください。
+"""
+import argparse
+import asyncio
+import collections
+import os
+import time
+
+from .command import CommandChannel
+from .mission import Mission, MissionRunner
+from .protocol import TAKEOFF_HEIGHT_CM, TELLO_PORT, TELLO_STATE_PORT, TELLO_VIDEO_PORT, command_type
+from .state import get_state_listener
+from .tello import TelloError
+
+# 1台分の結果。frames は (capture のファイル名, フレーム, 撮ったときの向き[度]) のリスト、
+# elapsed は一斉に始めてからの秒数。向きは離陸してから送った cw / ccw の合計
+SwarmResult = collections.namedtuple("SwarmResult", ["drone", "mission", "frames", "elapsed", "commands", "error"])
+
+# シミュレータを起動するアドレス（127.0.0.11 から順に1台ずつ）と映像のポート
+SIM_HOST_BASE = 11
+SIM_FRAMES = "0619/mitome/panorama"
+MOVE_MAX_CM = 500
+SPACING_CM = 200      # 同時に飛ぶ機体どうしを水平に離す距離
+
+
+class SwarmDrone:
+    """
+    スウォームの1台。コマンドは機体ごとの TelloClient で送り、映像は video_port で受信します。
+
+    Args:
+        ip (str): 機体の IP アドレス。
+        video_port (int): この機体の映像を受信するポート（機体ごとに変える）。
+        name (str): ログに出す名前。省略時は IP アドレス。
+        port (int): コマンドポート。
+    """
+
+    def __init__(self, ip, video_port=TELLO_VIDEO_PORT, name=None, port=TELLO_PORT):
+        self.ip = ip
+        self.video_port = video_port
+        self.name = name or ip
+        self.channel = CommandChannel(ip, port, verbose=False)
+        self.video = None
+        self.trigger = None
+
+    def state(self):
+        """
+        この機体の最新の状態の辞書。
+        """
+        return get_state_listener().latest(self.ip)[1]
+
+    def open_video(self):
+        # 映像は撮影するミッションのときだけ受信する（OpenCV が必要）
+        if self.video is None:
+            from .settle import SettleTrigger
+            from .video import VideoReceiver
+            self.video = VideoReceiver(self.video_port, verbose=False)
+            self.trigger = SettleTrigger(self.video, attitude=self.state, verbose=False)
+        return self.video
+
+    def capture(self, settle, timeout, since):
+        if settle:
+            return self.trigger.wait(since=since, timeout=timeout)
+        return self.video.wait_for_frame(newer_than=since, timeout=timeout)[0]
+
+    def close(self):
+        if self.video is not None:
+            self.video.close()
+            self.video = None
+
+
+class Swarm:
+    """
+    機体ごとに1つのミッションを並行に実行します。
+
+    Args:
+        drones (list): SwarmDrone のリスト。
+        save (bool): 撮影したフレームを各ミッションの output_dir にも保存するかどうか。
+        verbose (bool): ログを出すかどうか。
+    """
+
+    def __init__(self, drones, save=True, verbose=True):
+        self.drones = list(drones)
+        self.save = save
+        self.verbose = verbose
+        self._writer = None
+
+    def _log(self, drone, message):
+        if self.verbose:
+            print(f"[SWARM] {drone.name}: {message}")
+
+    async def _send(self, drone, command):
+        response = await drone.channel.send(command)
+        self._log(drone, f"{command} -> {response}")
+        return response
+
+    async def _prepare(self, drone, mission):
+        # 接続・電池の確認・映像の準備。ここまでは飛ばないので、失敗しても他の機体を止めるだけで済む
+        if await self._send(drone, "command") != "ok":
+            raise TelloError("接続できませんでした")
+        loop = asyncio.get_running_loop()
+        runner = MissionRunner(client=drone.channel.client, verbose=False)
+        if not await loop.run_in_executor(None, runner.check_battery, mission):
+            raise TelloError("電池が足りません")
+        if any(step.kind == "capture" for step in mission.steps):
+            if drone.video_port != TELLO_VIDEO_PORT and \
+                    await self._send(drone, f"port {TELLO_STATE_PORT} {drone.video_port}") != "ok":
+                raise TelloError(f"映像のポートを {drone.video_port} に変えられませんでした（port コマンドは SDK 3.0 以降）")
+            drone.open_video()
+            if self._writer is None and self.save:
+                from .panorama.capture import FrameWriter
+                self._writer = FrameWriter()
+
+    async def _wait_until(self, drone, conditions, timeout):
+        deadline = time.time() + timeout
+        while True:
+            state = drone.state()
+            if state and all(key in state and (low is None or state[key] >= low) and (high is None or state[key] <= high)
+                             for key, (low, high) in conditions.items()):
+                return True
+            if time.time() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+
+    async def _drone_loop(self, drone, mission, start):
+        # 1台分のコマンドループ。準備ができたら他の機体を待ち、そろったらミッションの手順を順に実行する
+        loop = asyncio.get_running_loop()
+        frames = []
+        sent = 0
+        flying = False
+        started = None
+        error = None
+        yaw = 0  # 撮れなかったフレームがあっても合成で向きを合わせられるよう、回した角度を数える
+        try:
+            try:
+                await self._prepare(drone, mission)
+            except BaseException:
+                await start.abort()
+                raise
+            await start.wait()
+            started = time.perf_counter()
+            last_ok = time.time()
+            for step in mission.steps:
+                if step.kind == "command":
+                    response = await self._send(drone, step.value)
+                    sent += 1
+                    name = command_type(step.value)
+                    if response != "ok":
+                        raise TelloError(f"{step.where}: コマンド '{step.value}' が失敗しました: {response}")
+                    last_ok = time.time()
+                    if name in ("cw", "ccw"):
+                        yaw += int(step.value.split()[1]) * (1 if name == "cw" else -1)
+                    elif name == "takeoff":
+                        flying = True
+                    elif name in ("land", "emergency"):
+                        flying = False
+                elif step.kind == "capture":
+                    frame = await loop.run_in_executor(None, drone.capture, step.options["settle"],
+                                                       step.options["timeout"], last_ok)
+                    if frame is None:
+                        self._log(drone, f"{step.value}: フレームを取得できませんでした")
+                        continue
+                    frames.append((step.value, frame, yaw))
+                    if self._writer is not None:
+                        path = os.path.join(mission.output_dir, step.value)
+                        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                        self._writer.write(path, frame)
+                elif step.kind == "wait":
+                    await asyncio.sleep(step.value)
+                elif not await self._wait_until(drone, step.value, step.options["timeout"]):
+                    message = f"{step.where}: {step.options['timeout']:.1f}秒以内に {step.value} になりませんでした"
+                    if step.options["on_timeout"] == "abort":
+                        raise TelloError(message)
+                    self._log(drone, message)
+        except asyncio.BrokenBarrierError:
+            error = "他の機体の準備が済まなかったので離陸しませんでした"
+        except (TelloError, OSError, RuntimeError) as e:
+            error = str(e)
+        except Exception as e:
+            # 1台の予期しない失敗で gather ごと止めず、その機体だけ着陸させて結果に残す
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            if flying:
+                self._log(drone, "中断したので着陸します")
+                try:
+                    await drone.channel.send("land")
+                except Exception as e:
+                    self._log(drone, f"着陸のコマンドが失敗しました: {e}")
+        elapsed = 0.0 if started is None else time.perf_counter() - started
+        if error:
+            self._log(drone, f"失敗: {error}")
+        else:
+            self._log(drone, f"{mission.name}: 完了 {elapsed:.1f}秒 / コマンド {sent} 個 / 撮影 {len(frames)} 枚")
+        return SwarmResult(drone, mission, frames, elapsed, sent, error)
+
+    async def run(self, missions):
+        """
+        missions[i] を drones[i] で実行し、全ての機体が終わったら SwarmResult のリストを返します。
+
+        どの機体も準備（接続・電池の確認・映像）が済むまで待ち、そろってから一斉に始めます。
+        飛行中の機体が失敗したときはその機体だけを着陸させ、他の機体はそのまま続けます。
+        """
+        missions = list(missions)
+        if len(missions) > len(self.drones):
+            raise ValueError(f"ミッション {len(missions)} 個に対して機体が {len(self.drones)} 台しかありません")
+        get_state_listener()
+        start = asyncio.Barrier(len(missions))
+        try:
+            return await asyncio.gather(*(self._drone_loop(drone, mission, start)
+                                          for drone, mission in zip(self.drones, missions)))
+        finally:
+            if self._writer is not None:
+                self._writer.flush()
+
+    # --- 結果 ---
+
+    @staticmethod
+    def gather(results):
+        """
+        全ての機体のフレームを capture のフォルダ名（"200cm/..." なら "200cm"）ごとにまとめ、
+        {フォルダ名: (フレームのリスト, 向きのリスト)} を返します。フォルダのないものはミッションの名前でまとめます。
+        """
+        groups = collections.OrderedDict()
+        for result in results:
+            for name, frame, yaw in result.frames:
+                label = os.path.dirname(name) or result.mission.name
+                frames, yaws = groups.setdefault(label, ([], []))
+                frames.append(frame)
+                yaws.append(yaw)
+        return groups
+
+    def stitch(self, results, output_dir=".", mode="yaw", **options):
+        """
+        gather() でまとめたフレームを PanoramaBatch で並列に合成し、BatchResult のリストを返します。
+        """
+        from .panorama.batch import PanoramaBatch
+
+        groups = self.gather(results)
+        if not groups:
+            return []
+        os.makedirs(output_dir, exist_ok=True)
+        with PanoramaBatch(mode=mode, **options) as batch:
+            for label, (frames, yaws) in groups.items():
+                # 撮れなかったフレームは飛ばしているので、1枚ずつの向きを渡す
+                extra = {"yaws_deg": yaws} if mode in ("yaw", "stream") else {}
+                batch.submit(label, frames, os.path.join(output_dir, f"{label}_panorama.jpg"), **extra)
+            return batch.print_results()
+
+    def print_results(self, results):
+        elapsed = [r.elapsed for r in results]
+        print(f"[SWARM] {len(results)} 台: 全体 {max(elapsed, default=0.0):.1f}秒 "
+              f"(1台で順に飛ぶと {sum(elapsed):.1f}秒) / 失敗 {sum(1 for r in results if r.error)} 台")
+        for r in results:
+            status = f"失敗: {r.error}" if r.error else f"{r.elapsed:.1f}秒"
+            print(f"[SWARM]   {r.drone.name}: {r.mission.name} {status} / コマンド {r.commands} 個 / "
+                  f"撮影 {len(r.frames)} 枚")
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        for drone in self.drones:
+            drone.close()
+
+
+# --- 仕事の分け方 ---
+
+def _moves(delta):
+    # 高さの差を up / down のステップにする（1回は 20〜500cm、20cm 未満の差は動かない）
+    steps = []
+    while abs(delta) >= 20:
+        amount = min(abs(delta), MOVE_MAX_CM)
+        if 0 < abs(delta) - amount < 20:
+            amount = abs(delta) - 20
+        steps.append({"up" if delta > 0 else "down": amount})
+        delta -= amount if delta > 0 else -amount
+    return steps
+
+
+def split_heights(heights, drones, shots=12, settle=True, output_dir="swarm_panorama"):
+    """
+    パノラマを撮る高さを機体に分け、機体ごとのミッションのリストを返します。
+
+    高さは低い順に機体へ1つずつ配るので、台数が高さの数より少ないときは1台が複数の高さを低い順に回ります。
+    フレームは "{高さ}cm/panorama_image_XX.jpg" として撮り、stitch() で高さごとに合成されます。
+
+    Args:
+        heights (list): 撮影する高さ[cm]。
+        drones (int): 機体の数。
+        shots (int): 1周で撮る枚数。
+        settle (bool): 回転のたびに落ち着くのを待ってから撮るかどうか。
+        output_dir (str): フレームの保存先。
+    """
+    heights = sorted(heights)
+    missions = []
+    for index in range(min(drones, len(heights))):
+        assigned = heights[index::drones]
+        steps = ["streamon", "takeoff"]
+        current = TAKEOFF_HEIGHT_CM
+        for height in assigned:
+            steps += _moves(height - current)
+            current = height
+            steps.append({"wait_until": {"vgz": [-1, 1]}, "timeout": 3})
+            steps.append({"repeat": shots, "var": "i", "steps": [
+                {"capture": f"{height}cm/panorama_image_{{i:02d}}.jpg", "settle": settle},
+                {"cw": 360 // shots},
+            ]})
+        steps += ["land", "streamoff"]
+        name = "パノラマ " + ", ".join(f"{h}cm" for h in assigned)
+        missions.append(Mission({"name": name, "output_dir": output_dir, "steps": steps}))
+    return missions
+
+
+def split_text(text, drones, height=60.0, up=100):
+    """
+    文字列を続いた文字のかたまりに分けて機体ごとに描くミッションと、機体を置く位置を返します。
+
+    文字は HEL.py と同じ水平面に描きます。各機体は、担当する文字の書き始めの位置に置いて離陸させます。
+    同時に飛ぶ機体がぶつからないよう、かたまりどうしの間は SPACING_CM（2m）以上空けて置くので、
+    描いた文字列は元の文字列より横に広がります。写真などで元の文字列に並べ直すときは、
+    i 番目のかたまりを shifts[i] だけ左へ戻してください。
+
+    Args:
+        text (str): 描く文字列。
+        drones (int): 機体の数。
+        height (float): 文字の高さ[cm]。
+        up (int): 離陸してから描き始めるまでに上がる高さ[cm]（0 なら上がらない）。
+    Returns:
+        tuple: (ミッションのリスト, 置く位置のリスト, ずらした量のリスト)。位置は元の文字列全体の
+            左下を原点とした (右[cm], 前[cm])、ずらした量は元の文字列での位置から右へずらした cm。
+    Raises:
+        ValueError: 文字列が空のとき、または機体の数が1未満のとき。
+    """
+    from .glyphs import compile_text, layout, order_strokes
+
+    if not text:
+        raise ValueError("描く文字列が空です")
+    if drones < 1:
+        raise ValueError(f"機体の数は1以上にしてください: {drones}")
+    count = min(drones, len(text))
+    size, extra = divmod(len(text), count)
+    missions, placements, shifts = [], [], []
+    begin = 0
+    right = None  # 直前のかたまりの右端（ずらした後）
+    for index in range(count):
+        end = begin + size + (1 if index < extra else 0)
+        chunk = text[begin:end]
+        points, offsets = layout(chunk, height=height)
+        if len(points):
+            stroke, reverse = order_strokes(points, offsets)[0]
+            first = points[offsets[stroke + 1] - 1] if reverse else points[offsets[stroke]]
+            # 文字列全体の中での位置（前の文字とのカーニングも含める）
+            before = len(layout(text[:begin], height=height)[0]) if begin else 0
+            offset = layout(text[:end], height=height)[0][before] - points[0]
+            # 前のかたまりと SPACING_CM 以上離れるまで右へずらす
+            left = offset[0] + points[:, 0].min()
+            shift = 0.0 if right is None else max(0.0, right + SPACING_CM - left)
+            right = offset[0] + points[:, 0].max() + shift
+            commands, _ = compile_text(chunk, height=height)
+            steps = ["takeoff"] + _moves(up) + commands + ["land"]
+            missions.append(Mission({"name": f"'{chunk}'", "steps": steps}))
+            placements.append((float(first[0] + offset[0] + shift), float(first[1] + offset[1])))
+            shifts.append(float(shift))
+        begin = end
+    return missions, placements, shifts
+
+
+# --- コマンドライン ---
+
+def _parse_drone(text, index):
+    # "192.168.0.101" または "192.168.0.101:11112"（映像のポート）
+    ip, _, port = text.partition(":")
+    return SwarmDrone(ip, video_port=int(port) if port else TELLO_VIDEO_PORT + index)
+
+
+def _start_simulators(count, time_scale, frames_dir):
+    from .sim import TelloSimulator
+    root = os.path.join(os.path.dirname(__file__), "..")
+    frames = frames_dir if os.path.isabs(frames_dir) else os.path.join(root, frames_dir)
+    sims = [TelloSimulator(host=f"127.0.0.{SIM_HOST_BASE + i}", time_scale=time_scale, frames_dir=frames,
+                           verbose=False).start() for i in range(count)]
+    return sims, [SwarmDrone(sim.host, video_port=TELLO_VIDEO_PORT + i) for i, sim in enumerate(sims)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="複数の Tello に仕事を分けて同時に飛ばします")
+    sub = parser.add_subparsers(dest="action", required=True)
+    panorama = sub.add_parser("panorama", help="高さごとのパノラマを機体に分けて撮り、合成する")
+    panorama.add_argument("--heights", type=int, nargs="+", default=[200, 300, 400, 500], help="撮影する高さ（cm）")
+    panorama.add_argument("--shots", type=int, default=12, help="1周で撮る枚数")
+    panorama.add_argument("--out", default="swarm_panorama", help="フレームとパノラマの保存先")
+    letters = sub.add_parser("text", help="文字列を機体に分けて描く")
+    letters.add_argument("text")
+    letters.add_argument("--height", type=float, default=60.0, help="文字の高さ（cm）")
+    for command in (panorama, letters):
+        command.add_argument("--drones", nargs="+", default=[], metavar="IP[:VIDEO_PORT]",
+                             help="機体の IP アドレス（映像のポートは省略時 11111 から順に）")
+        command.add_argument("--sim", type=int, default=0, help="機体の代わりにこの台数のシミュレータを起動する")
+        command.add_argument("--time-scale", type=float, default=1.0, help="シミュレータの動作時間の倍率")
+        command.add_argument("--frames", default=SIM_FRAMES, help="シミュレータが流すJPEGのフォルダ")
+    args = parser.parse_args()
+
+    sims = []
+    if args.sim:
+        sims, drones = _start_simulators(args.sim, args.time_scale, args.frames)
+    else:
+        drones = [_parse_drone(address, i) for i, address in enumerate(args.drones)]
+    if not drones:
+        parser.error("--drones か --sim で機体を指定してください")
+
+    if args.action == "panorama":
+        missions = split_heights(args.heights, len(drones), shots=args.shots, output_dir=args.out)
+    else:
+        missions, placements, shifts = split_text(args.text, len(drones), height=args.height)
+        for drone, mission, (x, y), shift in zip(drones, missions, placements, shifts):
+            print(f"[SWARM] {drone.name}: {mission.name} を描く（右 {x:.0f}cm, 前 {y:.0f}cm に置く。"
+                  f"元の文字列より {shift:.0f}cm 右）")
+    for drone, mission in zip(drones, missions):
+        estimate = mission.estimate()
+        print(f"[SWARM] {drone.name}: {mission.name} 見積もり {estimate.total_time:.1f}秒 / 電池 {estimate.battery:.1f}%")
+
+    swarm = Swarm(drones)
+    try:
+        results = asyncio.run(swarm.run(missions))
+        swarm.print_results(results)
+        if args.action == "panorama":
+            swarm.stitch(results, args.out)
+    finally:
+        swarm.close()
+        for sim in sims:
+            sim.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,452 @@
+"""
+状態パケット（UDP 8890）を飛行ログに記録し、あとから読み出して再生するテレメトリレコーダ。
+
+これまでのスクリプトは get_height() などをその場で1回読むだけで、状態の流れは残っていませんでした。
+TelemetryRecorder はパケットを受け取るたびに値を確保済みの NumPy の配列の1行に書き込み、
+配列が埋まったら項目ごとのファイルに追記します（1パケットごとに新しい配列は作らない）。
+ログは項目ごとに1つのファイルを持つ列指向の形式なので、読むときは必要な項目だけを memmap で開けます。
+
+    recorder = TelemetryRecorder("flight_0619.tlm")   # 共有の StateListener から受け取る
+    recorder.mark("capture 2.0m")                      # 撮影などの出来事を時刻と一緒に残す
+    recorder.close()
+
+    log = TelemetryLog("flight_0619.tlm")
+    log["h"], log.t                                     # 高さと受信時刻の配列（memmap）
+    log.interpolate("yaw", frame_times)                 # 撮影した時刻の機首の向き（合成の初期値に使える）
+    log.settle_after(t)                                 # t から姿勢が落ち着くまでの時間
+    listener = log.listener(speed=2.0)                  # StateListener と同じ使い方で再生する
+
+djitellopy のように 8890 番ポートを自分で受信するライブラリと使うときは、poll に状態を返す関数
+（tello.get_current_state）を渡すと、その関数を一定の間隔で読んで記録します。
+
+ログのディレクトリの中身:
+    meta.json    項目の名前と型、記録した行数、出来事（[時刻, ラベル] のリスト）
+    t.f8         受信時刻（float64, UNIX 時刻）
+    <項目>.f4    各項目の値（float32, 受信しなかった項目は NaN）
+
+    python -m tellolib.telemetry record flight.tlm --duration 60   # 記録する
+    python -m tellolib.telemetry info flight.tlm                   # 概要を表示する
+    python -m tellolib.telemetry csv flight.tlm flight.csv         # CSV に書き出す
+"""
+import argparse
+import datetime
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from .protocol import TELLO_IP
+
+# Tello の状態パケットの項目（SDK 2.0）。mid, x, y, z はミッションパッドを使うときだけ意味がある
+FIELDS = ("pitch", "roll", "yaw", "vgx", "vgy", "vgz", "templ", "temph", "tof", "h", "bat", "baro", "time",
+          "agx", "agy", "agz", "mid", "x", "y", "z")
+# 再生するときに整数に戻す項目（パケットの中で整数で送られてくるもの）
+INTEGER_FIELDS = frozenset(FIELDS) - {"baro", "agx", "agy", "agz"}
+CHUNK_ROWS = 512   # 何行たまったらファイルに書き出すか（10 Hz で約50秒分）
+
+
+class TelemetryRecorder:
+    """
+    状態パケットを列指向のログに記録します。
+
+    Args:
+        path (str): ログのディレクトリ（なければ作る。既にあれば上書きする）。
+        listener (StateListener): 受信に使うリスナー。poll を指定しなければ get_state_listener() を共有する。
+        poll (callable): 状態の辞書を返す関数。指定すると rate の間隔で読んで記録する（djitellopy 用）。
+        rate (float): poll を読む頻度（Hz）。
+        ip (str): 記録する機体の IP アドレス（listener から受け取るとき）。None なら全て。
+        fields (tuple): 記録する項目。
+        chunk (int): 何行ごとにファイルに書き出すか。
+    """
+
+    def __init__(self, path, listener=None, poll=None, rate=10.0, ip=None, fields=FIELDS, chunk=CHUNK_ROWS,
+                 verbose=True):
+        self.path = path
+        self.fields = tuple(fields)
+        self.ip = ip
+        self.verbose = verbose
+        self.count = 0
+        self.events = []
+        self._index = {name: i for i, name in enumerate(self.fields)}
+        # 1チャンク分の配列を先に確保しておき、パケットごとにその1行を書き換える
+        self._times = np.zeros(chunk, np.float64)
+        self._values = np.full((chunk, len(self.fields)), np.nan, np.float32)
+        self._rows = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._started = time.time()
+
+        os.makedirs(path, exist_ok=True)
+        self._files = {"t": open(os.path.join(path, "t.f8"), "wb")}
+        for name in self.fields:
+            self._files[name] = open(os.path.join(path, f"{name}.f4"), "wb")
+        self._write_meta()
+
+        self._poll_thread = None
+        self._listener = None
+        if poll is not None:
+            self._poll = poll
+            self._interval = 1.0 / rate
+            self._poll_thread = threading.Thread(target=self._poll_loop, name="tello-telemetry", daemon=True)
+            self._poll_thread.start()
+        else:
+            if listener is None:
+                from .state import get_state_listener
+                listener = get_state_listener()
+            listener.add_callback(self._on_state)
+            self._listener = listener
+
+    def _on_state(self, ip, timestamp, state):
+        if self.ip is None or ip == self.ip:
+            self.record(timestamp, state)
+
+    def _poll_loop(self):
+        last = None
+        while not self._closed:
+            started = time.time()
+            state = self._poll()
+            # 状態はパケットごとに新しい辞書になるので、前回と同じ辞書なら新しいパケットはまだ届いていない
+            if state and state is not last:
+                self.record(started, state)
+                last = state
+            time.sleep(max(0.0, self._interval - (time.time() - started)))
+
+    def record(self, timestamp, state):
+        """
+        1つの状態（辞書）を記録します。知らない項目は無視し、ない項目は NaN になります。
+        """
+        with self._lock:
+            if self._closed:
+                return
+            row = self._values[self._rows]
+            row.fill(np.nan)
+            for key, value in state.items():
+                i = self._index.get(key)
+                if i is not None and isinstance(value, (int, float)):
+                    row[i] = value
+            self._times[self._rows] = timestamp
+            self._rows += 1
+            if self._rows == len(self._times):
+                self._flush()
+
+    def mark(self, label, timestamp=None):
+        """
+        撮影やコマンドなどの出来事を時刻と一緒に記録します。
+        """
+        with self._lock:
+            self.events.append([timestamp if timestamp is not None else time.time(), str(label)])
+
+    def _flush(self):
+        # 列ごとのファイルに追記してから行数を更新する（途中で止まっても meta.json の行数までは読める）
+        rows = self._rows
+        if rows:
+            self._times[:rows].tofile(self._files["t"])
+            for i, name in enumerate(self.fields):
+                # 1列ずつ取り出すと列の並びが飛び飛びなので、連続した配列にしてから書く
+                np.ascontiguousarray(self._values[:rows, i]).tofile(self._files[name])
+            for f in self._files.values():
+                f.flush()
+            self.count += rows
+            self._rows = 0
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {
+            "version": 1,
+            "started": datetime.datetime.fromtimestamp(self._started).isoformat(timespec="seconds"),
+            "fields": list(self.fields),
+            "count": self.count,
+            "events": self.events,
+        }
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        if self._listener is not None:
+            # 共有の StateListener に登録したままにすると、閉じた後も呼ばれ続ける
+            self._listener.remove_callback(self._on_state)
+            self._listener = None
+        if self._poll_thread is not None:
+            self._closed = True
+            self._poll_thread.join()
+        with self._lock:
+            if self._files is None:
+                return
+            self._closed = True
+            self._flush()
+            for f in self._files.values():
+                f.close()
+            self._files = None
+        if self.verbose:
+            duration = time.time() - self._started
+            print(f"[TELEMETRY] {self.count} 行を記録しました ({self.count / max(duration, 1e-6):.1f} Hz): {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TelemetryLog:
+    """
+    TelemetryRecorder が書いたログを読み出します。各項目は読み取り専用の memmap です。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.fields = tuple(meta["fields"])
+        self.events = [(t, label) for t, label in meta.get("events", [])]
+        self.started = meta.get("started")
+        self.count = meta["count"]
+        self._columns = {}
+        self.t = self._open("t", "t.f8", np.float64)
+
+    def _open(self, name, filename, dtype):
+        if self.count == 0:
+            return np.zeros(0, dtype)
+        return np.memmap(os.path.join(self.path, filename), dtype=dtype, mode="r", shape=(self.count,))
+
+    def __getitem__(self, name):
+        if name == "t":
+            return self.t
+        if name not in self.fields:
+            raise KeyError(name)
+        if name not in self._columns:
+            self._columns[name] = self._open(name, f"{name}.f4", np.float32)
+        return self._columns[name]
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def duration(self):
+        return float(self.t[-1] - self.t[0]) if self.count >= 2 else 0.0
+
+    def state(self, i):
+        """
+        i 行目を状態パケットと同じ形の辞書で返します（NaN の項目は含めない）。
+        """
+        state = {}
+        for name in self.fields:
+            value = self[name][i]
+            if not np.isnan(value):
+                state[name] = int(value) if name in INTEGER_FIELDS else float(value)
+        return state
+
+    def between(self, start, end):
+        """
+        時刻 start から end までの行の範囲を slice で返します。
+        """
+        return slice(int(np.searchsorted(self.t, start)), int(np.searchsorted(self.t, end, side="right")))
+
+    def interpolate(self, name, times):
+        """
+        times の各時刻での name の値を前後の行から補間して返します（例: 撮影した時刻の yaw）。
+        記録が1行もない（または name の値が1つもない）ときは全て NaN を返します。
+        """
+        values = np.asarray(self[name], np.float64)
+        valid = ~np.isnan(values)
+        if not valid.any():
+            return np.full(np.shape(times), np.nan)
+        if name != "yaw":
+            return np.interp(np.asarray(times, np.float64), self.t[valid], values[valid])
+        # yaw は -180 と 180 の境目で値が飛ぶので、つなげてから補間して範囲を戻す
+        unwrapped = np.unwrap(values[valid], period=360.0)
+        yaw = np.interp(np.asarray(times, np.float64), self.t[valid], unwrapped)
+        return (yaw + 180.0) % 360.0 - 180.0
+
+    def settle_after(self, start, tolerance=1.0, hold=0.3, timeout=5.0):
+        """
+        時刻 start から、pitch・roll の変化と速度が tolerance 以内の状態が hold 秒続くまでの時間を返します。
+        timeout 秒以内に落ち着かなければ None。SettleTrigger の待ち時間を決めるのに使います。
+        """
+        rows = self.between(start, start + timeout)
+        t = self.t[rows]
+        if len(t) == 0:
+            return None
+        pitch = np.asarray(self["pitch"][rows], np.float64)
+        roll = np.asarray(self["roll"][rows], np.float64)
+        speed = np.nanmax(np.abs(np.stack([self[name][rows] for name in ("vgx", "vgy", "vgz")])), axis=0)
+        calm = (np.abs(np.diff(pitch, prepend=pitch[0])) <= tolerance) & \
+               (np.abs(np.diff(roll, prepend=roll[0])) <= tolerance) & (np.nan_to_num(speed) <= tolerance)
+        since = None
+        for i in range(len(t)):
+            if not calm[i]:
+                since = None
+                continue
+            if since is None:
+                since = t[i]
+            if t[i] - since >= hold:
+                return float(since - start)
+        return None
+
+    def flight_battery(self):
+        """
+        飛行中（高さが 0 より大きい間）の (秒数, 減った電池の%) を返します。scheduler.EnergyModel.observe_flight に渡せます。
+        """
+        if self.count < 2 or "h" not in self.fields or "bat" not in self.fields:
+            return 0.0, 0.0
+        h = np.asarray(self["h"], np.float64)
+        flying = np.flatnonzero(h > 0)
+        if len(flying) < 2:
+            return 0.0, 0.0
+        first, last = flying[0], flying[-1]
+        return float(self.t[last] - self.t[first]), float(self["bat"][first] - self["bat"][last])
+
+    def listener(self, speed=1.0, ip="replay", start=True):
+        """
+        ログを再生する ReplayListener を返します。
+        """
+        return ReplayListener(self, speed, ip, start=start)
+
+    def to_csv(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(",".join(("t",) + self.fields) + "\n")
+            columns = [self.t] + [self[name] for name in self.fields]
+            for i in range(self.count):
+                f.write(",".join("" if np.isnan(c[i]) else f"{c[i]:.6f}".rstrip("0").rstrip(".") for c in columns) + "\n")
+
+    def print_summary(self):
+        print(f"[TELEMETRY] {self.path}: {self.count} 行 / {self.duration:.1f}秒 "
+              f"({self.count / max(self.duration, 1e-6):.1f} Hz) / 開始 {self.started}")
+        if self.count:
+            for name in ("h", "tof", "bat", "yaw", "baro"):
+                if name in self.fields:
+                    values = np.asarray(self[name], np.float64)
+                    if not np.all(np.isnan(values)):
+                        print(f"  {name:<5} 最小 {np.nanmin(values):8.1f}  最大 {np.nanmax(values):8.1f}  "
+                              f"最後 {values[-1]:8.1f}")
+            seconds, used = self.flight_battery()
+            if seconds:
+                print(f"  飛行 {seconds:.0f}秒 / 電池 {used:.0f}% ({used / seconds * 60:.2f}%/分)")
+        for t, label in self.events:
+            settle = self.settle_after(t) if self.count else None
+            settle = "-" if settle is None else f"{settle:.2f}秒"
+            print(f"  {t - self.t[0] if self.count else 0.0:8.2f}秒  {label}  (落ち着くまで {settle})")
+
+
+class ReplayListener:
+    """
+    TelemetryLog を記録した時刻の間隔で再生します。StateListener と同じメソッドを持つので、
+    状態を読む処理（MissionRunner の wait_until、SettleTrigger の attitude など）を飛ばさずに試せます。
+
+    Args:
+        log (TelemetryLog): 再生するログ。
+        speed (float): 再生の速さ（2.0 で2倍速、0 なら待たずに全て流す）。
+        ip (str): 状態の送信元として扱う IP アドレス。
+        start (bool): すぐに再生を始めるかどうか。False なら add_callback で受け手を登録してから
+            start() を呼ぶ（speed=0 では登録する前に流れ終わってしまうため）。
+    """
+
+    def __init__(self, log, speed=1.0, ip="replay", start=True):
+        self.log = log
+        self.speed = speed
+        self.ip = ip
+        self.packets = 0
+        self._latest = (None, {})
+        self._callbacks = []
+        self._updated = threading.Condition()
+        self._running = True
+        self.finished = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="tello-replay", daemon=True)
+        if start:
+            self.start()
+
+    def start(self):
+        """
+        再生を始めます（start=False で作った場合）。
+        """
+        self._thread.start()
+        return self
+
+    def _loop(self):
+        started = time.time()
+        for i in range(self.log.count):
+            if not self._running:
+                break
+            if self.speed > 0:
+                delay = (self.log.t[i] - self.log.t[0]) / self.speed - (time.time() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            timestamp = float(self.log.t[i])
+            state = self.log.state(i)
+            with self._updated:
+                self._latest = (timestamp, state)
+                self.packets += 1
+                self._updated.notify_all()
+            for callback in self._callbacks:
+                callback(self.ip, timestamp, state)
+        self.finished.set()
+
+    def add_callback(self, callback):
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        # StateListener.remove_callback と同じく、登録されていなければ何もしない
+        self._callbacks = [c for c in self._callbacks if c != callback]
+
+    def latest(self, ip=None):
+        with self._updated:
+            return self._latest
+
+    def get(self, key, ip=None, default=None):
+        return self.latest(ip)[1].get(key, default)
+
+    def wait_for_update(self, timeout=1.0):
+        with self._updated:
+            count = self.packets
+            return self._updated.wait_for(lambda: self.packets != count, timeout)
+
+    def close(self):
+        self._running = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tello の状態（テレメトリ）を記録・表示します")
+    sub = parser.add_subparsers(dest="action", required=True)
+    record = sub.add_parser("record", help="状態パケットを記録する（Ctrl+C で終了）")
+    record.add_argument("path", help="ログのディレクトリ")
+    record.add_argument("--duration", type=float, help="記録する秒数")
+    record.add_argument("--ip", default=TELLO_IP, help="状態を送らせる機体の IP アドレス")
+    info = sub.add_parser("info", help="ログの概要と出来事ごとの落ち着くまでの時間を表示する")
+    info.add_argument("paths", nargs="+")
+    csv = sub.add_parser("csv", help="CSV に書き出す")
+    csv.add_argument("path")
+    csv.add_argument("output")
+    args = parser.parse_args()
+
+    if args.action == "info":
+        for path in args.paths:
+            TelemetryLog(path).print_summary()
+    elif args.action == "csv":
+        TelemetryLog(args.path).to_csv(args.output)
+    else:
+        # 状態パケットは SDK モードに入った機体しか送らないので、"command" を送ってから受信する
+        from .client import get_client
+        from .state import get_state_listener
+        listener = get_state_listener()
+        get_client(args.ip, verbose=False).send("command")
+        recorder = TelemetryRecorder(args.path, listener, ip=args.ip)
+        try:
+            deadline = time.time() + args.duration if args.duration else None
+            while deadline is None or time.time() < deadline:
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            recorder.close()
+
+
+if __name__ == "__main__":
+    main()
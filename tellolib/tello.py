@@ -0,0 +1,180 @@
+"""
+djitellopy の Tello クラスと同じ名前のメソッドを持つ軽量クラス。
+
+    from djitellopy import Tello
+を
+    from tellolib.tello import Tello
+に置き換えるだけで、生ソケットのスクリプトと同じ TelloClient を経由して送信するようになります。
+"""
+import time
+
+from .client import get_client
+from .protocol import TELLO_IP, TELLO_PORT
+from .state import get_state_listener
+
+
+class TelloError(Exception):
+    """
+    Tello が "ok" 以外を返した、または応答がなかったときの例外。
+    """
+
+
+class Tello:
+    """
+    djitellopy.Tello のよく使うメソッドだけを実装したクラス。
+
+    Args:
+        host (str): Tello の IP アドレス。
+        client (TelloClient): 送信に使うクライアント。省略時は get_client(host) を共有する。
+        state (StateListener): 状態の受信に使うリスナー。省略時は共有のリスナーを使う。
+    """
+
+    def __init__(self, host=TELLO_IP, client=None, state=None):
+        self.host = host
+        self.client = client if client is not None else get_client(host, TELLO_PORT)
+        self._state = state
+        self.is_flying = False
+        self.is_connected = False
+        self.stream_on = False
+        self.last_command_time = None  # 最後に "ok" を受け取った時刻（time.time()）
+
+    @property
+    def state(self):
+        if self._state is None:
+            self._state = get_state_listener()
+        return self._state
+
+    # --- 送信 ---
+
+    def send_control_command(self, command, timeout=None):
+        response = self.client.send(command, timeout=timeout)
+        if response != "ok":
+            raise TelloError(f"コマンド '{command}' が失敗しました: {response}")
+        self.last_command_time = time.time()
+        return True
+
+    def send_read_command(self, command):
+        response = self.client.send(command)
+        if response is None:
+            raise TelloError(f"コマンド '{command}' の応答がありません")
+        return response
+
+    def send_rc_control(self, left_right_velocity, forward_backward_velocity, up_down_velocity, yaw_velocity):
+        self.client.send(f"rc {left_right_velocity} {forward_backward_velocity} {up_down_velocity} {yaw_velocity}")
+
+    # --- 接続と離着陸 ---
+
+    def connect(self, wait_for_state=True):
+        self.state  # 8890 番ポートの受信を先に始めておく
+        self.send_control_command("command")
+        self.is_connected = True
+        if wait_for_state and not self.state.latest(self.host)[0]:
+            self.state.wait_for_update(timeout=3.0)
+
+    def takeoff(self):
+        self.send_control_command("takeoff")
+        self.is_flying = True
+
+    def land(self):
+        self.send_control_command("land")
+        self.is_flying = False
+
+    def emergency(self):
+        self.client.send("emergency")
+        self.is_flying = False
+
+    def streamon(self):
+        self.send_control_command("streamon")
+        self.stream_on = True
+
+    def streamoff(self):
+        self.send_control_command("streamoff")
+        self.stream_on = False
+
+    def get_frame_read(self):
+        """
+        共有の VideoReceiver を返します。djitellopy と同じく .frame で最新のフレームが得られ、
+        wait_for_frame(newer_than=tello.last_command_time) で移動後のフレームを待てます。
+        """
+        from .video import get_video_receiver  # OpenCV が必要なので使うときに読み込む
+        return get_video_receiver()
+
+    def end(self):
+        if self.is_flying:
+            self.land()
+        if self.stream_on:
+            self.streamoff()
+        self.is_connected = False
+
+    # --- 移動 ---
+
+    def move(self, direction, x):
+        self.send_control_command(f"{direction} {x}")
+
+    def move_up(self, x):
+        self.move("up", x)
+
+    def move_down(self, x):
+        self.move("down", x)
+
+    def move_left(self, x):
+        self.move("left", x)
+
+    def move_right(self, x):
+        self.move("right", x)
+
+    def move_forward(self, x):
+        self.move("forward", x)
+
+    def move_back(self, x):
+        self.move("back", x)
+
+    def rotate_clockwise(self, x):
+        self.send_control_command(f"cw {int(x)}")
+
+    def rotate_counter_clockwise(self, x):
+        self.send_control_command(f"ccw {int(x)}")
+
+    def go_xyz_speed(self, x, y, z, speed):
+        self.send_control_command(f"go {x} {y} {z} {speed}")
+
+    def curve_xyz_speed(self, x1, y1, z1, x2, y2, z2, speed):
+        self.send_control_command(f"curve {x1} {y1} {z1} {x2} {y2} {z2} {speed}")
+
+    def set_speed(self, x):
+        self.send_control_command(f"speed {x}")
+
+    # --- 状態（8890 番ポートのテレメトリから読む） ---
+
+    def get_state_field(self, key):
+        value = self.state.get(key, self.host)
+        if value is None:
+            raise TelloError(f"状態 '{key}' をまだ受信していません")
+        return value
+
+    def get_current_state(self):
+        """
+        最新の状態パケットを辞書で返します（djitellopy と同じ名前）。
+        """
+        return self.state.latest(self.host)[1]
+
+    def get_battery(self):
+        return self.get_state_field("bat")
+
+    def get_height(self):
+        return self.get_state_field("h")
+
+    def get_distance_tof(self):
+        return self.get_state_field("tof")
+
+    def get_yaw(self):
+        return self.get_state_field("yaw")
+
+    def get_pitch(self):
+        return self.get_state_field("pitch")
+
+    def get_roll(self):
+        return self.get_state_field("roll")
+
+    def get_flight_time(self):
+        return self.get_state_field("time")
@@ -0,0 +1,281 @@
+"""
+各飛行スクリプトをシミュレータ相手に実行し、ミッション全体の時間の内訳を測るベンチマーク。
+
+スクリプトの中の time.sleep / asyncio.sleep は機体を止めたまま電池を減らしますが、
+どれだけの時間を占めているかはこれまで誰も測っていませんでした。run_mission は
+TelloSimulator を起動してスクリプトを TELLO_IP=127.0.0.1 の別プロセスで実行し、
+
+- コマンドの種類ごとの回数と応答待ちの時間
+- sleep の合計（直前に送ったコマンドの種類ごと）
+- それ以外（画像の保存・合成などの手元の処理）
+- 1秒あたりのコマンド数とミッション全体の時間
+
+を実機の時間に換算して出します。シミュレータは time_scale 倍の速さで動き、スクリプトの sleep も
+同じ倍率で縮めるので、全てのスクリプトを数十秒で計測できます。
+
+    python -m tellolib.throughput                       # 全てのスクリプト
+    python -m tellolib.throughput 0612/mitome/U.py --time-scale 0.2 --out missions.jsonl
+
+実行できないスクリプト（インストールされていないライブラリを使うものなど）は、エラーとして記録します。
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from .protocol import command_type
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# 計測する飛行スクリプト（ROOT からの相対パス）
+MISSIONS = (
+    "0612/mitome/U.py",
+    "0612/mitome/ULL.py",
+    "0619/mitome/hishigata.py",
+    "0612/kitano/HEL.py",
+    "0612/kitano/L.py",
+    "0612/Fujii/assigment_tello.py",
+    "0619/mitome/panorama.py",
+    "0619/kitano/panorama.py",
+    "0619/inaba/0619.py",
+    "0619/inaba/0619_gemini.py",
+    "0619/Fujii/tello.py",
+)
+
+# パノラマのスクリプトに流す映像（高さごとのサブフォルダ）
+DEFAULT_FRAMES = "0619/mitome/panorama"
+DEFAULT_TIME_SCALE = 0.1
+MISSION_TIMEOUT = 300.0
+
+
+class SleepMeter:
+    """
+    メインスレッドの time.sleep / asyncio.sleep を scale 倍に縮めて実行し、縮める前の時間を集計します。
+
+    sleep は直前に送ったコマンドの種類ごとに分けて数えます（"cw の後に 5秒" など）。
+    受信スレッドなど裏のスレッドの sleep はそのまま実行し、数えません。
+    """
+
+    def __init__(self, scale, last_command):
+        self.scale = scale
+        self.last_command = last_command
+        self.calls = 0
+        self.total = 0.0
+        self.by_command = {}
+        self._sleep = time.sleep
+        self._async_sleep = asyncio.sleep
+
+    def _count(self, seconds):
+        self.calls += 1
+        self.total += seconds
+        name = self.last_command() or "(開始前)"
+        self.by_command[name] = self.by_command.get(name, 0.0) + seconds
+
+    def install(self):
+        meter = self
+
+        def sleep(seconds):
+            if seconds > 0 and threading.current_thread() is threading.main_thread():
+                meter._count(seconds)
+                seconds *= meter.scale
+            meter._sleep(seconds)
+
+        async def async_sleep(delay, result=None):
+            if delay > 0:
+                meter._count(delay)
+                delay *= meter.scale
+            return await meter._async_sleep(delay, result)
+
+        time.sleep = sleep
+        asyncio.sleep = async_sleep
+
+    def uninstall(self):
+        time.sleep = self._sleep
+        asyncio.sleep = self._async_sleep
+
+
+def _last_command():
+    from .client import _clients
+    records = [client.records[-1] for client in list(_clients.values()) if client.records]
+    return command_type(records[-1].command) if records else None
+
+
+def _disable_windows():
+    # 計測するプロセスでは画像の表示をしない（waitKey(0) で止まらないように）
+    try:
+        import cv2
+    except ImportError:
+        return
+    cv2.imshow = lambda *args, **kwargs: None
+    cv2.waitKey = lambda *args, **kwargs: -1
+    cv2.destroyAllWindows = lambda *args, **kwargs: None
+
+
+def _run_child(script, scale, result_path):
+    # 計測するプロセスで実行する。スクリプトを __main__ として実行し、結果を JSON で書き出す
+    from .client import _clients
+
+    _disable_windows()
+    meter = SleepMeter(scale, _last_command)
+    meter.install()
+    error = None
+    started = time.perf_counter()
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit:
+        pass
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+    wall = time.perf_counter() - started
+    meter.uninstall()
+
+    commands = {}
+    for client in list(_clients.values()):
+        for name, s in client.summary().items():
+            c = commands.setdefault(name, {"count": 0, "time": 0.0, "timeouts": 0})
+            c["count"] += s["count"]
+            c["time"] += s["total"]
+            c["timeouts"] += s["timeouts"]
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump({"wall": wall, "sleep_calls": meter.calls, "sleep_nominal": meter.total,
+                   "sleep_by_command": meter.by_command, "commands": commands, "error": error}, f)
+
+
+def run_mission(script, time_scale=DEFAULT_TIME_SCALE, frames_dir=DEFAULT_FRAMES, latency=0.02,
+                timeout=MISSION_TIMEOUT, verbose=False):
+    """
+    スクリプトを1つシミュレータ相手に実行し、時間の内訳を辞書で返します。
+
+    Args:
+        script (str): 飛行スクリプトのパス（ROOT からの相対パスか絶対パス）。
+        time_scale (float): シミュレータの動作時間とスクリプトの sleep の倍率。
+        frames_dir (str): シミュレータが映像として流すJPEGのフォルダ。
+        latency (float): シミュレータの1コマンドあたりの通信遅延[秒]。
+        timeout (float): スクリプト1つの最大の実行時間[秒]（縮めた時間で）。
+        verbose (bool): スクリプトとシミュレータのログを出すかどうか。
+    Returns:
+        dict: 実機の時間に換算した内訳（"mission_time", "command_time", "sleep_time", "other_time",
+        "commands", "commands_per_sec", "by_command" など）。
+    """
+    from .sim import TelloSimulator
+
+    path = script if os.path.isabs(script) else os.path.join(ROOT, script)
+    frames = frames_dir if frames_dir is None or os.path.isabs(frames_dir) else os.path.join(ROOT, frames_dir)
+    workdir = tempfile.mkdtemp(prefix="mission-")
+    result_path = os.path.join(workdir, "result.json")
+    env = dict(os.environ, TELLO_IP="127.0.0.1", PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    child = [sys.executable, "-c",
+             "import sys; from tellolib.throughput import _run_child; _run_child(sys.argv[1], float(sys.argv[2]), sys.argv[3])",
+             path, str(time_scale), result_path]
+    output = None if verbose else subprocess.DEVNULL
+    sim = TelloSimulator(latency=latency, time_scale=time_scale, frames_dir=frames, verbose=verbose)
+    try:
+        with sim:
+            # スクリプトは画像などをカレントディレクトリに書くので、作業用のフォルダで実行する
+            try:
+                subprocess.run(child, cwd=workdir, env=env, stdout=output, stderr=output, timeout=timeout)
+            except subprocess.TimeoutExpired:
+                pass
+            stats = sim.stats()
+        if os.path.exists(result_path):
+            with open(result_path, encoding="utf-8") as f:
+                raw = json.load(f)
+        else:
+            raw = {"wall": None, "sleep_calls": 0, "sleep_nominal": 0.0, "sleep_by_command": {}, "commands": {},
+                   "error": f"{timeout:.0f}秒以内に終わりませんでした"}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return _convert(script, raw, time_scale, latency, stats)
+
+
+def _convert(script, raw, time_scale, latency, sim_stats):
+    # 縮めた時間で測った結果を実機の時間に換算する
+    #   コマンドの応答待ち: 通信遅延を除いた動作時間が time_scale 倍になっているので割り戻す
+    #   sleep: 縮める前の時間をそのまま使う
+    #   それ以外: 手元の処理なので測った時間のまま
+    def real(measured, count):
+        return max(measured - latency * count, 0.0) / time_scale + latency * count
+
+    by_command = {}
+    for name, c in raw["commands"].items():
+        by_command[name] = {"count": c["count"], "time": real(c["time"], c["count"]), "timeouts": c["timeouts"],
+                            "sleep_after": raw["sleep_by_command"].get(name, 0.0)}
+    for name, seconds in raw["sleep_by_command"].items():
+        by_command.setdefault(name, {"count": 0, "time": 0.0, "timeouts": 0, "sleep_after": seconds})
+    command_count = sum(c["count"] for c in raw["commands"].values())
+    measured_commands = sum(c["time"] for c in raw["commands"].values())
+    command_time = sum(c["time"] for c in by_command.values())
+    sleep_time = raw["sleep_nominal"]
+    record = {"script": script, "error": raw["error"], "commands": command_count, "sleep_calls": raw["sleep_calls"],
+              "command_time": command_time, "sleep_time": sleep_time, "other_time": None, "mission_time": None,
+              "commands_per_sec": None, "measured_wall": raw["wall"], "time_scale": time_scale,
+              "sim_battery": sim_stats["battery"], "by_command": by_command}
+    if raw["wall"] is not None and (raw["commands"] or not raw["error"]):
+        other = max(raw["wall"] - measured_commands - sleep_time * time_scale, 0.0)
+        mission = command_time + sleep_time + other
+        record.update(other_time=other, mission_time=mission,
+                      commands_per_sec=command_count / mission if mission > 0 else None)
+    return record
+
+
+def print_record(record):
+    if record["mission_time"] is None:
+        print(f"{record['script']:<32} エラー: {record['error']}")
+        return
+    mission = record["mission_time"]
+    share = (lambda seconds: f"{seconds:6.1f}秒 ({seconds / mission:4.0%})") if mission > 0 else (lambda s: "-")
+    print(f"{record['script']:<32} 全体 {mission:6.1f}秒  コマンド {record['commands']:3d}回 "
+          f"({record['commands_per_sec'] or 0:.2f}回/秒)  応答待ち {share(record['command_time'])}  "
+          f"sleep {share(record['sleep_time'])}  手元の処理 {share(record['other_time'])}")
+    for name, c in sorted(record["by_command"].items(), key=lambda kv: -(kv[1]["time"] + kv[1]["sleep_after"])):
+        print(f"    {name:<10} {c['count']:3d}回  応答待ち {c['time']:6.1f}秒  その後の sleep {c['sleep_after']:6.1f}秒"
+              + (f"  タイムアウト {c['timeouts']}" if c["timeouts"] else ""))
+    if record["error"]:
+        print(f"    エラー: {record['error']}")
+
+
+def run_missions(scripts=MISSIONS, time_scale=DEFAULT_TIME_SCALE, frames_dir=DEFAULT_FRAMES, output_path=None,
+                 verbose=False):
+    """
+    複数のスクリプトを順に計測して表にし、output_path があれば JSON Lines で追記します。
+    """
+    run = datetime.datetime.now().isoformat(timespec="seconds")
+    records = []
+    for script in scripts:
+        record = run_mission(script, time_scale, frames_dir, verbose=verbose)
+        record["run"] = run
+        records.append(record)
+        print_record(record)
+        if output_path:
+            with open(output_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    done = [r for r in records if r["mission_time"] is not None]
+    if done:
+        total = sum(r["mission_time"] for r in done)
+        sleep = sum(r["sleep_time"] for r in done)
+        print(f"[MISSION] {len(done)} 本: 合計 {total:.1f}秒 のうち sleep {sleep:.1f}秒 ({sleep / total:.0%})")
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="飛行スクリプトをシミュレータ相手に実行し、時間の内訳を測ります")
+    parser.add_argument("scripts", nargs="*", default=list(MISSIONS), help="飛行スクリプト（省略時は全て）")
+    parser.add_argument("--time-scale", type=float, default=DEFAULT_TIME_SCALE,
+                        help="動作時間と sleep の倍率（0.1 で10倍速）")
+    parser.add_argument("--frames", default=DEFAULT_FRAMES, help="シミュレータが流す映像のフォルダ")
+    parser.add_argument("--out", default=None, help="結果を追記する JSON Lines のファイル")
+    parser.add_argument("--verbose", action="store_true", help="スクリプトとシミュレータのログを出す")
+    args = parser.parse_args()
+    run_missions(args.scripts, args.time_scale, args.frames, args.out, args.verbose)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Tello との通信路（トランスポート）。
+
+TelloClient は send / recv / close の3つだけを使うので、
+同じインターフェースを持つクラスに差し替えればシミュレータや記録・再生にも使えます。
+"""
+import socket
+
+
+class Transport:
+    """
+    トランスポートのインターフェース。
+    """
+
+    def send(self, data):
+        raise NotImplementedError
+
+    def recv(self, timeout):
+        """
+        データを1つ受信します。timeout 秒以内に届かなければ None を返します。
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class UdpTransport(Transport):
+    """
+    1台の Tello に対する永続的な UDP ソケット。
+
+    Args:
+        ip (str): Tello の IP アドレス。
+        port (int): コマンドポート（通常 8889）。
+        local_port (int): 手元でバインドするポート。0 なら空いているポートを使う。
+    """
+
+    def __init__(self, ip, port, local_port=0):
+        self.address = (ip, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('0.0.0.0', local_port))
+        self._timeout = None
+
+    def send(self, data):
+        self.sock.sendto(data, self.address)
+
+    def recv(self, timeout):
+        # settimeout はシステムコールを伴うので値が変わったときだけ呼ぶ
+        if timeout != self._timeout:
+            self.sock.settimeout(timeout)
+            self._timeout = timeout
+        try:
+            data, _ = self.sock.recvfrom(2048)
+            return data
+        except socket.timeout:
+            return None
+
+    def drain(self):
+        """
+        受信バッファに残っているデータ（タイムアウトしたコマンドへの遅れた応答）を全て読み捨てます。
+        """
+        dropped = []
+        self.sock.setblocking(False)
+        try:
+            while True:
+                dropped.append(self.sock.recvfrom(2048)[0])
+        except (BlockingIOError, OSError):
+            pass
+        finally:
+            self.sock.settimeout(self._timeout)
+        return dropped
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,520 @@
+"""
+UDP 11111 番ポートで Tello の映像を受信し、常に最新のフレームだけを保持する受信機。
+
+cv2.VideoCapture('udp://@0.0.0.0:11111') はデコード済みのフレームを内部にためるので、
+cw の直後に read() すると回転前の古いフレームが返ってきます。VideoReceiver は
+受信スレッドとデコードスレッドを持ち、デコードが追いつかないときは古いデータを捨てて、
+最新のフレームを受信時刻と通し番号つきで保持します。
+
+    video = get_video_receiver()
+    tello.rotate_clockwise(30)
+    moved_at = time.time()
+    frame, timestamp, seq = video.wait_for_frame(newer_than=moved_at)
+
+映像のデコードには OpenCV と NumPy が、H.264（実機の映像）のデコードには PyAV が必要です。
+シミュレータの codec="mjpeg"（1データグラムに1枚のJPEG）は OpenCV だけでデコードできます。
+
+数秒に1枚の静止画しか使わない撮影でも、これまでは 30fps の 960×720 を全てデコードして BGR に
+変換していました。decode / every / reduce / buffers で、使わないフレームのデコードと変換を減らせます。
+
+    video = VideoReceiver(decode="keyframes", reduce=2, buffers=2)   # キーフレームだけを 480×360 で
+
+モードごとの CPU 使用率と遅延はシミュレータ相手に測れます。
+
+    python -m tellolib.video --codec h264 --seconds 5
+"""
+import argparse
+import collections
+import inspect
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from .protocol import TELLO_VIDEO_PORT
+
+JPEG_MAGIC = b'\xff\xd8'
+# デコード速度と遅延を計算するのに使う直近のフレーム数
+STATS_WINDOW = 30
+# "all" は全てのフレーム、"keyframes" は H.264 のキーフレームだけをデコードする
+DECODE_MODES = ("all", "keyframes")
+# MJPEG をデコードしながら 1/reduce に縮める imdecode のフラグ
+REDUCED_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4,
+                 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+class VideoReceiver:
+    """
+    映像を受信してデコードし、最新のフレームを保持します。
+
+    11111 番ポートはプロセス内で一度しかバインドできないため、
+    通常は get_video_receiver() で共有のインスタンスを使います。
+
+    Args:
+        port (int): 映像を受信するポート。
+        codec (str): "h264"、"mjpeg"、または "auto"（最初のデータグラムで判定する）。
+        max_backlog (float): デコード待ちのデータがこの秒数より古くなったら捨てて、
+            最新のデータ（H.264 では次のキーフレーム）から再開する。
+        decode (str): "all" か "keyframes"。"keyframes" は H.264 のキーフレーム（実機では約1秒に1枚）
+            だけをデコードし、それ以外のデータはデコーダに渡さない。MJPEG は全てキーフレームなので変わらない。
+        every (int): デコードしたフレーム（MJPEG では受信した画像）の every 枚に1枚だけを BGR にして届ける。
+            H.264 は参照フレームが必要なのでデコードは全て行い、変換だけを省く。
+        reduce (int): 1, 2, 4, 8 のいずれか。縦横 1/reduce の大きさで届ける。MJPEG はデコードしながら縮め、
+            H.264 はデコード後に YUV のまま縮めてから BGR に変換する。
+        buffers (int): 0 なら毎回新しい配列に書く。1 以上なら H.264 の BGR への変換をこの数の配列に順番に
+            書き込んで使い回す（メモリの確保をしない）。届いたフレームは buffers 枚後に上書きされるので、
+            持ち続ける場合は呼び出し側でコピーする。
+        verbose (bool): ログを出すかどうか。
+    """
+
+    def __init__(self, port=TELLO_VIDEO_PORT, codec="auto", max_backlog=0.2, decode="all", every=1, reduce=1,
+                 buffers=0, verbose=True):
+        if decode not in DECODE_MODES:
+            raise ValueError(f"decode は {DECODE_MODES} のいずれかです: {decode!r}")
+        if reduce not in REDUCED_FLAGS:
+            raise ValueError(f"reduce は {tuple(REDUCED_FLAGS)} のいずれかです: {reduce!r}")
+        if every < 1 or buffers < 0:
+            raise ValueError("every は1以上、buffers は0以上です")
+        self.port = port
+        self.codec = codec
+        self.max_backlog = max_backlog
+        self.decode = decode
+        self.every = every
+        self.reduce = reduce
+        self.buffers = buffers
+        self.verbose = verbose
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('0.0.0.0', port))
+        self.sock.settimeout(0.5)
+
+        self.packets = 0   # 受信したデータグラムの数
+        self.frames = 0    # 届けたフレームの数
+        self.decoded = 0   # デコードしたフレームの数（every で届けなかったものも含む）
+        self.dropped = 0   # デコードせずに捨てたデータグラム（またはフレーム）の数
+        self.errors = 0
+        self._arrivals = 0
+        self._pool = []
+        self._pool_index = 0
+        self._pending = collections.deque()  # (受信時刻, データグラム)
+        self._arrived = threading.Condition()
+        self._updated = threading.Condition()
+        self._frame = None
+        self._timestamp = None
+        self._seq = 0
+        self._decoded_times = collections.deque(maxlen=STATS_WINDOW)
+        self._latencies = collections.deque(maxlen=STATS_WINDOW)
+        self._decoder = None
+        self._running = True
+        self._threads = [threading.Thread(target=self._receive_loop, name="tello-video-recv", daemon=True),
+                         threading.Thread(target=self._decode_loop, name="tello-video-decode", daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    # --- 受信とデコード ---
+
+    def _receive_loop(self):
+        while self._running:
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            with self._arrived:
+                self._pending.append((time.time(), data))
+                self.packets += 1
+                self._arrived.notify()
+
+    def _decode_loop(self):
+        while self._running:
+            with self._arrived:
+                if not self._arrived.wait_for(lambda: self._pending or not self._running, timeout=0.5):
+                    continue
+                chunks = list(self._pending)
+                self._pending.clear()
+            if not chunks:
+                continue
+            if self._decoder is None:
+                self._decoder = self._create_decoder(chunks[0][1])
+                if self._decoder is None:
+                    continue
+            try:
+                self._decoder(chunks)
+            except Exception as e:
+                self.errors += 1
+                if self.verbose:
+                    print(f"[VIDEO] デコードに失敗しました: {e}")
+
+    def _create_decoder(self, first):
+        codec = self.codec
+        if codec == "auto":
+            codec = "mjpeg" if first.startswith(JPEG_MAGIC) else "h264"
+        if codec == "mjpeg":
+            decoder = self._decode_mjpeg
+        else:
+            decoder = _H264Decoder(self).decode
+        if self.verbose:
+            options = "" if (self.decode, self.every, self.reduce) == ("all", 1, 1) else \
+                f" decode={self.decode} every={self.every} reduce=1/{self.reduce}"
+            print(f"[VIDEO] {codec} の映像を受信しています (port {self.port}){options}")
+        return decoder
+
+    def _decode_mjpeg(self, chunks):
+        # 1データグラムが1枚なので、届ける番の最新の1枚だけをデコードすればよい
+        chosen = None
+        for chunk in chunks:
+            self._arrivals += 1
+            if self._arrivals % self.every == 0:
+                chosen = chunk
+        self.dropped += len(chunks) - (chosen is not None)
+        if chosen is None:
+            return
+        timestamp, jpeg = chosen
+        frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), REDUCED_FLAGS[self.reduce])
+        if frame is not None:
+            self.decoded += 1
+            self._publish(frame, timestamp)
+
+    def _buffer(self, shape):
+        # 使い回す配列を順番に返す（buffers=0 なら None で、cv2 が新しい配列を作る）
+        if not self.buffers:
+            return None
+        if not self._pool or self._pool[0].shape != shape:
+            self._pool = [np.empty(shape, np.uint8) for _ in range(self.buffers)]
+        self._pool_index = (self._pool_index + 1) % self.buffers
+        return self._pool[self._pool_index]
+
+    def _publish(self, frame, timestamp):
+        now = time.time()
+        with self._updated:
+            self._frame = frame
+            self._timestamp = timestamp
+            self._seq += 1
+            self.frames += 1
+            self._decoded_times.append(now)
+            self._latencies.append(now - timestamp)
+            self._updated.notify_all()
+
+    # --- フレームの取得 ---
+
+    def latest(self):
+        """
+        最新のフレームを (フレーム, 受信時刻, 通し番号) で返します。まだなければ (None, None, 0)。
+        """
+        with self._updated:
+            return self._frame, self._timestamp, self._seq
+
+    @property
+    def frame(self):
+        """
+        最新のフレーム（djitellopy の frame_read.frame と同じ使い方ができる）。
+        """
+        return self._frame
+
+    def wait_for_frame(self, newer_than=None, after_seq=None, timeout=2.0):
+        """
+        条件を満たす新しいフレームが届くまで待ち、(フレーム, 受信時刻, 通し番号) を返します。
+        時間内に届かなければ最新のフレームを返します（フレームがなければ (None, None, 0)）。
+
+        Args:
+            newer_than (float): この時刻（time.time()）より後に受信したフレームを待つ。
+                移動コマンドの応答を受け取った時刻を渡すと、移動後の映像が得られる。
+            after_seq (int): この通し番号より後のフレームを待つ。
+            timeout (float): 最大の待ち時間[秒]。
+        """
+        def ready():
+            if self._frame is None:
+                return False
+            if newer_than is not None and self._timestamp <= newer_than:
+                return False
+            if after_seq is not None and self._seq <= after_seq:
+                return False
+            return True
+
+        with self._updated:
+            if not self._updated.wait_for(ready, timeout) and self.verbose:
+                print(f"[VIDEO] {timeout:.1f}秒以内に新しいフレームが届きませんでした")
+            return self._frame, self._timestamp, self._seq
+
+    # --- 統計 ---
+
+    @property
+    def fps(self):
+        """
+        直近のデコード速度[フレーム/秒]。
+        """
+        with self._updated:
+            times = list(self._decoded_times)
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    @property
+    def latency(self):
+        """
+        直近のフレームの受信からデコード完了までの平均時間[秒]。
+        """
+        with self._updated:
+            latencies = list(self._latencies)
+        return sum(latencies) / len(latencies) if latencies else None
+
+    def age(self):
+        """
+        最新のフレームを受信してからの経過時間[秒]。
+        """
+        timestamp = self._timestamp
+        return None if timestamp is None else time.time() - timestamp
+
+    def stats(self):
+        latency = self.latency
+        age = self.age()
+        return {
+            "packets": self.packets,
+            "frames": self.frames,
+            "decoded": self.decoded,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "fps": self.fps,
+            "latency_ms": None if latency is None else latency * 1000,
+            "age_ms": None if age is None else age * 1000,
+        }
+
+    def print_stats(self):
+        s = self.stats()
+        latency = "-" if s["latency_ms"] is None else f"{s['latency_ms']:.1f}ms"
+        age = "-" if s["age_ms"] is None else f"{s['age_ms']:.0f}ms"
+        print(f"[VIDEO] 受信 {s['packets']} / デコード {s['decoded']} / 届けた {s['frames']} フレーム / "
+              f"破棄 {s['dropped']} / エラー {s['errors']} / {s['fps']:.1f}fps / 遅延 {latency} / 最新フレームの経過 {age}")
+
+    def close(self):
+        self._running = False
+        self.sock.close()
+        with self._arrived:
+            self._arrived.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class _H264Decoder:
+    """
+    H.264 のバイトストリームを PyAV でデコードします。
+
+    バックログが max_backlog より古くなったときは、次のキーフレームまでのデータを捨てて最新に追いつきます。
+    複数のフレームがまとめて届いたときは全てデコードし（参照フレームが必要なため）、
+    BGR への変換は届ける番の最後の1枚だけ行います。decode="keyframes" ではキーフレーム以外の
+    パケットをデコーダに渡しません（キーフレームは他のフレームを参照しないので単独でデコードできる）。
+    """
+
+    def __init__(self, receiver):
+        try:
+            import av
+        except ImportError:
+            raise RuntimeError("H.264 の映像のデコードには PyAV が必要です: pip install av")
+        self.receiver = receiver
+        self._codec = av.CodecContext.create("h264", "r")
+        self._codec.thread_type = "AUTO"
+        self._skipping = False
+        self._keyframes = receiver.decode == "keyframes"
+
+    def decode(self, chunks):
+        receiver = self.receiver
+        if chunks[-1][0] - chunks[0][0] > receiver.max_backlog:
+            self._skipping = True
+        latest = None
+        for timestamp, data in chunks:
+            for packet in self._codec.parse(data):
+                if self._skipping or self._keyframes:
+                    if not packet.is_keyframe:
+                        receiver.dropped += 1
+                        continue
+                    self._skipping = False
+                for frame in self._codec.decode(packet):
+                    receiver.decoded += 1
+                    if receiver.decoded % receiver.every:
+                        receiver.dropped += 1
+                        continue
+                    if latest is not None:
+                        receiver.dropped += 1
+                    latest = (frame, timestamp)
+        if latest is not None:
+            frame, timestamp = latest
+            receiver._publish(self._to_bgr(frame), timestamp)
+
+    def _to_bgr(self, frame):
+        # YUV のまま縮めてから（画素数が 1/reduce² になる）、使い回す配列に BGR で書き込む
+        reduce = self.receiver.reduce
+        width = frame.width // reduce - frame.width // reduce % 2
+        height = frame.height // reduce - frame.height // reduce % 2
+        if (width, height) != (frame.width, frame.height) or frame.format.name not in ("yuv420p", "yuvj420p"):
+            frame = frame.reformat(width=width, height=height, format="yuv420p")
+        buffer = self.receiver._buffer((height, width, 3))
+        return cv2.cvtColor(frame.to_ndarray(), cv2.COLOR_YUV2BGR_I420, dst=buffer)
+
+
+_receiver = None
+_receiver_lock = threading.Lock()
+
+
+def get_video_receiver(port=TELLO_VIDEO_PORT, **options):
+    """
+    プロセス内で共有する VideoReceiver を返します（初回呼び出し時に起動）。
+
+    options（VideoReceiver の引数）は最初に作るときだけ使います。すでにある受信機と違うポートや
+    デコードの設定（codec, max_backlog, decode, every, reduce, buffers）を指定すると ValueError を送出します
+    （verbose はログの設定なので比べない）。別の設定で受信したい場合は VideoReceiver を直接作ってください。
+    """
+    global _receiver
+    with _receiver_lock:
+        if _receiver is None:
+            _receiver = VideoReceiver(port, **options)
+            return _receiver
+        receiver = _receiver
+    inspect.signature(VideoReceiver).bind(port, **options)  # 知らない引数は作るときと同じく TypeError にする
+    wanted = dict(options, port=port)
+    wanted.pop("verbose", None)
+    conflicts = {name: value for name, value in wanted.items() if getattr(receiver, name) != value}
+    if conflicts:
+        current = ", ".join(f"{name}={getattr(receiver, name)!r}" for name in conflicts)
+        raise ValueError(f"共有の VideoReceiver はすでに {current} で作られています"
+                         f"（指定: {', '.join(f'{k}={v!r}' for k, v in conflicts.items())}）")
+    return receiver
+
+
+# ベンチマークで比べるデコードの設定 (decode, every, reduce, buffers)
+BENCH_MODES = (
+    ("all", 1, 1, 0),
+    ("all", 1, 1, 2),
+    ("all", 1, 2, 2),
+    ("all", 1, 4, 2),
+    ("all", 10, 1, 2),
+    ("keyframes", 1, 1, 2),
+    ("keyframes", 1, 4, 2),
+)
+BENCH_FRAMES = "0619/mitome/panorama"
+BENCH_SIZE = (960, 720)
+BENCH_VIEWS = 120
+
+
+def _prepare_frames(frames_dir, workdir, size, views=BENCH_VIEWS):
+    # 1つの高さの画像を横につないで1周の帯にし、少しずつずらして切り出した views 枚を実機の大きさで書き出す。
+    # 静止画をそのまま流すと H.264 の差分がほぼ空になり、デコードが実機よりずっと軽く見えるため
+    from .sim import load_frame_sets
+
+    sets = load_frame_sets(frames_dir)
+    jpegs = sets[sorted(sets, key=lambda k: (k is not None, k))[-1]]
+    width, height = size
+    strip_height = height // 2
+    images = [cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR) for jpeg in jpegs]
+    images = [cv2.resize(image, (image.shape[1] * strip_height // image.shape[0], strip_height))
+              for image in images]
+    strip = np.hstack(images)
+    window = width * strip_height // height
+    strip = np.hstack([strip, strip[:, :window]])
+    for i in range(views):
+        x = i * (strip.shape[1] - window) // views
+        cv2.imwrite(os.path.join(workdir, f"view_{i:03d}.jpg"), cv2.resize(strip[:, x:x + window], size))
+
+
+def benchmark(codec="h264", seconds=5.0, frames_dir=BENCH_FRAMES, size=BENCH_SIZE, modes=BENCH_MODES,
+              port=TELLO_VIDEO_PORT):
+    """
+    シミュレータの映像をデコードの設定ごとに seconds 秒ずつ受信し、CPU 使用率と遅延を測ります。
+
+    シミュレータ（映像のエンコード）は別のプロセスで動かし、このプロセスの CPU 時間
+    （受信スレッドと、FFmpeg の内部のスレッドも含むデコード）だけを数えます。
+    機体は離陸させて回し続け、映像が毎フレーム動くようにします。
+
+    Returns:
+        list: 設定ごとの辞書（"mode", "size", "decoded_fps", "fps", "cpu_percent", "latency_ms"）。
+    """
+    from .client import TelloClient
+
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    if not os.path.isabs(frames_dir):
+        frames_dir = os.path.join(root, frames_dir)
+    workdir = tempfile.mkdtemp(prefix="video-bench-")
+    results = []
+    sim = None
+    client = None
+    try:
+        _prepare_frames(frames_dir, workdir, size)
+        env = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        sim = subprocess.Popen([sys.executable, "-m", "tellolib.sim", "--frames", workdir, "--codec", codec,
+                                "--quiet"], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        client = TelloClient("127.0.0.1", verbose=False)
+        for _ in range(50):
+            if client.send("command", timeout=0.1, retries=0) == "ok":
+                break
+        else:
+            raise RuntimeError("シミュレータが起動しませんでした")
+        for command in ("takeoff", "streamon", "rc 0 0 0 50"):
+            client.send(command)
+        for decode, every, reduce, buffers in modes:
+            receiver = VideoReceiver(port, codec=codec, decode=decode, every=every, reduce=reduce,
+                                     buffers=buffers, verbose=False)
+            try:
+                # 最初のキーフレームが届くまでの待ちは数えない
+                receiver.wait_for_frame(timeout=5.0)
+                started, cpu = time.time(), time.process_time()
+                decoded, frames = receiver.decoded, receiver.frames
+                time.sleep(seconds)
+                elapsed = time.time() - started
+                cpu = time.process_time() - cpu
+                latency = receiver.latency
+                frame = receiver.frame
+                results.append({
+                    "mode": f"{decode} every={every} reduce=1/{reduce} buffers={buffers}",
+                    "size": None if frame is None else f"{frame.shape[1]}x{frame.shape[0]}",
+                    "decoded_fps": (receiver.decoded - decoded) / elapsed,
+                    "fps": (receiver.frames - frames) / elapsed,
+                    "cpu_percent": cpu / elapsed * 100,
+                    "latency_ms": None if latency is None else latency * 1000,
+                })
+            finally:
+                receiver.close()
+                for thread in receiver._threads:
+                    thread.join()
+        client.send("rc 0 0 0 0")
+        client.send("land")
+    finally:
+        if client is not None:
+            client.close()
+        if sim is not None:
+            sim.terminate()
+            sim.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def print_benchmark(results):
+    print(f"{'設定':<42} {'大きさ':>8} {'デコード':>9} {'届けた':>8} {'CPU':>6} {'遅延':>8}")
+    for r in results:
+        latency = "-" if r["latency_ms"] is None else f"{r['latency_ms']:.1f}ms"
+        print(f"{r['mode']:<42} {r['size'] or '-':>9} {r['decoded_fps']:6.1f}fps {r['fps']:6.1f}fps "
+              f"{r['cpu_percent']:5.1f}% {latency:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="映像のデコードの設定ごとの CPU 使用率と遅延をシミュレータで測る")
+    parser.add_argument("--codec", choices=["h264", "mjpeg"], default="h264")
+    parser.add_argument("--seconds", type=float, default=5.0, help="設定ごとの計測時間")
+    parser.add_argument("--frames", default=BENCH_FRAMES, help="シミュレータが流すJPEGのフォルダ")
+    parser.add_argument("--port", type=int, default=TELLO_VIDEO_PORT)
+    args = parser.parse_args()
+    print_benchmark(benchmark(args.codec, args.seconds, args.frames, port=args.port))
+
+
+if __name__ == "__main__":
+    main()
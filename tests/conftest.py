@@ -0,0 +1,17 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from tellolib.sim import TelloSimulator  # noqa: E402
+
+
+@pytest.fixture
+def sim():
+    # 空いているポートで待ち受ける高速なシミュレータ（状態パケットは使わない）
+    with TelloSimulator(port=0, state_port=9, latency=0.0, time_scale=0.001, verbose=False) as simulator:
+        simulator.port = simulator.sock.getsockname()[1]
+        yield simulator
@@ -0,0 +1,56 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from tellolib.glyphs import FONT, compile_text, layout, order_strokes, plan_text
+from tellolib.planner import trace
+
+
+def test_layout_height():
+    points, offsets = layout("HEL", height=60)
+    assert points[:, 1].min() == 0 and points[:, 1].max() == 60
+    assert offsets[0] == 0 and offsets[-1] == len(points)
+    assert len(offsets) - 1 == sum(len(FONT[c]) for c in "HEL")
+
+
+@pytest.mark.parametrize("box", [(300, 200), (100, 100), (1000, 30)])
+def test_layout_fits_box(box):
+    points, _ = layout("HELLO", box=box)
+    width, height = np.ptp(points, axis=0)
+    assert width <= box[0] + 1e-9 and height <= box[1] + 1e-9
+    # 幅か高さのどちらかは枠いっぱいになる
+    assert max(width / box[0], height / box[1]) == pytest.approx(1.0)
+
+
+def test_layout_limits():
+    points, offsets = layout("")
+    assert points.shape == (0, 2) and list(offsets) == [0]
+    assert len(layout("hel")[0]) == len(layout("HEL")[0])
+    with pytest.raises(ValueError, match="フォントにない文字"):
+        layout("H!")
+    with pytest.raises(ValueError, match="高さ"):
+        plan_text("HEL", height=30)
+    with pytest.raises(ValueError):
+        plan_text("HEL", box=(100, 100))
+
+
+def test_every_glyph_pair_fits_default_height():
+    for pair in itertools.product(FONT, repeat=2):
+        plan_text("".join(pair))
+
+
+def test_order_strokes_visits_each_stroke_once():
+    points, offsets = layout("HELLO WORLD")
+    order = order_strokes(points, offsets)
+    assert sorted(stroke for stroke, _ in order) == list(range(len(offsets) - 1))
+    assert order_strokes(np.zeros((0, 2)), np.zeros(1, dtype=np.int64)) == []
+
+
+def test_compile_text_ends_where_the_path_ends():
+    path, stats = plan_text("HEL")
+    commands, _ = compile_text("HEL")
+    assert all(c.startswith("go ") for c in commands)
+    end = trace(commands)[0][-1][-1]
+    assert end == pytest.approx(path[-1][-1], abs=1.0)
+    assert stats["strokes"] == 6 and stats["transits"] == 5
@@ -0,0 +1,85 @@
+import glob
+import os
+
+import pytest
+
+from conftest import ROOT
+from tellolib.mission import Mission, MissionError, evaluate, load_mission
+
+
+def problems(data):
+    with pytest.raises(MissionError) as info:
+        Mission(data)
+    return [message for _, message in info.value.problems]
+
+
+def test_evaluate():
+    assert evaluate(100, {}) == 100
+    assert evaluate("side / 2", {"side": 100}) == 50
+    assert evaluate("-(a + b) * 3 % 7", {"a": 1, "b": 2}) == -9 % 7
+    with pytest.raises(ValueError):
+        evaluate("missing + 1", {})
+    with pytest.raises(ValueError):
+        evaluate("__import__('os')", {})
+    with pytest.raises(ValueError):
+        evaluate("1 +", {})
+    with pytest.raises(ValueError):
+        evaluate(True, {})
+
+
+def test_expands_loops_and_params():
+    mission = Mission({"params": {"n": 3, "side": 60}, "steps": [
+        "takeoff",
+        {"repeat": "n", "var": "k", "steps": [{"forward": "side + k * 10"}, "cw {side}"]},
+        "land",
+    ]})
+    assert mission.commands == ["takeoff", "forward 60", "cw 60", "forward 70", "cw 60", "forward 80", "cw 60",
+                                "land"]
+    estimate = mission.estimate()
+    assert estimate.commands == 8
+    assert 0 < estimate.flight_time <= estimate.total_time
+    assert estimate.battery > 0
+
+
+def test_reports_every_problem_at_once():
+    messages = problems({"steps": [
+        {"forward": 50},                   # 離陸前
+        "takeoff",
+        {"forward": 10},                   # 範囲外
+        {"go": [10, 10, 0, 50]},           # go の下限
+        {"jump": 1},                       # 知らないコマンド
+        {"cw": "360 / n"},                 # params にない名前
+        {"capture": "a.jpg"},              # streamon の前
+    ], "params": {}})
+    assert len(messages) == 7
+    assert any("離陸前" in m for m in messages)
+    assert any("範囲" in m for m in messages)
+    assert any("go" in m for m in messages)
+    assert any("知らないコマンド" in m for m in messages)
+    assert any("streamon" in m for m in messages)
+    assert any("land" in m for m in messages)
+
+
+def test_arithmetic_errors_are_problems():
+    messages = problems({"params": {"n": 0}, "steps": ["takeoff", {"cw": "360 / n"}, "land"]})
+    assert len(messages) == 1
+
+
+def test_requires_steps():
+    assert problems({"name": "x"}) == ['"steps" のリストがありません']
+
+
+def test_optimize_keeps_non_move_steps():
+    mission = Mission({"optimize": True, "steps": [
+        "streamon", "takeoff", {"forward": 50}, {"forward": 50}, {"capture": "a.jpg"}, {"cw": 90}, "land",
+    ]})
+    # 撮影の前後で区切ってまとめ、着陸の直前の回転は要らないので落とす
+    assert [(step.kind, step.value) for step in mission.steps] == [
+        ("command", "streamon"), ("command", "takeoff"), ("command", "go 100 0 0 50"), ("capture", "a.jpg"),
+        ("command", "land")]
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(ROOT, "missions", "*.json"))))
+def test_bundled_missions_are_valid(path):
+    mission = load_mission(path)
+    assert mission.commands[-1] in ("land", "streamoff")
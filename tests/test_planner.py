@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from conftest import ROOT
+from tellolib.planner import compile_path, extract_commands, optimize_commands, trace
+from tellolib.protocol import MOVE_COMMANDS, ROTATE_COMMANDS, command_type
+
+
+def flight(commands):
+    return [c for c in commands if command_type(c) in MOVE_COMMANDS | ROTATE_COMMANDS | {"go", "curve"}]
+
+
+def end_pose(commands):
+    path, yaw = trace(flight(commands))
+    return path[-1][-1], yaw % 360
+
+
+def load(script):
+    with open(os.path.join(ROOT, script), encoding="utf-8") as f:
+        return extract_commands(f.read())
+
+
+def test_hel_drops_from_35_to_21_flight_commands():
+    commands = load("0612/kitano/HEL.py")
+    optimized = optimize_commands(commands)
+    assert len(flight(commands)) == 35
+    assert len(flight(optimized)) == 21
+    # takeoff や land などはそのままの順に残る
+    assert [c for c in optimized if c not in flight(optimized)] == ["command", "takeoff", "land"]
+
+
+@pytest.mark.parametrize("script", ["0612/kitano/HEL.py", "0612/kitano/L.py", "0612/mitome/U.py", "0612/mitome/ULL.py"])
+def test_optimize_keeps_end_pose(script):
+    # 着陸の直前は向きを戻さないので、向きまで比べるときは land を除く
+    commands = [c for c in load(script) if c != "land"]
+    (before, yaw_before), (after, yaw_after) = end_pose(commands), end_pose(optimize_commands(commands))
+    assert after == pytest.approx(before, abs=1.0)
+    assert yaw_after == pytest.approx(yaw_before, abs=1.0)
+
+
+def test_optimize_skips_heading_before_land():
+    commands = ["takeoff", "forward 50", "cw 90", "forward 50", "land"]
+    optimized = optimize_commands(commands)
+    assert end_pose(optimized)[0] == pytest.approx(end_pose(commands)[0], abs=1.0)
+    assert not any(command_type(c) in ROTATE_COMMANDS for c in optimized)
+
+
+def test_optimize_merges_collinear_moves():
+    commands = ["takeoff", "forward 50", "forward 50", "cw 90", "forward 30", "ccw 90", "land"]
+    optimized = optimize_commands(commands)
+    assert optimized[0] == "takeoff" and optimized[-1] == "land"
+    assert end_pose(optimized)[0] == pytest.approx(end_pose(commands)[0], abs=1.0)
+    assert len(flight(optimized)) < len(flight(commands))
+
+
+def test_compile_path_rejects_short_residual():
+    with pytest.raises(ValueError):
+        compile_path([("line", (10.0, 5.0, 0.0))])
@@ -0,0 +1,63 @@
+import itertools
+import json
+
+import pytest
+
+from tellolib.scheduler import CaptureScheduler, CaptureSet, EnergyModel
+
+HEIGHTS = (400, 200, 500, 300)
+
+
+@pytest.fixture
+def scheduler():
+    return CaptureScheduler(EnergyModel(), reserve=20, verbose=False)
+
+
+def sets(**priorities):
+    return [CaptureSet(f"{h}cm", h, priority=priorities.get(f"h{h}", 0)) for h in HEIGHTS]
+
+
+def test_order_from_below_is_ascending(scheduler):
+    assert [s.height for s in scheduler.order(sets(), 100)] == [200, 300, 400, 500]
+    assert [s.height for s in scheduler.order(sets(), 600)] == [500, 400, 300, 200]
+
+
+@pytest.mark.parametrize("start", [100, 250, 350, 450, 600])
+def test_order_is_the_shortest(scheduler, start):
+    ordered = scheduler.order(sets(), start)
+    best = min(scheduler.cost(list(p), start) for p in itertools.permutations(sets()))
+    assert scheduler.cost(ordered, start) == pytest.approx(best)
+
+
+def test_plan_fits_battery(scheduler):
+    full = scheduler.plan(sets(), 100, takeoff=True)
+    assert [s.height for s in full.sets] == [200, 300, 400, 500] and not full.skipped
+
+    partial = scheduler.plan(sets(), 30, takeoff=True)
+    assert partial.battery <= 30 - scheduler.reserve
+    # 今の高さから遠い組から外す
+    assert [s.height for s in partial.skipped] == [500, 400]
+    assert [s.height for s in partial.sets] == [200, 300]
+
+    empty = scheduler.plan(sets(), scheduler.reserve, takeoff=True)
+    assert empty.sets == [] and len(empty.skipped) == len(HEIGHTS)
+
+
+def test_plan_drops_low_priority_first(scheduler):
+    partial = scheduler.plan(sets(h500=1, h400=1), 30, takeoff=True)
+    assert {s.height for s in partial.sets} == {400, 500}
+
+
+def test_run_saves_progress_and_resumes(scheduler, tmp_path):
+    progress = tmp_path / "progress.json"
+    battery = iter([26, 19])
+    taken = []
+    done, pending = scheduler.run(sets(), taken.append, lambda: next(battery), lambda: 100, str(progress))
+    assert done == [s.label for s in taken] and pending
+    assert json.loads(progress.read_text(encoding="utf-8"))["done"] == done
+
+    # 次の飛行では撮り終えた組を除いて続きから撮る
+    assert [s.label for s in scheduler.pending(sets(), str(progress))] == [s.label for s in pending]
+    done, pending = scheduler.run(sets(), taken.append, lambda: 100, lambda: 100, str(progress))
+    assert not pending and sorted(done) == sorted(s.label for s in sets())
+    assert not progress.exists()
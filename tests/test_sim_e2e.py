@@ -0,0 +1,86 @@
+"""
+シミュレータに UDP で接続して、クライアント・MissionRunner・Swarm を通しで動かすテスト。
+"""
+import asyncio
+import os
+
+import pytest
+
+from conftest import ROOT
+from tellolib.client import TelloClient, close_all
+from tellolib.mission import Mission, MissionRunner, load_mission
+from tellolib.swarm import SIM_FRAMES, Swarm, _start_simulators, split_text
+from tellolib.tello import TelloError
+
+
+@pytest.fixture
+def client(sim):
+    client = TelloClient("127.0.0.1", sim.port, verbose=False)
+    yield client
+    client.close()
+
+
+def test_client_round_trip(sim, client):
+    assert client.send("command") == "ok"
+    assert client.send("battery?") == "100"
+    assert client.send("forward 50") == "error"      # 離陸前
+    assert client.send("takeoff") == "ok"
+    assert client.send("go 15 15 0 50") == "error"   # どの軸も 20cm に届かない
+    assert client.send("go 25 15 0 50") == "ok"
+    assert client.send("land") == "ok"
+    assert [r.response for r in client.records] == ["ok", "100", "error", "ok", "error", "ok", "ok"]
+    summary = client.summary()
+    assert summary["go"]["count"] == 2 and summary["takeoff"]["timeouts"] == 0
+    assert sim.commands == 7 and sim.errors == 2
+
+
+def test_mission_runner(sim, client):
+    runner = MissionRunner(client=client, verbose=False)
+    mission = load_mission(os.path.join(ROOT, "missions", "hishigata.json"))
+    elapsed, sent = runner.run(mission)
+    runner.close()
+    assert sent == len(mission.commands) and elapsed > 0
+    assert not sim.flying
+    # 菱形は元の位置と向きに戻る
+    assert (sim.x, sim.y) == pytest.approx((0.0, 0.0), abs=1.0)
+    assert sim.yaw % 360 == pytest.approx(0.0, abs=1.0)
+
+
+def test_mission_runner_lands_on_failure(sim, client):
+    # 2つ目の移動をシミュレータに error で返させる
+    handle = sim.handle
+    sim.handle = lambda command: "error" if command == "back 50" else handle(command)
+    runner = MissionRunner(client=client, verbose=False)
+    mission = Mission({"steps": ["takeoff", {"forward": 50}, {"back": 50}, {"up": 50}, "land"]})
+    with pytest.raises(TelloError, match="back 50"):
+        runner.run(mission)
+    assert not sim.flying
+    assert [r.command for r in client.records][-2:] == ["back 50", "land"]
+
+
+def test_mission_runner_refuses_low_battery(sim, client):
+    sim.battery = 10
+    runner = MissionRunner(client=client, verbose=False)
+    with pytest.raises(TelloError, match="電池"):
+        runner.run(load_mission(os.path.join(ROOT, "missions", "hishigata.json")))
+    assert "takeoff" not in [r.command for r in client.records]
+
+
+def test_swarm_draws_text():
+    missions, _, _ = split_text("HI", 2)
+    sims, drones = _start_simulators(2, 0.001, SIM_FRAMES)
+    for s in sims:
+        s.latency = 0.0
+    swarm = Swarm(drones, verbose=False)
+    try:
+        results = asyncio.run(swarm.run(missions))
+    finally:
+        swarm.close()
+        for s in sims:
+            s.stop()
+        close_all()
+    assert [r.error for r in results] == [None, None]
+    assert [r.commands for r in results] == [len(m.commands) for m in missions]
+    assert not any(s.flying for s in sims)
+    # 各機体がそれぞれのミッションのコマンドを受け取った（"command" と "battery?" を含む）
+    assert [s.commands for s in sims] == [len(m.commands) + 2 for m in missions]
@@ -0,0 +1,39 @@
+import pytest
+
+from tellolib.swarm import MOVE_MAX_CM, _moves, split_heights, split_text
+
+
+@pytest.mark.parametrize("delta", [20, 35, 100, 499, 500, 510, 515, 519, 520, 1000, 1015, 1234])
+@pytest.mark.parametrize("sign", [1, -1])
+def test_moves_add_up(delta, sign):
+    steps = _moves(sign * delta)
+    direction = "up" if sign > 0 else "down"
+    amounts = [step[direction] for step in steps]
+    assert all(list(step) == [direction] for step in steps)
+    assert sum(amounts) == delta
+    assert all(20 <= amount <= MOVE_MAX_CM for amount in amounts)
+
+
+@pytest.mark.parametrize("delta", [0, 5, 19, -19])
+def test_moves_ignore_small_differences(delta):
+    assert _moves(delta) == []
+
+
+def test_split_heights():
+    missions = split_heights([500, 200, 300, 400], 3, shots=4)
+    assert len(missions) == 3
+    # 低い順に配り、余った高さは先頭の機体が回る
+    assert missions[0].name == "パノラマ 200cm, 500cm"
+    captures = [step.value for step in missions[0].steps if step.kind == "capture"]
+    assert captures[0] == "200cm/panorama_image_00.jpg" and len(captures) == 8
+
+
+def test_split_text():
+    missions, placements, shifts = split_text("HEL", 2)
+    assert [m.name for m in missions] == ["'HE'", "'L'"]
+    assert len(placements) == 2 and shifts[0] == 0.0 and shifts[1] > 0
+    assert all(m.commands[0] == "takeoff" and m.commands[-1] == "land" for m in missions)
+    with pytest.raises(ValueError):
+        split_text("", 2)
+    with pytest.raises(ValueError):
+        split_text("HEL", 0)
@@ -0,0 +1,80 @@
+import socket
+import time
+
+import numpy as np
+import pytest
+
+from tellolib.state import StateListener
+from tellolib.telemetry import TelemetryLog, TelemetryRecorder
+
+
+@pytest.fixture(scope="module")
+def listener():
+    # 空いているポートで待ち受ける（共有の 8890 番は使わない）
+    return StateListener(port=0)
+
+
+def states(count):
+    for i in range(count):
+        state = {"pitch": i % 3 - 1, "roll": 0, "yaw": 170 + 5 * i, "h": 100 + i, "bat": 90, "baro": 12.5 + i / 4}
+        if i % 4 == 3:
+            del state["h"]  # 受信しなかった項目は NaN になる
+        yield 1000.0 + 0.1 * i, state
+
+
+def record(path, listener, count=10):
+    # chunk を小さくして、配列が埋まるたびの書き出しも通す
+    with TelemetryRecorder(str(path), listener=listener, chunk=4, verbose=False) as recorder:
+        for timestamp, state in states(count):
+            recorder.record(timestamp, state)
+        recorder.mark("capture", 1000.25)
+    return TelemetryLog(str(path))
+
+
+def test_record_and_read(tmp_path, listener):
+    log = record(tmp_path / "a.tlm", listener)
+    assert len(log) == 10
+    np.testing.assert_allclose(log.t, 1000.0 + 0.1 * np.arange(10))
+    for i, (_, state) in enumerate(states(10)):
+        assert log.state(i) == state
+    assert log.events == [(1000.25, "capture")]
+    # yaw は 180 をまたいでも近い方へ補間する
+    assert log.interpolate("yaw", [1000.15])[0] == pytest.approx(177.5)
+    assert log.interpolate("yaw", [1000.25])[0] == pytest.approx(-177.5)
+
+
+def test_replay_round_trip(tmp_path, listener):
+    log = record(tmp_path / "a.tlm", listener)
+    replay = log.listener(speed=0, start=False)
+    with TelemetryRecorder(str(tmp_path / "b.tlm"), listener=replay, chunk=4, verbose=False):
+        replay.start()
+        assert replay.finished.wait(5)
+    copy = TelemetryLog(str(tmp_path / "b.tlm"))
+    assert len(copy) == len(log) and replay.packets == len(log)
+    np.testing.assert_array_equal(copy.t, log.t)
+    for name in log.fields:
+        np.testing.assert_array_equal(copy[name], log[name])
+    # 閉じたレコーダーは再生から外れている
+    assert replay._callbacks == []
+
+
+def test_records_udp_packets(tmp_path, listener):
+    port = listener.sock.getsockname()[1]
+    with TelemetryRecorder(str(tmp_path / "udp.tlm"), listener=listener, verbose=False) as recorder, \
+            socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+        for h in (10, 20, 30):
+            sender.sendto(f"pitch:0;roll:0;yaw:10;h:{h};bat:80;".encode("ascii"), ("127.0.0.1", port))
+            time.sleep(0.05)
+        deadline = time.time() + 2
+        while recorder.count + recorder._rows < 3 and time.time() < deadline:
+            listener.wait_for_update(0.1)
+    log = TelemetryLog(str(tmp_path / "udp.tlm"))
+    assert list(log["h"]) == [10, 20, 30]
+    assert log.state(0)["bat"] == 80
+
+
+def test_empty_log(tmp_path, listener):
+    TelemetryRecorder(str(tmp_path / "empty.tlm"), listener=listener, verbose=False).close()
+    log = TelemetryLog(str(tmp_path / "empty.tlm"))
+    assert len(log) == 0 and log.duration == 0.0
+    assert np.isnan(log.interpolate("h", [1.0, 2.0])).all()